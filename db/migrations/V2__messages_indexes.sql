@@ -0,0 +1,4 @@
+-- Índices para el planificador de mensajes no atendidos:
+-- ventana reciente por timestamp y último mensaje por cliente.
+CREATE INDEX IF NOT EXISTS idx_messages_timestamp ON messages ("timestamp");
+CREATE INDEX IF NOT EXISTS idx_messages_client_ts ON messages (client_id, "timestamp" DESC);
@@ -0,0 +1,24 @@
+-- Cola de salida persistente: la IA y la API encolan y vuelven, los sender workers
+-- envían con reintentos y límite de ritmo por dispositivo (from_jid).
+CREATE TABLE IF NOT EXISTS outbox (
+  id              BIGSERIAL PRIMARY KEY,
+  from_jid        TEXT NOT NULL,
+  to_phone        TEXT NOT NULL,
+  kind            TEXT NOT NULL CHECK (kind IN ('text','file')),
+  text            TEXT,
+  file_path       TEXT,
+  status          TEXT NOT NULL DEFAULT 'pending' CHECK (status IN ('pending','sending','sent','failed')),
+  attempts        INTEGER NOT NULL DEFAULT 0,
+  next_attempt_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  locked_until    TIMESTAMPTZ,
+  last_error      TEXT,
+  created_at      TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  sent_at         TIMESTAMPTZ
+);
+
+-- Filas vivas listas para reclamar (FOR UPDATE SKIP LOCKED) por orden de llegada.
+CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (next_attempt_at, id)
+  WHERE status IN ('pending','sending');
+-- Orden por destinatario: no se reclama un mensaje si hay uno anterior vivo al mismo chat.
+CREATE INDEX IF NOT EXISTS idx_outbox_recipient ON outbox (from_jid, to_phone, id)
+  WHERE status IN ('pending','sending');
@@ -0,0 +1,4 @@
+-- Envíos masivos: las filas de un mismo POST /messages/batch comparten batch_id
+-- para consultar el estado por destinatario.
+ALTER TABLE outbox ADD COLUMN IF NOT EXISTS batch_id TEXT;
+CREATE INDEX IF NOT EXISTS idx_outbox_batch ON outbox (batch_id, id) WHERE batch_id IS NOT NULL;
@@ -0,0 +1,20 @@
+-- Pedido en curso por cliente: se actualiza en cada extracción y "Es correcto"
+-- lo confirma sin volver a recorrer el historial.
+CREATE TABLE IF NOT EXISTS order_drafts (
+  client_id   INTEGER PRIMARY KEY,
+  items       JSONB NOT NULL DEFAULT '[]',
+  version     INTEGER NOT NULL DEFAULT 1,
+  image_hash  TEXT,
+  updated_at  TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- Líneas de los pedidos confirmados (modelo Order).
+CREATE TABLE IF NOT EXISTS orders (
+  "Id"             BIGSERIAL PRIMARY KEY,
+  "CodigoEmpresa"  INTEGER NOT NULL,
+  "CodigoCliente"  INTEGER NOT NULL,
+  "CodigoArticulo" TEXT NOT NULL,
+  units            INTEGER NOT NULL CHECK (units > 0),
+  "timestamp"      TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+CREATE INDEX IF NOT EXISTS idx_orders_cliente_ts ON orders ("CodigoCliente", "timestamp" DESC);
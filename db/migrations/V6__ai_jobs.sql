@@ -0,0 +1,19 @@
+-- Turnos de IA pendientes, uno por conversación (cliente). Los reclaman los workers de
+-- cualquier proceso con FOR UPDATE SKIP LOCKED; un lease caducado se vuelve a reclamar.
+CREATE TABLE IF NOT EXISTS ai_jobs (
+  client_id     INTEGER PRIMARY KEY,
+  message_ts    TIMESTAMPTZ NOT NULL,
+  due_at        TIMESTAMPTZ NOT NULL,
+  status        TEXT NOT NULL DEFAULT 'pending'
+                CHECK (status IN ('pending', 'running', 'done', 'failed')),
+  attempts      INTEGER NOT NULL DEFAULT 0,
+  enqueued_by   TEXT,
+  locked_by     TEXT,
+  locked_until  TIMESTAMPTZ,
+  last_error    TEXT,
+  created_at    TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  updated_at    TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_ai_jobs_due ON ai_jobs (due_at)
+  WHERE status IN ('pending', 'running');
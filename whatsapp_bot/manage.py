@@ -1,21 +1,17 @@
 # manage.py (fragmentos clave)
+import csv
+import json
 import threading
+import logging
 import os
+import time
 from dotenv import load_dotenv
 from src.config.logging_setup import setup_logging
 from src.cli.parser import build_parser
-from src.grpc.client import create_grpc_stub
-from src.whatsapp.stream import stream_messages
-from src.ai.agent import process_unattended_messages_loop
-from src.grpc.handlers import (
-    login,
-    login_and_send_qr,
-    list_devices,
-    send_message,
-    send_file,
-    delete_device,
-    login_and_send_qr_to_all_admins,
-)
+
+# Los módulos pesados (agente, gRPC, outbox, caché LLM) se importan dentro de las
+# funciones: los workers "spawn" de MediaExtractor reimportan este fichero como
+# __mp_main__ y solo deben cargar lo que necesita la extracción.
 
 def _start_api_server_in_thread():
     import uvicorn
@@ -32,6 +28,61 @@ def _start_api_server_in_thread():
     return t
 
 
+def warm_thumbs():
+    from src.core.catalog import product_catalog
+    from src.media.thumbs import warm_thumbnail_cache
+
+    if not product_catalog.ensure_loaded():
+        logging.error("Could not load product catalog")
+        return
+    codes = [art.codigo.strip() for art in product_catalog.state.values()]
+    warm_thumbnail_cache(codes)
+
+
+def send_batch(stub, path: str, from_jid: str, text=None, follow: bool = True):
+    """
+    Encola un envío masivo desde fichero. Lo entregan los sender workers del
+    proceso `start`/`listen`; con follow se imprime el estado en NDJSON.
+    """
+    from src.grpc.devices import device_registry
+    from src.whatsapp.outbox import BatchTracker, queue_batch
+
+    items = []
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.reader(f):
+            if not row or not row[0].strip() or row[0].startswith("#"):
+                continue
+            msg_text = row[1].strip() if len(row) > 1 and row[1].strip() else text
+            if not msg_text:
+                logging.error(f"No text for recipient {row[0].strip()} (use --text)")
+                return
+            items.append((row[0].strip(), msg_text))
+
+    if not device_registry.is_connected(stub, from_jid):
+        logging.error(f"from_jid {from_jid} not found in connected devices")
+        return
+
+    try:
+        job_id, ids = queue_batch(from_jid, items)
+    except ValueError as e:
+        logging.error(f"Invalid batch: {e}")
+        return
+    logging.info(f"Batch {job_id} queued with {len(ids)} messages")
+    if not follow:
+        print(job_id)
+        return
+
+    tracker = BatchTracker(job_id)
+    while True:
+        changes, summary = tracker.poll()
+        for line in changes:
+            print(json.dumps(line), flush=True)
+        if summary["done"]:
+            print(json.dumps({"summary": summary}), flush=True)
+            return
+        time.sleep(1)
+
+
 def main():
     load_dotenv()
     setup_logging()
@@ -39,6 +90,25 @@ def main():
     parser = build_parser()
     args = parser.parse_args()
 
+    if args.cmd == "warm_thumbs":
+        # No necesita gRPC: catálogo (SQL Server) + SFTP
+        warm_thumbs()
+        return
+
+    from src.grpc.client import create_grpc_stub
+    from src.whatsapp.stream import stream_messages
+    from src.ai.agent import process_unattended_messages_loop, run_ai_workers
+    from src.whatsapp.outbox import outbox_sender
+    from src.grpc.handlers import (
+        login,
+        login_and_send_qr,
+        list_devices,
+        send_message,
+        send_file,
+        delete_device,
+        login_and_send_qr_to_all_admins,
+    )
+
     grpc_host = os.getenv("GRPC_HOST", "localhost")
     grpc_port = os.getenv("GRPC_PORT", None)
     if grpc_port:
@@ -55,6 +125,7 @@ def main():
         list_devices(stub)
     elif args.cmd == "listen":
         # NO TOCAR: comportamiento original
+        outbox_sender.start(stub)
         ai_thread = threading.Thread(
             target=process_unattended_messages_loop, args=(stub,), daemon=True, name="ai-loop"
         )
@@ -64,17 +135,25 @@ def main():
         send_message(stub, args.to, args.text, from_jid=args.from_jid)
     elif args.cmd == "sendfile":
         send_file(stub, args.to, args.file, from_jid=args.from_jid)
+    elif args.cmd == "sendbatch":
+        send_batch(stub, args.file, args.from_jid, text=args.text, follow=args.follow)
+    elif args.cmd == "aiworker":
+        # Solo workers de ai_jobs: el planificador y el listener corren en `start`
+        run_ai_workers(stub)
+        threading.Event().wait()
     elif args.cmd == "delete":
         delete_device(stub, args.jid)
     elif args.cmd == "start":
         # 1) API
         _start_api_server_in_thread()
-        # 2) IA en hilo
+        # 2) sender workers de la outbox (la IA y la API solo encolan)
+        outbox_sender.start(stub)
+        # 3) IA en hilo
         ai_thread = threading.Thread(
             target=process_unattended_messages_loop, args=(stub,), daemon=True, name="ai-loop"
         )
         ai_thread.start()
-        # 3) listener (bloqueante)
+        # 4) listener (bloqueante)
         stream_messages(stub)
     else:
         parser.print_help()
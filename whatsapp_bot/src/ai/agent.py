@@ -1,14 +1,11 @@
 import logging
 import tempfile
+import threading
 import time
-from typing import List, Optional
+from typing import Dict, List, Optional
 from langchain_ollama import ChatOllama
-from langchain.schema import HumanMessage
-from sqlalchemy import and_, func
 from sqlalchemy.orm import Session
 from PIL.Image import Image
-from sqlalchemy.orm import aliased
-from sqlalchemy import select, desc
 from dotenv import load_dotenv
 import os
 from datetime import datetime, timedelta, timezone
@@ -16,18 +13,40 @@ from datetime import datetime, timedelta, timezone
 from src.ai.extractors import (
     extract_response_text,
     extract_mentioned_products,
+    extract_agent_turn,
     is_order,
     is_order_confirmation
 )
 from src.ai.utils import update_order, confirmed_order, order_to_xlsx, order_to_pdf
-from src.core.database import get_postgres_session, get_sqlserver_session
-from src.models.message import Message
+from src.core.database import postgres_session, sqlserver_session
+from src.ai.scheduler import (
+    AI_LIVE_WINDOW_SECONDS,
+    BURST_MAX_WAIT_SECONDS,
+    MAX_MINUTES,
+    MIN_MINUTES,
+    load_unattended,
+    unattended_scheduler,
+)
 from src.models.user import User
 from src.models.product import Articulo
 from src.models.client import Cliente
-from src.grpc.handlers import send_message, send_file
+from src.whatsapp.outbox import queue_message, queue_file
 from src.mail.mail_handler import notify_order_by_email
-from src.ai.pipeline import build_chat
+from src.ai.pipeline import (
+    BACKGROUND,
+    LIVE,
+    LLMDeadlineExceeded,
+    build_gated_chat,
+    llm_gateway,
+    llm_request,
+)
+from src.ai.schemas import AgentTurn, MentionedItem, MentionedItems
+from src.ai.history import HistoryEntry, conversation_history
+from src.ai.post import FastPathResult, consolidate_items, fast_classify
+from src.ai.drafts import DraftOrder, canonical_items, items_hash, order_drafts
+from src.core.catalog import product_catalog
+from src.core import metrics
+from src.ai.jobs import ai_jobs
 from src.ai.prompts import *
 from src.ai.utils import (
     update_order, confirmed_order, order_to_xlsx, order_to_pdf
@@ -35,12 +54,107 @@ from src.ai.utils import (
 import re, logging
 
 load_dotenv()
-MIN_MINUTES = int(os.getenv("UNATTENDED_MINUTES_MIN", 15))
-MAX_MINUTES = int(os.getenv("UNATTENDED_MINUTES_MAX", 30))
 
 OLLAMA_URL = os.getenv("OLLAMA_URL", None)
 
-chat = build_chat(OLLAMA_URL)
+# "multi": is_order -> mentioned_products -> chat (hasta 3 llamadas)
+# "single": una sola llamada con salida JSON restringida al esquema AgentTurn
+AI_CALL_MODE = os.getenv("AI_CALL_MODE", "multi").lower()
+
+BOT_FOOTER = "[Este mensaje fue generado automáticamente por un asistente en versión de pruebas]"
+
+ORDER_SUMMARY_TEXT = "Confirma si el pedido es correcto respondiendo con *Es correcto*.\
+        Se lo pasaremos a tu comercial que se encargará de todo o te contactará si hay alguna duda.\
+        En caso de que no sea correcto, sientete libre de repetirme el pedido o indicar unicamente las correcciones\
+        [Este mensaje fue generado automáticamente por un asistente en versión de pruebas]"
+
+# Los resúmenes salen de order_drafts; buscar el pedido en el historial solo sirve para
+# conversaciones abiertas antes de existir el store (y confirmaría resúmenes ya corregidos)
+DRAFT_HISTORY_FALLBACK = os.getenv("DRAFT_HISTORY_FALLBACK", "0") == "1"
+# Mensajes de una ráfaga que se juntan en un solo turno de IA
+AI_BURST_MAX_MESSAGES = int(os.getenv("AI_BURST_MAX_MESSAGES", "8"))
+
+chat = build_gated_chat(OLLAMA_URL)
+single_call_chat = build_gated_chat(OLLAMA_URL, format=AgentTurn.model_json_schema())
+
+_TURN_STATS = {
+    mode: {"turns": 0, "llm_calls": 0, "seconds": 0.0} for mode in ("multi", "single")
+}
+_TURN_STATS_LOCK = threading.Lock()
+
+
+def _record_turn(mode: str, llm_calls: int, seconds: float):
+    with _TURN_STATS_LOCK:
+        st = _TURN_STATS[mode]
+        st["turns"] += 1
+        st["llm_calls"] += llm_calls
+        st["seconds"] += seconds
+    logging.info(f"AI turn ({mode}): {llm_calls} LLM calls in {seconds:.2f}s")
+
+
+def ai_turn_stats() -> dict:
+    with _TURN_STATS_LOCK:
+        return {
+            mode: {
+                "turns": st["turns"],
+                "llm_calls": st["llm_calls"],
+                "avg_seconds": round(st["seconds"] / st["turns"], 3) if st["turns"] else 0.0,
+            }
+            for mode, st in _TURN_STATS.items()
+        }
+
+
+metrics.register("ai_turns", ai_turn_stats)
+
+# Vía rápida: "order_items" (pedido extraído sin LLM), "order" / "not_order"
+# (clasificado sin LLM) y "fallback" (dudoso, decide el LLM)
+_FAST_PATH_STATS = {"order_items": 0, "order": 0, "not_order": 0, "fallback": 0}
+_FAST_PATH_REASONS: dict = {}
+
+
+def _fast_path(message_text: str, history: str, draft: Optional[DraftOrder]) -> FastPathResult:
+    catalog = product_catalog.state if product_catalog.ensure_loaded() else None
+    result = fast_classify(message_text, catalog, history, draft.items if draft else None)
+    if result.is_order is None:
+        outcome = "fallback"
+    elif result.items is not None:
+        outcome = "order_items"
+    else:
+        outcome = "order" if result.is_order else "not_order"
+    with _TURN_STATS_LOCK:
+        _FAST_PATH_STATS[outcome] += 1
+        _FAST_PATH_REASONS[result.reason] = _FAST_PATH_REASONS.get(result.reason, 0) + 1
+        total = sum(_FAST_PATH_STATS.values())
+        hits = total - _FAST_PATH_STATS["fallback"]
+    logging.info(f"Fast path: {outcome} ({result.reason}); hit rate {hits}/{total} = {hits / total:.0%}")
+    return result
+
+
+def fast_path_stats() -> dict:
+    with _TURN_STATS_LOCK:
+        total = sum(_FAST_PATH_STATS.values())
+        hits = total - _FAST_PATH_STATS["fallback"]
+        return {
+            **_FAST_PATH_STATS,
+            "hit_rate": round(hits / total, 3) if total else 0.0,
+            "reasons": dict(_FAST_PATH_REASONS),
+        }
+
+
+metrics.register("ai_fast_path", fast_path_stats)
+
+
+def _apply_to_draft(draft: Optional[DraftOrder], fast: FastPathResult) -> Dict[str, int]:
+    """Ítems de la vía rápida aplicados sobre el borrador: la cantidad más reciente prevalece."""
+    changes = MentionedItems(
+        items=[
+            MentionedItem(code=code, qty=qty)
+            for code, qty in canonical_items((it.code, it.qty) for it in fast.items.items).items()
+        ]
+    )
+    removals = canonical_items((code, 1) for code in fast.removals)
+    return consolidate_items(changes, draft.items if draft else None, removals)
+
 
 def handle_incoming_message(
     postgre_session: Session,
@@ -65,13 +179,10 @@ def handle_incoming_message(
 
     comercial_name: str = comercial.name or "el vendedor"
 
-    stmt = (
-        select(Message.direction, Message.content)
-        .where(Message.client_id == cliente.codigo_cliente)
-        .order_by(desc(Message.timestamp))
-        .limit(6)
+    # Ring buffer en memoria alimentado por el ingest; solo va a BD si el cliente no está
+    messages: List[HistoryEntry] = conversation_history.recent(
+        cliente.codigo_cliente, 6, session=postgre_session
     )
-    messages: List[Message] = postgre_session.execute(stmt).all()[::-1]
 
     history: str = "\n".join(
         [
@@ -81,91 +192,182 @@ def handle_incoming_message(
         ]
     )
 
-    is_order_prompt_text: str = is_order_prompt(message_text)
-    is_order_raw_response: str = chat.invoke(
-        [HumanMessage(content=is_order_prompt_text)]
-    ).content.strip()
-    logging.info(f"Is an order: {is_order(is_order_raw_response)}")
-    if is_order(is_order_raw_response):
+    started = time.perf_counter()
+    # Pedido en curso: las correcciones se aplican sobre él sin volver al historial
+    draft: Optional[DraftOrder] = order_drafts.get(cliente.codigo_cliente)
+    fast = _fast_path(message_text, history, draft)
+    if AI_CALL_MODE == "single":
+        llm_calls = _run_single_call(
+            sqlserver_session, stub, receiver, sender, message_text,
+            comercial, cliente, comercial_name, history, messages, fast, draft,
+        )
+        _record_turn("single", llm_calls, time.perf_counter() - started)
+    else:
+        llm_calls = _run_multi_call(
+            sqlserver_session, stub, receiver, sender, message_text,
+            comercial, cliente, comercial_name, history, messages, chat, fast, draft,
+        )
+        _record_turn("multi", llm_calls, time.perf_counter() - started)
+
+
+def _run_multi_call(
+    sqlserver_session, stub, receiver, sender, message_text,
+    comercial, cliente, comercial_name, history, messages, chat, fast: FastPathResult,
+    draft: Optional[DraftOrder],
+) -> int:
+    llm_calls = 0
+    if fast.is_order is None:
+        is_order_raw_response: str = chat.invoke(
+            is_order_messages(message_text), expect=("order",)
+        ).content.strip()
+        llm_calls += 1
+        order = is_order(is_order_raw_response)
+    else:
+        order = fast.is_order
+    logging.info(f"Is an order: {order}")
+    if order:
         logging.info(f"Is an order confirmation: {is_order_confirmation(message_text)}")
         if is_order_confirmation(message_text):
-            for message in messages:
-                logging.info(
-                    f"message direction: {message.direction} \ message content: {message.content}"
-                )
-            confirmed_order_text: str = confirmed_order(messages)
-            logging.info(f"confirmed_order_text: {confirmed_order_text}")
-            updated_confirmed_order_csv_path: Optional[str] = order_to_xlsx(
-                confirmed_order_text
-            )
-            updated_confirmed_order_pdf_path: str = order_to_pdf(confirmed_order_text)
+            _confirm_order(stub, receiver, sender, comercial, cliente, messages, draft)
+            return llm_calls
 
-            notify_order_by_email(
-                user=comercial,
-                client=cliente,
-                phone=sender,
-                csv_path=updated_confirmed_order_csv_path,
-            )
-            send_file(stub, sender, updated_confirmed_order_pdf_path, from_jid=receiver)
+        if fast.items is not None:
+            items = _apply_to_draft(draft, fast)
         else:
-            mentioned_products_prompt_text: str = mentioned_products_prompt(
-                history, message_text
-            )
             mentioned_products_raw_response: str = chat.invoke(
-                [HumanMessage(content=mentioned_products_prompt_text)]
+                mentioned_products_messages(history, message_text), expect=("items",)
             ).content.strip()
-            if mentioned_products := extract_mentioned_products(
-                mentioned_products_raw_response
-            ):
-                logging.info(f"Mentioned products: {mentioned_products}")
-                img: Image | None = update_order(sqlserver_session, mentioned_products)
-                if img:
-                    send_message(
-                        stub,
-                        sender,
-                        "Confirma si el pedido es correcto respondiendo con *Es correcto*.\
-                        Se lo pasaremos a tu comercial que se encargará de todo o te contactará si hay alguna duda.\
-                        En caso de que no sea correcto, sientete libre de repetirme el pedido o indicar unicamente las correcciones\
-                        [Este mensaje fue generado automáticamente por un asistente en versión de pruebas]",
-                        from_jid=receiver,
-                    )
-                    
-                    timestamp = datetime.now().strftime("%Y_%m_%d_%H_%M")
-                    filename = f"pedido_{timestamp}.jpg"
-                    tmp_dir = tempfile.gettempdir()
-                    filepath = os.path.join(tmp_dir, filename)
-
-                    img.save(filepath, format="JPEG")
-
-                    send_file(stub, sender, filepath=filepath, from_jid=receiver)
-                    del img
-                    os.remove(filepath)
-            else:
-                chat_prompt_text: str = chat_prompt(
-                    comercial_name, history, message_text
-                )
-                chat_raw_response: str = chat.invoke(
-                    [HumanMessage(content=chat_prompt_text)]
-                ).content.strip()
-                chat_response: str | None = extract_response_text(chat_raw_response)
-                if chat_response and len(chat_response.strip()) > 0:
-                    chat_response += "\n[Este mensaje fue generado automáticamente por un asistente en versión de pruebas]"
-                    send_message(stub, sender, chat_response, from_jid=receiver)
-                    logging.info("IA Response successfully sent")
-                else:
-                    logging.info("There is not IA response")
+            llm_calls += 1
+            # El LLM devuelve el pedido completo (historial + mensaje): sustituye al borrador
+            items = canonical_items(extract_mentioned_products(mentioned_products_raw_response))
+        if items:
+            draft = order_drafts.save(cliente.codigo_cliente, items)
+            _send_order_summary(sqlserver_session, stub, receiver, sender, draft)
+            return llm_calls
+        if draft is not None and fast.removals:
+            # Se han quitado todos los artículos: sin borrador no hay nada que confirmar
+            order_drafts.discard(cliente.codigo_cliente)
+
+    llm_calls += 1
+    chat_raw_response: str = chat.invoke(
+        chat_messages(comercial_name, history, message_text), expect=("responder",)
+    ).content.strip()
+    _send_chat_reply(stub, receiver, sender, extract_response_text(chat_raw_response))
+    return llm_calls
+
+
+def _run_single_call(
+    sqlserver_session, stub, receiver, sender, message_text,
+    comercial, cliente, comercial_name, history, messages, fast: FastPathResult,
+    draft: Optional[DraftOrder],
+) -> int:
+    if fast.is_order and fast.reason == "confirmation":
+        # "Es correcto" con borrador: se confirma sin llamada al LLM
+        _confirm_order(stub, receiver, sender, comercial, cliente, messages, draft)
+        return 0
+    if fast.items is not None and not is_order_confirmation(message_text):
+        # Pedido claro o corrección sobre el borrador: resumen directo, sin llamada al LLM
+        items = _apply_to_draft(draft, fast)
+        if items:
+            draft = order_drafts.save(cliente.codigo_cliente, items)
+            _send_order_summary(sqlserver_session, stub, receiver, sender, draft)
+            return 0
+        if draft is not None and fast.removals:
+            # Se han quitado todos los artículos: sin borrador no hay nada que confirmar
+            order_drafts.discard(cliente.codigo_cliente)
+
+    raw_response: str = single_call_chat.invoke(
+        agent_turn_messages(comercial_name, history, message_text),
+        expect=("order", "items", "responder"),
+    ).content.strip()
+    turn: AgentTurn | None = extract_agent_turn(raw_response)
+    if turn is None:
+        logging.warning(f"Single-call response could not be parsed: {raw_response!r}")
+        return 1
+    logging.info(f"Single-call turn: {turn}")
+
+    if turn.order:
+        logging.info(f"Is an order confirmation: {is_order_confirmation(message_text)}")
+        if is_order_confirmation(message_text):
+            _confirm_order(stub, receiver, sender, comercial, cliente, messages, draft)
+            return 1
+        items = canonical_items((it.code, it.qty) for it in turn.items or [])
+        if items:
+            draft = order_drafts.save(cliente.codigo_cliente, items)
+            _send_order_summary(sqlserver_session, stub, receiver, sender, draft)
+            return 1
+
+    _send_chat_reply(stub, receiver, sender, turn.respuesta if turn.responder else None)
+    return 1
+
+
+def _confirm_order(stub, receiver, sender, comercial, cliente, messages, draft: Optional[DraftOrder]):
+    # O(1): el borrador ya es el pedido; se graba en `orders` de una vez
+    confirmed = order_drafts.confirm(cliente.codigo_cliente, cliente.codigo_empresa)
+    if confirmed is not None:
+        confirmed_order_text: str = confirmed.to_text()
+    elif draft is None and DRAFT_HISTORY_FALLBACK:
+        # Resumen enviado antes de existir order_drafts: se busca en el historial
+        for message in messages:
+            logging.info(
+                f"message direction: {message.direction} \\ message content: {message.content}"
+            )
+        confirmed_order_text: str = confirmed_order(messages)
     else:
-        chat_prompt_text: str = chat_prompt(comercial_name, history, message_text)
-        chat_raw_response: str = chat.invoke(
-            [HumanMessage(content=chat_prompt_text)]
-        ).content.strip()
-        chat_response: str | None = extract_response_text(chat_raw_response)
-        if chat_response and len(chat_response.strip()) > 0:
-            chat_response += "\n[Este mensaje fue generado automáticamente por un asistente en versión de pruebas]"
-            send_message(stub, sender, chat_response, from_jid=receiver)
-            logging.info("IA Response successfully sent")
-        else:
-            logging.info("There is not IA response")
+        confirmed_order_text = None
+    if not confirmed_order_text:
+        # Borrador vaciado, caducado o ya confirmado: no se reenvía un pedido antiguo
+        logging.warning(f"Order confirmation from client {cliente.codigo_cliente} without a draft order")
+        return
+    logging.info(f"confirmed_order_text: {confirmed_order_text}")
+    updated_confirmed_order_csv_path: Optional[str] = order_to_xlsx(
+        confirmed_order_text
+    )
+    updated_confirmed_order_pdf_path: str = order_to_pdf(confirmed_order_text)
+
+    notify_order_by_email(
+        user=comercial,
+        client=cliente,
+        phone=sender,
+        csv_path=updated_confirmed_order_csv_path,
+    )
+    queue_file(sender, updated_confirmed_order_pdf_path, from_jid=receiver)
+
+
+def _send_order_summary(sqlserver_session, stub, receiver, sender, draft: DraftOrder):
+    logging.info(f"Mentioned products: {draft.items} (draft v{draft.version})")
+    summary_hash = items_hash(draft.items)
+    if draft.image_hash == summary_hash:
+        # El cliente ya tiene esta misma imagen: solo se le vuelve a pedir confirmación
+        logging.info(f"Order summary for client {draft.client_id} unchanged, image not resent")
+        queue_message(sender, ORDER_SUMMARY_TEXT, from_jid=receiver)
+        return
+    img: Image | None = update_order(sqlserver_session, draft.pairs())
+    if not img:
+        return
+    queue_message(sender, ORDER_SUMMARY_TEXT, from_jid=receiver)
+
+    timestamp = datetime.now().strftime("%Y_%m_%d_%H_%M")
+    filename = f"pedido_{timestamp}.jpg"
+    tmp_dir = tempfile.gettempdir()
+    filepath = os.path.join(tmp_dir, filename)
+
+    img.save(filepath, format="JPEG")
+
+    # queue_file copia el fichero a la cola: el temporal se puede borrar ya
+    queue_file(sender, filepath, from_jid=receiver)
+    del img
+    os.remove(filepath)
+    order_drafts.set_image_hash(draft, summary_hash)
+
+
+def _send_chat_reply(stub, receiver, sender, chat_response: str | None):
+    if chat_response and len(chat_response.strip()) > 0:
+        chat_response += "\n" + BOT_FOOTER
+        queue_message(sender, chat_response, from_jid=receiver)
+        logging.info("IA Response successfully queued")
+    else:
+        logging.info("There is not IA response")
 
 
 def search_products(sqlserver_session: Session, keywords: list[str]) -> str:
@@ -187,206 +389,82 @@ def search_products(sqlserver_session: Session, keywords: list[str]) -> str:
     return "\n".join(lines)
 
 
-def process_unattended_messages_loop(stub):
-    while True:
-        logging.info("process_unattended_messages_loop: checking lasts messages")
-
-        postgres_session = get_postgres_session()
-        sqlserver_session = get_sqlserver_session()
-
+def _llm_priority(conv_ts: datetime) -> tuple:
+    """
+    Carril y margen para la conversación: LIVE si acaba de vencer su espera,
+    BACKGROUND si es atraso (p.ej. tras un reinicio). Pasada la ventana MAX ya no
+    tiene sentido responder, así que ese es el deadline.
+    """
+    now = datetime.now(timezone.utc)
+    ts = conv_ts if conv_ts.tzinfo else conv_ts.replace(tzinfo=timezone.utc)
+    overdue = (now - (ts + timedelta(minutes=MIN_MINUTES))).total_seconds()
+    lane = LIVE if overdue <= AI_LIVE_WINDOW_SECONDS else BACKGROUND
+    timeout = (ts + timedelta(minutes=MAX_MINUTES) - now).total_seconds()
+    return lane, timeout
+
+
+def _coalesce_burst(session: Session, conv, since: datetime) -> str:
+    """
+    Textos recibidos desde la última respuesta (la ráfaga), del más antiguo al más
+    reciente, uno por línea: incluye lo extraído de fotos, audios y documentos.
+    """
+    entries = conversation_history.recent(conv.client_id, AI_BURST_MAX_MESSAGES, session=session)
+    texts: List[str] = []
+    for entry in reversed(entries):
+        if entry.direction != "received" or entry.timestamp < since:
+            break
+        if entry.content and entry.content.strip():
+            texts.append(entry.content.strip())
+    if len(texts) > 1:
+        logging.info(f"Coalesced {len(texts)} messages from client {conv.client_id} into one AI turn")
+    return "\n".join(reversed(texts)) or conv.content
+
+
+def attend_conversation(stub, client_id: int):
+    with postgres_session() as pg_session, sqlserver_session() as ss_session:
+        # Revalida contra BD: puede haberse respondido desde otro proceso
+        since = datetime.now(timezone.utc) - timedelta(minutes=MAX_MINUTES)
+        pending = load_unattended(pg_session, since, client_id=client_id)
+        if not pending:
+            return
+        conv = pending[0]
+
+        burst_since = since - timedelta(seconds=BURST_MAX_WAIT_SECONDS)
+        message_text = _coalesce_burst(pg_session, conv, burst_since)
+
+        lane, timeout = _llm_priority(conv.timestamp)
+        logging.info(
+            f"🤖 Enviando respuesta IA a cliente {conv.client_id} "
+            f"({'live' if lane == LIVE else 'background'}, {timeout:.0f}s left)"
+        )
         try:
-            # Aliased para evitar conflictos
-            MessageAlias = aliased(Message)
-
-            # Subconsulta que obtiene el último timestamp por client_id
-            subq = (
-                postgres_session.query(
-                    MessageAlias.client_id,
-                    func.max(MessageAlias.timestamp).label("latest"),
-                )
-                .filter(MessageAlias.direction == "received")
-                .group_by(MessageAlias.client_id)
-                .subquery()
-            )
-
-            # Join para obtener los mensajes completos
-            last_msgs = (
-                postgres_session.query(MessageAlias)
-                .join(
-                    subq,
-                    and_(
-                        MessageAlias.client_id == subq.c.client_id,
-                        MessageAlias.timestamp == subq.c.latest,
-                    ),
-                )
-                .filter(MessageAlias.direction == "received")
-                .all()
-            )
-            now = datetime.now()
-
-            for last_msg in last_msgs:
-                # Verificar si ya se respondió
-                response = (
-                    postgres_session.query(Message)
-                    .filter(
-                        and_(
-                            Message.client_id == last_msg.client_id,
-                            Message.direction == "sent",
-                            Message.timestamp > last_msg.timestamp,
-                        )
-                    )
-                    .first()
-                )
-
-                if response:
-                    continue  # Ya respondido
-
-                if not last_msg.content:
-                    continue  # No hay texto para procesar
-
-                # Verificar rango de tiempo
-                age = now - last_msg.timestamp
-                if age < timedelta(minutes=MIN_MINUTES) or age > timedelta(
-                    minutes=MAX_MINUTES
-                ):
-                    continue  # Fuera del rango definido
-
-                # Obtener teléfono del cliente
-                client_phone = last_msg.client_phone
-                client = Cliente.get_by_telefono(sqlserver_session, client_phone)
-                if not client:
-                    continue
-
-                # Obtener usuario asignado
-                user = (
-                    postgres_session.query(User)
-                    .filter(User.id == last_msg.user_id)
-                    .first()
-                )
-                if not user:
-                    logging.info(f"Cliente {last_msg.client_id} sin usuario asignado")
-                    continue
-
-                logging.info(f"Enviando respuesta IA a cliente {last_msg.client_id}")
+            with llm_request(lane, timeout=timeout):
                 handle_incoming_message(
-                    postgres_session,
-                    sqlserver_session,
+                    pg_session,
+                    ss_session,
                     stub,
-                    user.phone,
-                    client_phone,
-                    last_msg.content,
+                    conv.user_phone,
+                    conv.client_phone,
+                    message_text,
                 )
+        except LLMDeadlineExceeded as e:
+            logging.warning(f"AI reply for client {conv.client_id} dropped: {e}")
 
-        except Exception as e:
-            logging.error(f"Error en el loop de mensajes no atendidos: {e}")
 
-        finally:
-            postgres_session.close()
-            sqlserver_session.close()
-
-        time.sleep(60)
+def run_ai_workers(stub):
+    """Workers de la cola ai_jobs: atienden conversaciones encoladas por cualquier proceso."""
+    # El atraso solo se reclama con hueco en el LLM: los workers quedan libres para el carril LIVE
+    return ai_jobs.start(
+        lambda client_id: attend_conversation(stub, client_id),
+        background_ok=llm_gateway.has_capacity,
+    )
 
-def to_aware_utc(dt: datetime) -> datetime:
-    """Convierte cualquier datetime a timezone-aware en UTC."""
-    if dt is None:
-        return None
-    if dt.tzinfo is None:
-        # Asumimos que los naive son UTC. Si en tu BD están en hora local,
-        # reemplaza por la zona correcta y luego .astimezone(timezone.utc)
-        return dt.replace(tzinfo=timezone.utc)
-    return dt.astimezone(timezone.utc)
 
 def process_unattended_messages_loop(stub):
-    while True:
-        logging.info("process_unattended_messages_loop: checking last messages")
-
-        postgres_session = get_postgres_session()
-        sqlserver_session = get_sqlserver_session()
-
-        try:
-            MessageAlias = aliased(Message)
-
-            subq = (
-                postgres_session.query(
-                    MessageAlias.client_id,
-                    func.max(MessageAlias.timestamp).label("latest"),
-                )
-                .filter(MessageAlias.direction == "received")
-                .group_by(MessageAlias.client_id)
-                .subquery()
-            )
-
-            last_msgs = (
-                postgres_session.query(MessageAlias)
-                .join(
-                    subq,
-                    and_(
-                        MessageAlias.client_id == subq.c.client_id,
-                        MessageAlias.timestamp == subq.c.latest,
-                    ),
-                )
-                .filter(MessageAlias.direction == "received")
-                .all()
-            )
-
-            # AHORA: aware en UTC
-            now = datetime.now(timezone.utc)
-
-            for last_msg in last_msgs:
-                # Defensive: normalizamos el timestamp del mensaje a aware UTC
-                last_msg_ts = to_aware_utc(last_msg.timestamp)
-
-                # ¿Ya se respondió?
-                response = (
-                    postgres_session.query(Message)
-                    .filter(
-                        and_(
-                            Message.client_id == last_msg.client_id,
-                            Message.direction == "sent",
-                            Message.timestamp > last_msg_ts,
-                        )
-                    )
-                    .first()
-                )
-                if response:
-                    continue
-
-                if not last_msg.content:
-                    continue
-
-                # Rango de tiempo (todo en UTC-aware)
-                age = now - last_msg_ts
-                if age < timedelta(minutes=MIN_MINUTES) or age > timedelta(minutes=MAX_MINUTES):
-                    continue
-
-                client_phone = last_msg.client_phone
-                client = Cliente.get_by_telefono(sqlserver_session, client_phone)
-                if not client:
-                    continue
-
-                user = postgres_session.query(User).filter(User.id == last_msg.user_id).first()
-                if not user:
-                    logging.info(f"Cliente {last_msg.client_id} sin usuario asignado")
-                    continue
-
-                logging.info(f"🤖 Enviando respuesta IA a cliente {last_msg.client_id}")
-                handle_incoming_message(
-                    postgres_session,
-                    sqlserver_session,
-                    stub,
-                    user.phone,
-                    client_phone,
-                    last_msg.content,
-                )
-
-        except Exception as e:
-            logging.exception(f"Error en el loop de mensajes no atendidos: {e}")
-
-        finally:
-            postgres_session.close()
-            sqlserver_session.close()
-
-        time.sleep(60)
+    # El planificador solo encola en ai_jobs (Postgres); la atienden los workers de este
+    # proceso o de cualquier otro (`manage.py aiworker`), nunca dos a la vez.
+    run_ai_workers(stub)
+    unattended_scheduler.run(ai_jobs.schedule)
 
 
 def search_simulated_products(fake_index: dict[str, str], keywords: list[str]) -> str:
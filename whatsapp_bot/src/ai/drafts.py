@@ -0,0 +1,227 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from src.core import metrics
+from src.core.catalog import normalize_code, product_catalog
+from src.core.database import postgres_session
+from src.models.order import Order
+from src.models.order_draft import OrderDraft
+
+load_dotenv()
+DRAFT_CACHE_SIZE = int(os.getenv("DRAFT_CACHE_SIZE", "5000"))
+# Un borrador sin tocar en este tiempo se da por abandonado: el siguiente pedido empieza de cero
+DRAFT_TTL_MINUTES = float(os.getenv("DRAFT_TTL_MINUTES", "180"))
+
+# Marca "consultado en BD y no hay borrador" en la caché
+_MISSING = object()
+
+
+class DraftOrder(NamedTuple):
+    client_id: int
+    items: Dict[str, int]  # codigo -> cantidad, en orden de llegada
+    version: int
+    image_hash: Optional[str]
+    updated_at: datetime
+
+    def pairs(self) -> List[Tuple[str, str]]:
+        """Formato de update_order / extract_mentioned_products."""
+        return [(code, str(qty)) for code, qty in self.items.items()]
+
+    def to_text(self) -> str:
+        """Formato "PEDIDO: \\codigo \\cantidad ..." que leen order_to_xlsx / order_to_pdf."""
+        return "PEDIDO: " + " ".join(f"\\{code} \\{qty}" for code, qty in self.items.items())
+
+
+def canonical_code(code: str) -> str:
+    """Código tal como está en el catálogo ("a100" -> "A100"), para que las correcciones casen."""
+    code = code.strip()
+    if product_catalog.ensure_loaded():
+        articulo = product_catalog.state.get(normalize_code(code))
+        if articulo is not None:
+            return articulo.codigo.strip()
+    return code.upper()
+
+
+def canonical_items(pairs: Iterable[Tuple[str, object]]) -> Dict[str, int]:
+    """[(codigo, cantidad)] del LLM o de la vía rápida -> {codigo canónico: cantidad > 0}."""
+    items: Dict[str, int] = {}
+    for code, qty in pairs:
+        try:
+            qty = int(str(qty).strip())
+        except ValueError:
+            continue
+        if code and qty > 0:
+            items[canonical_code(code)] = qty
+    return items
+
+
+def items_hash(items: Dict[str, int]) -> str:
+    return hashlib.sha256(json.dumps(list(items.items())).encode("utf-8")).hexdigest()
+
+
+def _from_row(row: OrderDraft) -> DraftOrder:
+    return DraftOrder(
+        row.client_id,
+        {code: int(qty) for code, qty in row.items},
+        row.version,
+        row.image_hash,
+        row.updated_at,
+    )
+
+
+class DraftOrderStore:
+    """
+    Pedido en curso de cada cliente, mantenido incrementalmente en cada extracción.
+
+    Persistido en Postgres (order_drafts) con una caché LRU delante: leer el borrador no
+    toca BD salvo la primera vez. Al confirmar ("Es correcto") se escriben las líneas en
+    `orders` en un solo INSERT y se borra el borrador, sin volver a recorrer el historial.
+    Las escrituras de un mismo cliente las serializa la cola ai_jobs (una fila por cliente).
+    """
+
+    def __init__(self, max_cached: int = DRAFT_CACHE_SIZE, ttl_minutes: float = DRAFT_TTL_MINUTES):
+        self.max_cached = max_cached
+        self.ttl = timedelta(minutes=ttl_minutes)
+        self._cache: "OrderedDict[int, object]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {
+            "hits": 0,
+            "loads": 0,
+            "updates": 0,
+            "unchanged": 0,
+            "confirmed": 0,
+            "discarded": 0,
+            "expired": 0,
+        }
+
+    def _expired(self, draft: DraftOrder) -> bool:
+        return datetime.now(timezone.utc) - draft.updated_at > self.ttl
+
+    def _remember(self, client_id: int, value):
+        with self._lock:
+            self._cache[client_id] = value
+            self._cache.move_to_end(client_id)
+            while len(self._cache) > self.max_cached:
+                self._cache.popitem(last=False)
+
+    def get(self, client_id: int) -> Optional[DraftOrder]:
+        """Borrador vigente del cliente; uno caducado (DRAFT_TTL_MINUTES) cuenta como ninguno."""
+        with self._lock:
+            cached = self._cache.get(client_id)
+            if cached is not None:
+                self._cache.move_to_end(client_id)
+                self._stats["hits"] += 1
+        if cached is None:
+            with self._lock:
+                self._stats["loads"] += 1
+            with postgres_session() as session:
+                row = OrderDraft.get(session, client_id)
+                cached = _from_row(row) if row is not None else _MISSING
+            self._remember(client_id, cached)
+        if cached is _MISSING:
+            return None
+        if self._expired(cached):
+            # Se sobrescribe en el próximo save(); confirm() tampoco lo acepta
+            with self._lock:
+                self._stats["expired"] += 1
+            return None
+        return cached
+
+    def save(self, client_id: int, items: Dict[str, int]) -> Optional[DraftOrder]:
+        """
+        Sustituye los ítems del borrador; si no cambian, no sube la versión.
+        Sin ítems (se han quitado todos) el borrador se borra y devuelve None.
+        """
+        if not items:
+            self.discard(client_id)
+            return None
+        current = self.get(client_id)
+        if current is not None and list(current.items.items()) == list(items.items()):
+            with self._lock:
+                self._stats["unchanged"] += 1
+            return current
+        with postgres_session() as session:
+            version = OrderDraft.upsert(session, client_id, [[c, q] for c, q in items.items()])
+        draft = DraftOrder(client_id, dict(items), version, None, datetime.now(timezone.utc))
+        self._remember(client_id, draft)
+        with self._lock:
+            self._stats["updates"] += 1
+        logging.info(f"Draft order for client {client_id} v{version}: {items}")
+        return draft
+
+    def set_image_hash(self, draft: DraftOrder, image_hash: str) -> DraftOrder:
+        with postgres_session() as session:
+            stored = OrderDraft.set_image_hash(session, draft.client_id, draft.version, image_hash)
+        if not stored:
+            # Otro proceso lo cambió: que la próxima lectura vaya a BD
+            self.forget(draft.client_id)
+            return draft
+        updated = draft._replace(image_hash=image_hash)
+        self._remember(draft.client_id, updated)
+        return updated
+
+    def confirm(self, client_id: int, codigo_empresa: int) -> Optional[DraftOrder]:
+        """
+        Pasa el borrador a `orders` (un INSERT multi-fila) y lo borra, en una transacción.
+        Devuelve el borrador confirmado o None si el cliente no tenía ninguno.
+        """
+        if self.get(client_id) is None:
+            return None
+        now = datetime.now(timezone.utc)
+        with postgres_session() as session:
+            row = OrderDraft.get(session, client_id, for_update=True)
+            draft = _from_row(row) if row is not None else None
+            if draft is None or not draft.items or self._expired(draft):
+                session.rollback()
+                self.forget(client_id)
+                return None
+            Order.insert_many(
+                session,
+                [
+                    {
+                        "codigo_empresa": codigo_empresa,
+                        "codigo_cliente": client_id,
+                        "codigo_articulo": code,
+                        "units": qty,
+                        "timestamp": now,
+                    }
+                    for code, qty in draft.items.items()
+                ],
+            )
+            OrderDraft.delete(session, client_id)
+            session.commit()
+        self._remember(client_id, _MISSING)
+        with self._lock:
+            self._stats["confirmed"] += 1
+        logging.info(f"Draft order for client {client_id} v{draft.version} confirmed ({len(draft.items)} lines)")
+        return draft
+
+    def discard(self, client_id: int):
+        """Borra el borrador (p.ej. el cliente ha quitado todos los artículos)."""
+        with postgres_session() as session:
+            OrderDraft.delete(session, client_id)
+            session.commit()
+        self._remember(client_id, _MISSING)
+        with self._lock:
+            self._stats["discarded"] += 1
+        logging.info(f"Draft order for client {client_id} discarded")
+
+    def forget(self, client_id: int):
+        with self._lock:
+            self._cache.pop(client_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "cached": len(self._cache)}
+
+
+order_drafts = DraftOrderStore()
+metrics.register("order_drafts", order_drafts.stats)
@@ -3,8 +3,14 @@ from typing import Optional, Tuple, List
 
 
 import json, re
+import logging
 from typing import Optional, List, Tuple
 
+from pydantic import ValidationError
+
+from src.ai.schemas import AgentTurn, MentionedItem
+
+
 def extract_mentioned_products(text: str) -> Optional[List[Tuple[str, str]]]:
     # 1) intenta JSON directo
     try:
@@ -52,6 +58,45 @@ def extract_response_text(text: str) -> Optional[str]:
     return m.group(1) if m else None
 
 
+def extract_agent_turn(text: str) -> Optional[AgentTurn]:
+    """
+    Valida la salida del modo de una sola llamada contra AgentTurn.
+    Los ítems inválidos se descartan uno a uno en vez de invalidar todo el turno.
+    """
+    obj = None
+    try:
+        obj = json.loads(text)
+    except Exception:
+        # fallback: primer objeto JSON embebido en el texto
+        m = re.search(r"\{[\s\S]*\}", text)
+        if m:
+            try:
+                obj = json.loads(m.group(0))
+            except Exception:
+                return None
+    if not isinstance(obj, dict):
+        return None
+
+    items = []
+    for raw in obj.get("items") or []:
+        if isinstance(raw, (list, tuple)) and len(raw) == 2:
+            raw = {"code": raw[0], "qty": raw[1]}
+        try:
+            items.append(MentionedItem.model_validate(raw))
+        except ValidationError:
+            logging.info(f"Discarding invalid item: {raw!r}")
+
+    try:
+        return AgentTurn(
+            order=bool(obj.get("order", False)),
+            items=items,
+            responder=bool(obj.get("responder", False)),
+            respuesta=obj.get("respuesta") if isinstance(obj.get("respuesta"), str) else None,
+        )
+    except ValidationError:
+        return None
+
+
 def is_order(output_text: str) -> bool:
     return '"order": true' in output_text.lower()
 
@@ -0,0 +1,193 @@
+import logging
+import os
+import sys
+import threading
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Deque, Dict, List, NamedTuple, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import desc, select
+from sqlalchemy.orm import Session
+
+from src.ai.scheduler import to_aware_utc
+from src.core import metrics
+from src.core.database import postgres_session
+from src.models.message import Message
+
+load_dotenv()
+HISTORY_PER_CLIENT = int(os.getenv("HISTORY_PER_CLIENT", "20"))
+HISTORY_MAX_CLIENTS = int(os.getenv("HISTORY_MAX_CLIENTS", "5000"))
+HISTORY_MAX_BYTES = int(os.getenv("HISTORY_MAX_BYTES", str(32 * 1024 * 1024)))
+
+# Coste aproximado de una entrada además del texto (tupla, datetime, deque)
+_ENTRY_OVERHEAD = 200
+
+
+class HistoryEntry(NamedTuple):
+    direction: str
+    content: Optional[str]
+    timestamp: datetime
+
+
+def _entry_size(entry: HistoryEntry) -> int:
+    return _ENTRY_OVERHEAD + (sys.getsizeof(entry.content) if entry.content else 0)
+
+
+class _ClientHistory:
+    __slots__ = ("entries", "complete", "size")
+
+    def __init__(self, complete: bool):
+        self.entries: Deque[HistoryEntry] = deque()
+        # False: solo tiene lo llegado por ingest; falta hidratar lo anterior de BD
+        self.complete = complete
+        self.size = 0
+
+
+class ConversationHistory:
+    """
+    Últimos mensajes de cada cliente en memoria (ring buffer de `per_client` entradas).
+
+    El ingest la alimenta con `append`; `recent` la lee sin ir a BD. Un cliente que no
+    está (o del que solo se ha visto lo llegado tras arrancar) se hidrata de Postgres
+    la primera vez que se lee. Entre clientes, LRU con tope de clientes y de memoria.
+    """
+
+    def __init__(
+        self,
+        per_client: int = HISTORY_PER_CLIENT,
+        max_clients: int = HISTORY_MAX_CLIENTS,
+        max_bytes: int = HISTORY_MAX_BYTES,
+    ):
+        self.per_client = per_client
+        self.max_clients = max_clients
+        self.max_bytes = max_bytes
+        self._clients: "OrderedDict[int, _ClientHistory]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "hydrations": 0, "bypass": 0, "appends": 0, "evictions": 0}
+
+    # ---- escritura (ingest) ----
+    def _push(self, history: _ClientHistory, entry: HistoryEntry):
+        history.entries.append(entry)
+        size = _entry_size(entry)
+        history.size += size
+        self._bytes += size
+        while len(history.entries) > self.per_client:
+            old = history.entries.popleft()
+            history.size -= _entry_size(old)
+            self._bytes -= _entry_size(old)
+
+    def _evict(self):
+        while self._clients and (
+            len(self._clients) > self.max_clients or self._bytes > self.max_bytes
+        ):
+            _, history = self._clients.popitem(last=False)
+            self._bytes -= history.size
+            self._stats["evictions"] += 1
+
+    def append(self, client_id: int, direction: str, content: Optional[str], timestamp: datetime):
+        entry = HistoryEntry(direction, content, to_aware_utc(timestamp))
+        with self._lock:
+            self._stats["appends"] += 1
+            history = self._clients.get(client_id)
+            if history is None:
+                history = self._clients[client_id] = _ClientHistory(complete=False)
+            self._clients.move_to_end(client_id)
+            self._push(history, entry)
+            self._evict()
+
+    def update_content(self, client_id: int, direction: str, timestamp: datetime, content: str):
+        """Texto extraído (OCR, audio...) de un mensaje ya guardado."""
+        ts = to_aware_utc(timestamp)
+        with self._lock:
+            history = self._clients.get(client_id)
+            if history is None:
+                return
+            for i, entry in enumerate(history.entries):
+                if entry.direction == direction and entry.timestamp == ts:
+                    new = entry._replace(content=content)
+                    delta = _entry_size(new) - _entry_size(entry)
+                    history.entries[i] = new
+                    history.size += delta
+                    self._bytes += delta
+                    return
+
+    def invalidate(self, client_id: int):
+        with self._lock:
+            history = self._clients.pop(client_id, None)
+            if history is not None:
+                self._bytes -= history.size
+
+    # ---- lectura (IA) ----
+    @staticmethod
+    def _load(session: Session, client_id: int, limit: int) -> List[HistoryEntry]:
+        stmt = (
+            select(Message.direction, Message.content, Message.timestamp)
+            .where(Message.client_id == client_id)
+            .order_by(desc(Message.timestamp))
+            .limit(limit)
+        )
+        rows = session.execute(stmt).all()[::-1]
+        return [HistoryEntry(d, c, to_aware_utc(ts)) for d, c, ts in rows]
+
+    @staticmethod
+    def _merge(loaded: List[HistoryEntry], partial: List[HistoryEntry]) -> List[HistoryEntry]:
+        # Lo visto en memoria manda (puede tener el texto extraído más reciente)
+        merged: Dict[tuple, HistoryEntry] = {(e.direction, e.timestamp): e for e in loaded}
+        for e in partial:
+            current = merged.get((e.direction, e.timestamp))
+            if current is None or e.content:
+                merged[(e.direction, e.timestamp)] = e
+        return sorted(merged.values(), key=lambda e: e.timestamp)
+
+    def recent(
+        self, client_id: int, limit: int = 6, session: Optional[Session] = None
+    ) -> List[HistoryEntry]:
+        """Últimos `limit` mensajes del cliente, del más antiguo al más reciente."""
+        if limit > self.per_client:
+            with self._lock:
+                self._stats["bypass"] += 1
+            return self._load_with(session, client_id, limit)
+
+        with self._lock:
+            history = self._clients.get(client_id)
+            if history is not None and history.complete:
+                self._clients.move_to_end(client_id)
+                self._stats["hits"] += 1
+                return list(history.entries)[-limit:]
+
+        loaded = self._load_with(session, client_id, self.per_client)
+        with self._lock:
+            self._stats["hydrations"] += 1
+            current = self._clients.pop(client_id, None)
+            partial = list(current.entries) if current is not None else []
+            if current is not None:
+                self._bytes -= current.size
+            history = self._clients[client_id] = _ClientHistory(complete=True)
+            for entry in self._merge(loaded, partial)[-self.per_client :]:
+                self._push(history, entry)
+            self._evict()
+            entries = list(history.entries)
+        logging.debug(f"History for client {client_id} hydrated with {len(entries)} messages")
+        return entries[-limit:]
+
+    def _load_with(self, session: Optional[Session], client_id: int, limit: int) -> List[HistoryEntry]:
+        if session is not None:
+            return self._load(session, client_id, limit)
+        with postgres_session() as own:
+            return self._load(own, client_id, limit)
+
+    def stats(self) -> dict:
+        with self._lock:
+            reads = self._stats["hits"] + self._stats["hydrations"]
+            return {
+                **self._stats,
+                "clients": len(self._clients),
+                "bytes": self._bytes,
+                "hit_rate": round(self._stats["hits"] / reads, 3) if reads else 0.0,
+            }
+
+
+conversation_history = ConversationHistory()
+metrics.register("history", conversation_history.stats)
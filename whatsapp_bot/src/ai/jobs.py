@@ -0,0 +1,218 @@
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from src.ai.drafts import order_drafts
+from src.ai.history import conversation_history
+from src.ai.scheduler import AI_LIVE_WINDOW_SECONDS, MIN_MINUTES
+from src.core import metrics
+from src.core.database import postgres_session
+from src.models.ai_job import AIJob
+from src.whatsapp.supervisor import backoff_delay
+
+load_dotenv()
+# Conversaciones atendidas en paralelo por este proceso; el LLMGateway limita cuántas llegan a Ollama
+AI_JOB_WORKERS = int(os.getenv("AI_JOB_WORKERS", os.getenv("AI_DISPATCH_WORKERS", "4")))
+# Un 'running' sin renovar en este tiempo (worker caído) vuelve a reclamarse
+AI_JOB_LEASE_SECONDS = float(os.getenv("AI_JOB_LEASE_SECONDS", "60"))
+AI_JOB_POLL_SECONDS = float(os.getenv("AI_JOB_POLL_SECONDS", "1"))
+AI_JOB_MAX_ATTEMPTS = int(os.getenv("AI_JOB_MAX_ATTEMPTS", "3"))
+AI_JOB_BACKOFF_BASE = float(os.getenv("AI_JOB_BACKOFF_BASE", "5"))
+AI_JOB_BACKOFF_MAX = float(os.getenv("AI_JOB_BACKOFF_MAX", "120"))
+
+
+class AIJobQueue:
+    """
+    Cola de turnos de IA en Postgres (tabla ai_jobs), compartida por todos los procesos.
+
+    El planificador de cada proceso encola con `schedule` (idempotente: una fila por
+    conversación); `workers` hilos reclaman con FOR UPDATE SKIP LOCKED, así que se
+    pueden arrancar tantos procesos o máquinas como haga falta sin responder dos veces.
+    Un hilo renueva el lease de lo que está en curso; si el proceso cae, el lease
+    caduca y otro worker la retoma. Los fallos se reintentan con backoff.
+    Se reclaman antes las conversaciones recién vencidas (carril LIVE) que el atraso,
+    y el atraso solo mientras `background_ok()` (hueco libre en el LLMGateway): así los
+    workers no se quedan todos esperando turno con conversaciones BACKGROUND y siempre
+    hay uno libre para reclamar la de un cliente que acaba de escribir.
+    """
+
+    def __init__(
+        self,
+        workers: int = AI_JOB_WORKERS,
+        lease_seconds: float = AI_JOB_LEASE_SECONDS,
+        live_seconds: float = MIN_MINUTES * 60 + AI_LIVE_WINDOW_SECONDS,
+    ):
+        self.workers = workers
+        self.lease_seconds = lease_seconds
+        # Como _llm_priority: vence a los MIN_MINUTES y es LIVE durante AI_LIVE_WINDOW_SECONDS
+        self.live_seconds = live_seconds
+        self.instance = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.handler: Optional[Callable[[int], None]] = None
+        self.background_ok: Callable[[], bool] = lambda: True
+        self._wake = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._running: Dict[int, datetime] = {}  # client_id -> message_ts reclamado
+        self._lock = threading.Lock()
+        self._stats = {
+            "scheduled": 0,
+            "rearmed": 0,
+            "claimed": 0,
+            "live_only_claims": 0,
+            "done": 0,
+            "retried": 0,
+            "failed": 0,
+            "foreign": 0,
+        }
+
+    # ---- productor (planificador) ----
+    def schedule(
+        self,
+        client_id: int,
+        message_ts: datetime,
+        due_at: Optional[datetime] = None,
+        rearm: bool = False,
+    ):
+        """rearm: el mensaje ya se atendió sin su texto (OCR/audio); hay que volver a atenderlo."""
+        due_at = due_at or datetime.now(timezone.utc)
+        with postgres_session() as session:
+            queued = AIJob.schedule(session, client_id, message_ts, due_at, self.instance, rearm=rearm)
+        if queued:
+            with self._lock:
+                self._stats["scheduled"] += 1
+                if rearm:
+                    self._stats["rearmed"] += 1
+            self._wake.set()
+            logging.info(
+                f"AI job {'re-armed' if rearm else 'queued'} for client {client_id} "
+                f"(message {message_ts.isoformat()})"
+            )
+
+    # ---- consumidores ----
+    def start(
+        self, handler: Callable[[int], None], background_ok: Optional[Callable[[], bool]] = None
+    ) -> "AIJobQueue":
+        with self._lock:
+            if self._threads:
+                return self
+            self.handler = handler
+            if background_ok is not None:
+                self.background_ok = background_ok
+            for i in range(self.workers):
+                t = threading.Thread(target=self._run, daemon=True, name=f"ai-job-{i}")
+                t.start()
+                self._threads.append(t)
+            t = threading.Thread(target=self._heartbeat, daemon=True, name="ai-job-lease")
+            t.start()
+            self._threads.append(t)
+        logging.info(f"AI job workers started: {self.workers} threads as {self.instance}")
+        return self
+
+    def _run(self):
+        while True:
+            # clear antes de reclamar: un schedule() durante el claim no se pierde
+            self._wake.clear()
+            live_only = not self.background_ok()
+            if live_only:
+                with self._lock:
+                    self._stats["live_only_claims"] += 1
+            try:
+                with postgres_session() as session:
+                    rows = AIJob.claim(
+                        session, 1, self.lease_seconds, self.instance, self.live_seconds, live_only
+                    )
+            except Exception as e:
+                logging.error(f"AI job claim failed: {e}")
+                rows = []
+
+            if not rows:
+                self._wake.wait(AI_JOB_POLL_SECONDS)
+                continue
+            for row in rows:
+                with self._lock:
+                    self._running[row["client_id"]] = row["message_ts"]
+                    self._stats["claimed"] += 1
+                try:
+                    self._process(row)
+                except Exception as e:
+                    # Queda en 'running' y se reclama al caducar el lease
+                    logging.exception(f"AI job for client {row['client_id']} could not be finished: {e}")
+                finally:
+                    with self._lock:
+                        self._running.pop(row["client_id"], None)
+
+    def _process(self, row: dict):
+        client_id = row["client_id"]
+        if row["attempts"] > AI_JOB_MAX_ATTEMPTS:
+            self._fail(client_id, f"gave up after {row['attempts'] - 1} attempts")
+            return
+
+        if row["enqueued_by"] != self.instance or row["last_worker"] not in (None, self.instance):
+            # Otro proceso ingirió los mensajes o atendió el turno anterior: las cachés
+            # locales (historial, borrador) pueden estar atrasadas
+            conversation_history.invalidate(client_id)
+            order_drafts.forget(client_id)
+            with self._lock:
+                self._stats["foreign"] += 1
+
+        try:
+            self.handler(client_id)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            if row["attempts"] >= AI_JOB_MAX_ATTEMPTS:
+                self._fail(client_id, error)
+                return
+            delay = backoff_delay(row["attempts"], AI_JOB_BACKOFF_BASE, AI_JOB_BACKOFF_MAX)
+            logging.warning(
+                f"AI job for client {client_id} failed "
+                f"(attempt {row['attempts']}/{AI_JOB_MAX_ATTEMPTS}): {error}; retrying in {delay:.1f}s"
+            )
+            with postgres_session() as session:
+                AIJob.retry(session, client_id, self.instance, error, delay)
+            with self._lock:
+                self._stats["retried"] += 1
+            return
+
+        with postgres_session() as session:
+            AIJob.complete(session, client_id, row["message_ts"], row["due_at"], self.instance)
+        with self._lock:
+            self._stats["done"] += 1
+
+    def _fail(self, client_id: int, error: str):
+        logging.error(f"AI job for client {client_id} gave up: {error}")
+        with postgres_session() as session:
+            AIJob.fail(session, client_id, self.instance, error)
+        with self._lock:
+            self._stats["failed"] += 1
+
+    def _heartbeat(self):
+        while True:
+            time.sleep(self.lease_seconds / 3)
+            with self._lock:
+                client_ids = list(self._running)
+            if not client_ids:
+                continue
+            try:
+                with postgres_session() as session:
+                    AIJob.extend_leases(session, client_ids, self.lease_seconds, self.instance)
+            except Exception as e:
+                logging.error(f"AI job lease renewal failed: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self._stats,
+                "instance": self.instance,
+                "workers": self.workers if self._threads else 0,
+                "running": len(self._running),
+            }
+
+
+ai_jobs = AIJobQueue()
+metrics.register("ai_jobs", ai_jobs.stats)
@@ -1,11 +1,447 @@
 # src/ai/pipeline.py
+import contextvars
+import hashlib
+import heapq
+import importlib.util
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, List, Optional, Sequence
 from langchain_ollama import ChatOllama
+from langchain.schema import AIMessage
 
-def build_chat(ollama_url: str | None = None) -> ChatOllama:
+from src.core import metrics
+from src.core.kvcache import TieredCache
+
+# Debe coincidir con OLLAMA_NUM_PARALLEL del servidor: más peticiones solo hacen cola allí
+OLLAMA_NUM_PARALLEL = int(os.getenv("OLLAMA_NUM_PARALLEL", "1"))
+
+# Carriles de prioridad (menor = antes)
+LIVE = 0  # respuesta a un cliente que acaba de escribir
+BACKGROUND = 1  # puesta al día de conversaciones atrasadas
+LANE_NAMES = {LIVE: "live", BACKGROUND: "background"}
+
+OLLAMA_NUM_PREDICT = int(os.getenv("OLLAMA_NUM_PREDICT", "256"))
+# Mantiene el modelo (y la KV cache del prefijo system) cargado entre llamadas
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+# Decodificación en streaming que corta en cuanto llega el JSON esperado
+LLM_STREAM_EARLY_STOP = os.getenv("LLM_STREAM_EARLY_STOP", "1") == "1"
+
+# Caché de respuestas (solo llamadas deterministas, temperature=0)
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "2048"))
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "media/cache/llm.sqlite3") or None
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+
+_request_lane: contextvars.ContextVar[int] = contextvars.ContextVar("llm_lane", default=BACKGROUND)
+_request_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar(
+    "llm_deadline", default=None
+)
+
+
+class LLMDeadlineExceeded(Exception):
+    """La petición no consiguió turno en Ollama antes de su deadline."""
+
+
+def build_chat(ollama_url: str | None = None, format: Any = None) -> ChatOllama:
+    """
+    format: None, "json" o un JSON schema (dict) para salida restringida de Ollama.
+    """
     return ChatOllama(
         model="llama3",
         temperature=0.0,
         repeat_penalty=1.1,
-        num_predict=256,
+        num_predict=OLLAMA_NUM_PREDICT,
+        keep_alive=OLLAMA_KEEP_ALIVE,
         base_url=ollama_url or None,
-    )
\ No newline at end of file
+        format=format,
+    )
+
+
+@contextmanager
+def llm_request(lane: int = BACKGROUND, timeout: Optional[float] = None) -> Iterator[None]:
+    """
+    Carril y deadline para las llamadas al LLM hechas dentro del bloque:
+
+        with llm_request(LIVE, timeout=60):
+            chat.invoke(...)
+    """
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    lane_token = _request_lane.set(lane)
+    deadline_token = _request_deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _request_lane.reset(lane_token)
+        _request_deadline.reset(deadline_token)
+
+
+class LLMGateway:
+    """
+    Turnos de acceso a Ollama: como mucho `max_parallel` peticiones a la vez y,
+    entre las que esperan, primero el carril LIVE y luego orden de llegada.
+
+    Una petición que no empieza antes de su deadline se descarta con
+    LLMDeadlineExceeded (una respuesta tardía ya no sirve). El deadline solo
+    cuenta la espera: una vez en marcha, la llamada termina.
+    """
+
+    def __init__(self, max_parallel: int = OLLAMA_NUM_PARALLEL):
+        self.max_parallel = max(1, max_parallel)
+        self._cond = threading.Condition()
+        self._waiting: list = []  # heap de (lane, seq)
+        self._seq = itertools.count()
+        self._active = 0
+        self._stats = {
+            lane: {
+                "requests": 0,
+                "completed": 0,
+                "failed": 0,
+                "expired": 0,
+                "queue_seconds": 0.0,
+                "max_queue_seconds": 0.0,
+                "run_seconds": 0.0,
+            }
+            for lane in LANE_NAMES
+        }
+
+    def _acquire(self, lane: int, deadline: Optional[float]) -> float:
+        ticket = (lane, next(self._seq))
+        enqueued = time.monotonic()
+        with self._cond:
+            self._stats[lane]["requests"] += 1
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while self._active >= self.max_parallel or self._waiting[0] != ticket:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise LLMDeadlineExceeded(
+                            f"no LLM slot after {time.monotonic() - enqueued:.1f}s "
+                            f"({LANE_NAMES[lane]} lane)"
+                        )
+                    self._cond.wait(remaining)
+            except BaseException:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._stats[lane]["expired"] += 1
+                self._cond.notify_all()
+                raise
+            heapq.heappop(self._waiting)
+            self._active += 1
+            waited = time.monotonic() - enqueued
+            st = self._stats[lane]
+            st["queue_seconds"] += waited
+            st["max_queue_seconds"] = max(st["max_queue_seconds"], waited)
+            # Puede quedar otro hueco libre para el siguiente de la cola
+            self._cond.notify_all()
+        return waited
+
+    def _release(self, lane: int, ok: bool, run_seconds: float):
+        with self._cond:
+            self._active -= 1
+            st = self._stats[lane]
+            st["completed" if ok else "failed"] += 1
+            st["run_seconds"] += run_seconds
+            self._cond.notify_all()
+
+    def invoke(self, chat, messages, lane: Optional[int] = None, timeout: Optional[float] = None, **kwargs):
+        """`chat.invoke(messages)` con turno. Sin lane/timeout se usan los de `llm_request`."""
+        return self.run(lambda: chat.invoke(messages, **kwargs), lane=lane, timeout=timeout)
+
+    def run(self, fn: Callable[[], Any], lane: Optional[int] = None, timeout: Optional[float] = None):
+        """Ejecuta `fn()` (una llamada a Ollama) cuando le toca turno."""
+        lane = _request_lane.get() if lane is None else lane
+        deadline = _request_deadline.get() if timeout is None else time.monotonic() + timeout
+        waited = self._acquire(lane, deadline)
+        if waited > 1:
+            logging.info(f"LLM request waited {waited:.2f}s for a slot ({LANE_NAMES[lane]} lane)")
+
+        started = time.monotonic()
+        ok = False
+        try:
+            result = fn()
+            ok = True
+            return result
+        finally:
+            self._release(lane, ok, time.monotonic() - started)
+
+    def has_capacity(self) -> bool:
+        """Hay hueco libre sin cola: empezar trabajo BACKGROUND ahora no retrasa a nadie."""
+        with self._cond:
+            return self._active + len(self._waiting) < self.max_parallel
+
+    def stats(self) -> dict:
+        with self._cond:
+            waiting = {name: 0 for name in LANE_NAMES.values()}
+            for lane, _ in self._waiting:
+                waiting[LANE_NAMES[lane]] += 1
+            lanes = {}
+            for lane, st in self._stats.items():
+                started = st["requests"] - st["expired"] - waiting[LANE_NAMES[lane]]
+                done = st["completed"] + st["failed"]
+                lanes[LANE_NAMES[lane]] = {
+                    "requests": st["requests"],
+                    "completed": st["completed"],
+                    "failed": st["failed"],
+                    "expired": st["expired"],
+                    "waiting": waiting[LANE_NAMES[lane]],
+                    "avg_queue_seconds": round(st["queue_seconds"] / started, 3) if started else 0.0,
+                    "max_queue_seconds": round(st["max_queue_seconds"], 3),
+                    "avg_run_seconds": round(st["run_seconds"] / done, 3) if done else 0.0,
+                }
+            return {"max_parallel": self.max_parallel, "active": self._active, "lanes": lanes}
+
+
+class JsonObjectScanner:
+    """
+    Detecta, sobre texto que llega a trozos, cada objeto JSON de nivel superior
+    completo (llaves equilibradas fuera de cadenas). No valida: solo delimita.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self._pos = 0
+        self._start: Optional[int] = None
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, chunk: str) -> List[str]:
+        self.buffer += chunk
+        found = []
+        while self._pos < len(self.buffer):
+            c = self.buffer[self._pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+            elif c == '"' and self._start is not None:
+                self._in_string = True
+            elif c == "{":
+                if self._start is None:
+                    self._start = self._pos
+                self._depth += 1
+            elif c == "}" and self._start is not None:
+                self._depth -= 1
+                if self._depth == 0:
+                    found.append(self.buffer[self._start : self._pos + 1])
+                    self._start = None
+            self._pos += 1
+        return found
+
+
+class DecodeStats:
+    """TTFT, cortes tempranos y métricas de evaluación del prompt que devuelve Ollama."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._streams = 0
+        self._early_stops = 0
+        self._ttft_seconds = 0.0
+        self._tokens_streamed = 0
+        self._tokens_saved = 0
+        self._eval_calls = 0
+        self._prompt_eval_tokens = 0
+        self._prompt_eval_seconds = 0.0
+        self._eval_tokens = 0
+        self._eval_seconds = 0.0
+
+    def record_stream(self, ttft: Optional[float], tokens: int, early: bool, num_predict: int):
+        with self._lock:
+            self._streams += 1
+            self._tokens_streamed += tokens
+            if ttft is not None:
+                self._ttft_seconds += ttft
+            if early:
+                self._early_stops += 1
+                # Cota superior: la generación habría seguido como mucho hasta num_predict
+                self._tokens_saved += max(0, num_predict - tokens)
+
+    def record_metadata(self, meta: Optional[dict]):
+        """`response_metadata` de Ollama: prompt_eval_count/duration y eval_count/duration (ns)."""
+        if not meta or "prompt_eval_duration" not in meta:
+            return
+        with self._lock:
+            self._eval_calls += 1
+            self._prompt_eval_tokens += meta.get("prompt_eval_count") or 0
+            self._prompt_eval_seconds += (meta.get("prompt_eval_duration") or 0) / 1e9
+            self._eval_tokens += meta.get("eval_count") or 0
+            self._eval_seconds += (meta.get("eval_duration") or 0) / 1e9
+        logging.debug(
+            f"Ollama prompt_eval={meta.get('prompt_eval_count')} tokens "
+            f"in {(meta.get('prompt_eval_duration') or 0) / 1e6:.0f}ms, "
+            f"eval={meta.get('eval_count')} tokens"
+        )
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "streams": self._streams,
+                "early_stops": self._early_stops,
+                "avg_ttft_seconds": round(self._ttft_seconds / self._streams, 3) if self._streams else 0.0,
+                "tokens_streamed": self._tokens_streamed,
+                "tokens_saved_max": self._tokens_saved,
+                "calls_with_metadata": self._eval_calls,
+                "avg_prompt_eval_tokens": (
+                    round(self._prompt_eval_tokens / self._eval_calls, 1) if self._eval_calls else 0.0
+                ),
+                "avg_prompt_eval_seconds": (
+                    round(self._prompt_eval_seconds / self._eval_calls, 3) if self._eval_calls else 0.0
+                ),
+                "avg_eval_tokens": round(self._eval_tokens / self._eval_calls, 1) if self._eval_calls else 0.0,
+                "avg_eval_seconds": round(self._eval_seconds / self._eval_calls, 3) if self._eval_calls else 0.0,
+            }
+
+
+decode_stats = DecodeStats()
+metrics.register("llm_decode", decode_stats.stats)
+
+
+def stream_until_json(chat: ChatOllama, messages, expect: Sequence[str]) -> AIMessage:
+    """
+    Como `chat.invoke`, pero en streaming: en cuanto aparece un objeto JSON completo
+    con todas las claves de `expect`, cierra el stream (Ollama deja de generar al
+    cerrarse la conexión) y devuelve solo ese JSON. Si no aparece, devuelve todo el texto.
+    """
+    scanner = JsonObjectScanner()
+    started = time.monotonic()
+    ttft = None
+    tokens = 0
+    meta: dict = {}
+    num_predict = getattr(chat, "num_predict", None) or OLLAMA_NUM_PREDICT
+
+    stream = chat.stream(messages)
+    try:
+        for chunk in stream:
+            if ttft is None:
+                ttft = time.monotonic() - started
+            tokens += 1
+            if chunk.response_metadata:
+                meta = chunk.response_metadata
+            for candidate in scanner.feed(chunk.content if isinstance(chunk.content, str) else ""):
+                try:
+                    obj = json.loads(candidate)
+                except ValueError:
+                    continue
+                if isinstance(obj, dict) and all(k in obj for k in expect):
+                    decode_stats.record_stream(ttft, tokens, True, num_predict)
+                    return AIMessage(content=candidate)
+    finally:
+        stream.close()
+
+    decode_stats.record_stream(ttft, tokens, False, num_predict)
+    decode_stats.record_metadata(meta)
+    return AIMessage(content=scanner.buffer, response_metadata=meta)
+
+
+def _templates_version() -> str:
+    """Hash de src/ai/prompts.py: si cambian las plantillas, las respuestas cacheadas no valen."""
+    spec = importlib.util.find_spec("src.ai.prompts")
+    with open(spec.origin, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()[:16]
+
+
+class LLMResponseCache:
+    """
+    Respuestas de llamadas deterministas sobre un TieredCache (LRU + SQLite).
+
+    Clave: modelo + opciones + versión de plantillas + hash de los mensajes.
+    Al arrancar con otra versión de plantillas se vacía la caché.
+    """
+
+    _VERSION_KEY = "__templates_version__"
+
+    def __init__(self, cache: TieredCache, version: str):
+        self.cache = cache
+        self.version = version
+        # La versión ya va en cada clave; vaciar solo libera lo que no volverá a leerse
+        stored = cache.get(self._VERSION_KEY)
+        if stored is not None and stored != version:
+            cache.clear()
+            logging.info(f"LLM cache cleared: prompt templates changed ({stored} -> {version})")
+        if stored != version:
+            cache.set(self._VERSION_KEY, version)
+
+    def key(self, options: dict, messages) -> str:
+        payload = json.dumps(
+            {
+                "v": self.version,
+                "options": options,
+                "messages": [(m.type, m.content) for m in messages],
+            },
+            sort_keys=True,
+            ensure_ascii=False,
+            default=str,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        return self.cache.get(key)
+
+    def set(self, key: str, content: str):
+        self.cache.set(key, content)
+
+
+class GatedChat:
+    """
+    ChatOllama cuyas llamadas `invoke` pasan por el LLMGateway; el resto se delega.
+    Si la llamada es determinista y hay `cache`, un acierto no ocupa turno en Ollama.
+    `invoke(messages, expect=("clave", ...))` decodifica en streaming y corta en
+    cuanto llega un JSON con esas claves.
+    """
+
+    # kwargs que no cambian el contenido útil de la respuesta
+    _SCHEDULING_KWARGS = {"lane", "timeout", "expect"}
+
+    def __init__(self, chat: ChatOllama, gateway: "LLMGateway", cache: Optional[LLMResponseCache] = None):
+        self.chat = chat
+        self.gateway = gateway
+        self.cache = cache if getattr(chat, "temperature", None) == 0 else None
+        self.options = {
+            name: getattr(chat, name, None)
+            for name in ("model", "temperature", "repeat_penalty", "num_predict", "format")
+        }
+
+    def invoke(self, messages, **kwargs):
+        key = None
+        if self.cache is not None and set(kwargs) <= self._SCHEDULING_KWARGS:
+            key = self.cache.key(self.options, messages)
+            cached = self.cache.get(key)
+            if cached is not None:
+                return AIMessage(content=cached)
+
+        result = self._call(messages, **kwargs)
+        if key is not None and isinstance(result.content, str):
+            self.cache.set(key, result.content)
+        return result
+
+    def _call(self, messages, expect: Optional[Sequence[str]] = None, lane=None, timeout=None, **kwargs):
+        if expect and LLM_STREAM_EARLY_STOP and not kwargs:
+            return self.gateway.run(
+                lambda: stream_until_json(self.chat, messages, expect), lane=lane, timeout=timeout
+            )
+        result = self.gateway.invoke(self.chat, messages, lane=lane, timeout=timeout, **kwargs)
+        decode_stats.record_metadata(getattr(result, "response_metadata", None))
+        return result
+
+    def __getattr__(self, name: str):
+        return getattr(self.chat, name)
+
+
+llm_gateway = LLMGateway()
+metrics.register("llm_gateway", llm_gateway.stats)
+
+llm_cache = LLMResponseCache(
+    TieredCache("llm_cache", max_entries=LLM_CACHE_SIZE, path=LLM_CACHE_PATH, ttl=LLM_CACHE_TTL),
+    _templates_version(),
+)
+
+
+def build_gated_chat(ollama_url: str | None = None, format: Any = None) -> GatedChat:
+    return GatedChat(build_chat(ollama_url, format=format), llm_gateway, cache=llm_cache)
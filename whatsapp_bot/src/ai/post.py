@@ -1,7 +1,9 @@
 # src/ai/post.py
 import re
-from typing import Iterable, Dict
+from typing import Iterable, Dict, List, Mapping, NamedTuple, Optional, Tuple
 from .schemas import MentionedItems, MentionedItem
+from .extractors import is_order_confirmation
+from src.core.catalog import normalize_code
 
 SPANISH_NUMS = {
     "uno":1,"una":1,"dos":2,"tres":3,"cuatro":4,"cinco":5,"seis":6,"siete":7,
@@ -34,3 +36,159 @@ def consolidate_items(
     for it in extracted.items:
         result[it.code] = it.qty
     return {k:v for k,v in result.items() if v > 0}
+
+
+# ---- vía rápida determinista (antes del LLM) ----
+
+WORD = re.compile(r"[A-Za-z0-9ÁÉÍÓÚÜÑáéíóúüñ-]+")
+# Cantidades escritas pegadas: x3, 3x, 3u, 3uds, 3unidades
+QTY_TOKEN = re.compile(r"[xX]\d+|\d+([xX]|u|uds?|unidades?)?", re.I)
+# Quitar del borrador solo con verbo imperativo ("quita el B20"); "sin" no basta ("B20 sin IVA")
+REMOVE_VERBS = re.compile(r"\b(quit(a|á|ad|ar)|elimin(a|á|ad|ar)|borr(a|á|ad|ar)|sac(a|á|ad|ar))\b", re.I)
+SEGMENT_SPLIT = re.compile(r"[,;\n]+|\s+y\s+|\s+e\s+", re.I)
+# Correcciones ("mejor 4 del A100"): con borrador conocido, la cantidad nueva sustituye
+CORRECTION_HINTS = re.compile(r"\b(mejor|cambi\w*|corrig\w*|correg\w*)\b", re.I)
+# Sumas / restas relativas ("2 más del A100"): siempre las resuelve el LLM
+ADDITIVE_HINTS = re.compile(r"\b(m[aá]s|menos|otr[oa]s?)\b", re.I)
+# Preguntas, negaciones y consultas (precio, stock, entrega, quejas): aunque lleven un
+# código y un número no son un pedido seguro; las decide el LLM, como dicen los prompts
+# (sin tilde, "que"/"como"/"cuando" solo cuentan al principio: "2 A100 que sean rojos")
+QUESTION = re.compile(
+    r"[?¿]|\b(qué|cuánt[oa]s?|cuándo|cómo|dónde|cuál(es)?|por qué)\b"
+    r"|^\W*(que|cuant[oa]s?|cuando|como|donde|cual(es)?|por que)\b",
+    re.I,
+)
+NEGATION = re.compile(r"\b(no|ni|nada|nunca|tampoco)\b", re.I)
+NOT_ORDER_VOCAB = re.compile(
+    r"\b(precios?|cuesta[ns]?|coste|tarifa|iva|descuentos?|ofertas?|presupuesto|"
+    r"stock|disponib\w*|existencias|ten[eé]is|tienen|tienes|hay|quedan?|"
+    r"lleg\w*|entreg\w*|env[ií]\w*|seguimiento|retras\w*|"
+    r"defectos?|defectuos\w*|rot[oa]s?|roto|da[nñ]ad\w*|devol\w*|devuelv\w*|reclam\w*|"
+    r"faltan?|problemas?|queja\w*|factura\w*)\b",
+    re.I,
+)
+SMALL_TALK = re.compile(
+    r"^[\W_]*(gracias|muchas gracias|ok|okey|vale|perfecto|genial|hola|"
+    r"buen[oa]s( d[ií]as| tardes| noches)?|adi[oó]s|hasta luego|de nada)?[\W_]*$",
+    re.I,
+)
+
+
+class FastPathResult(NamedTuple):
+    is_order: Optional[bool]  # None = dudoso, decide el LLM
+    items: Optional[MentionedItems]  # solo si el pedido se ha podido extraer entero
+    reason: str
+    removals: Tuple[str, ...] = ()  # códigos a quitar del borrador
+
+
+def _is_catalog_code(token: str, catalog: Mapping[str, object]) -> bool:
+    return normalize_code(token) in catalog
+
+
+def _is_qty_token(token: str) -> bool:
+    return bool(QTY_TOKEN.fullmatch(token)) and len(re.sub(r"\D", "", token)) <= 3
+
+
+def _segment_qtys(words: List[str], rest: str) -> List[int]:
+    qtys = [
+        int(next(g for g in m.groups() if g and g.isdigit()))
+        for m in QTY_INLINE.finditer(rest)
+        if any(g and g.isdigit() for g in m.groups())
+    ]
+    qtys += [SPANISH_NUMS[w.lower()] for w in words if w.lower() in SPANISH_NUMS]
+    return qtys
+
+
+def fast_classify(
+    message_text: str,
+    catalog: Optional[Mapping[str, object]],
+    history: str = "",
+    draft: Optional[Mapping[str, int]] = None,
+) -> FastPathResult:
+    """
+    Pre-clasificador sin LLM. Solo decide cuando no hay duda:
+    - confirmación ("Es correcto") con borrador en curso: pedido, se confirma sin LLM
+      (salvo "no es correcto" o una pregunta)
+    - no pedido: vacío, saludo/agradecimiento o sin ningún token con pinta de código
+      (preguntas, negaciones y consultas de precio/stock/entrega/quejas nunca: LLM)
+    - pedido con ítems: cada trozo ("2 x X8876287", "A100 3", "dos del B20") tiene
+      exactamente un código del catálogo y una cantidad
+    Todo lo demás (sumas, códigos desconocidos, cantidades sueltas...) va al LLM.
+    Con `draft` (pedido en curso del cliente) los ítems son cambios sobre él: una
+    corrección "mejor 4 del A100" o un "quita el B20" se extraen aquí y se aplican con
+    consolidate_items. Sin borrador, si el historial ya tiene códigos el pedido final
+    depende de él: se dice que es pedido pero la extracción se deja al LLM.
+    """
+    text = (message_text or "").strip()
+    if SMALL_TALK.fullmatch(text):
+        return FastPathResult(False, None, "small_talk")
+    if is_order_confirmation(text):
+        if draft is not None and not QUESTION.search(text) and not NEGATION.search(text):
+            return FastPathResult(True, None, "confirmation")
+        return FastPathResult(None, None, "confirmation")
+    if catalog is None:
+        return FastPathResult(None, None, "no_catalog")
+
+    words = WORD.findall(text)
+    codes = set()
+    for w in words:
+        if _is_qty_token(w) or w.isalpha():
+            if _is_catalog_code(w, catalog) and not w.isalpha():
+                return FastPathResult(None, None, "numeric_code")
+            continue
+        if not _is_catalog_code(w, catalog):
+            # Tiene dígitos y no es cantidad ni código conocido (fecha, teléfono, typo...)
+            return FastPathResult(None, None, "unknown_code")
+        codes.add(w)
+
+    if not codes:
+        if any(_is_qty_token(w) or w.lower() in SPANISH_NUMS for w in words):
+            return FastPathResult(None, None, "qty_without_code")
+        return FastPathResult(False, None, "no_codes")
+
+    if QUESTION.search(text):
+        return FastPathResult(None, None, "question")
+    if NEGATION.search(text):
+        return FastPathResult(None, None, "negation")
+    if NOT_ORDER_VOCAB.search(text):
+        return FastPathResult(None, None, "inquiry")
+
+    if ADDITIVE_HINTS.search(text):
+        return FastPathResult(True, None, "additive")
+    removal = REMOVE_VERBS.search(text)
+    if not removal and REMOVE_HINTS.search(text):
+        return FastPathResult(None, None, "remove_hint")
+    if draft is None:
+        if removal or CORRECTION_HINTS.search(text):
+            return FastPathResult(True, None, "correction")
+        if any(_is_catalog_code(w, catalog) for w in WORD.findall(history or "")):
+            return FastPathResult(True, None, "history")
+    elif removal:
+        # "quita el A100 y el B20": solo códigos, sin cantidades
+        if any(_is_qty_token(w) or w.lower() in SPANISH_NUMS for w in words):
+            return FastPathResult(True, None, "correction")
+        return FastPathResult(True, MentionedItems(items=[]), "removal", tuple(sorted(codes)))
+
+    items: Dict[str, int] = {}
+    for segment in SEGMENT_SPLIT.split(text):
+        seg_words = WORD.findall(segment)
+        seg_codes = [w for w in seg_words if w in codes]
+        rest = segment
+        for code in seg_codes:
+            rest = rest.replace(code, " ")
+        qtys = _segment_qtys(seg_words, rest)
+        if not seg_codes:
+            if qtys:
+                return FastPathResult(None, None, "qty_without_code")
+            continue
+        if len(seg_codes) != 1 or len(qtys) != 1 or seg_codes[0] in items:
+            return FastPathResult(None, None, "unparsed")
+        items[seg_codes[0]] = qtys[0]
+
+    try:
+        extracted = MentionedItems(
+            items=[MentionedItem(code=code, qty=qty) for code, qty in items.items()]
+        )
+    except ValueError:
+        return FastPathResult(None, None, "invalid_item")
+    return FastPathResult(True, extracted, "parsed" if draft is None else "draft_update")
@@ -0,0 +1,311 @@
+import heapq
+import logging
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy import desc, select
+from sqlalchemy.orm import Session
+
+from src.core import metrics
+from src.core.database import postgres_session
+from src.models.message import Message
+from src.models.user import User
+
+load_dotenv()
+MIN_MINUTES = int(os.getenv("UNATTENDED_MINUTES_MIN", 15))
+MAX_MINUTES = int(os.getenv("UNATTENDED_MINUTES_MAX", 30))
+RESYNC_SECONDS = int(os.getenv("UNATTENDED_RESYNC_SECONDS", 600))
+# Una conversación que vence hace menos de esto va por el carril LIVE
+AI_LIVE_WINDOW_SECONDS = float(os.getenv("AI_LIVE_WINDOW_SECONDS", "120"))
+# Ráfagas (texto, fotos, audio... seguidos): se espera a que el cliente calle este
+# tiempo y se atienden juntas, pero nunca más de BURST_MAX_WAIT desde el primer mensaje
+BURST_QUIET_SECONDS = float(os.getenv("AI_BURST_QUIET_SECONDS", 20))
+BURST_MAX_WAIT_SECONDS = float(os.getenv("AI_BURST_MAX_WAIT_SECONDS", 300))
+
+
+def to_aware_utc(dt: datetime) -> datetime:
+    """Convierte cualquier datetime a timezone-aware en UTC."""
+    if dt is None:
+        return None
+    if dt.tzinfo is None:
+        # Asumimos que los naive son UTC. Si en tu BD están en hora local,
+        # reemplaza por la zona correcta y luego .astimezone(timezone.utc)
+        return dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc)
+
+
+class PendingConversation(NamedTuple):
+    client_id: int
+    client_phone: str
+    user_phone: str
+    content: str
+    timestamp: datetime
+
+
+def load_unattended(
+    session: Session, since: datetime, client_id: Optional[int] = None
+) -> List[PendingConversation]:
+    """
+    Una sola consulta: último mensaje de cada cliente desde `since`, quedándose
+    con los que son 'received' con texto (si hay un 'sent' posterior, ya es el último).
+    Usa idx_messages_timestamp / idx_messages_client_ts.
+    """
+    latest = (
+        select(
+            Message.client_id,
+            Message.client_phone,
+            Message.direction,
+            Message.content,
+            Message.timestamp,
+            Message.user_id,
+        )
+        .where(Message.timestamp >= since)
+        .order_by(Message.client_id, desc(Message.timestamp))
+        .distinct(Message.client_id)
+    )
+    if client_id is not None:
+        latest = latest.where(Message.client_id == client_id)
+    latest = latest.subquery()
+
+    stmt = (
+        select(
+            latest.c.client_id,
+            latest.c.client_phone,
+            User.phone,
+            latest.c.content,
+            latest.c.timestamp,
+        )
+        .join(User, User.id == latest.c.user_id)
+        .where(latest.c.direction == "received", latest.c.content != "")
+    )
+    return [PendingConversation(*row) for row in session.execute(stmt).all()]
+
+
+class _Burst:
+    __slots__ = ("start", "messages", "extracting")
+
+    def __init__(self, start: datetime):
+        self.start = start  # primer mensaje recibido sin respuesta
+        self.messages = 0
+        self.extracting: Set[datetime] = set()  # media recibida aún sin texto
+
+
+class UnattendedScheduler:
+    """
+    Planificador de conversaciones sin atender.
+
+    Mantiene, por cliente, el timestamp del último mensaje recibido sin respuesta y un
+    min-heap con el instante en que entra en la ventana [MIN, MAX]. El ingest lo alimenta
+    con `notify`; cada RESYNC_SECONDS se rehidrata desde BD por si se perdió algún evento.
+
+    Cada mensaje nuevo aplaza la conversación (debounce), así que una ráfaga se despacha
+    una sola vez; el tope `burst_max_wait` desde el primer mensaje evita aplazarla sin fin
+    y, mientras quede media de la ráfaga por extraer, se retiene hasta ese mismo tope.
+    """
+
+    def __init__(
+        self,
+        min_minutes: int = MIN_MINUTES,
+        max_minutes: int = MAX_MINUTES,
+        resync_seconds: int = RESYNC_SECONDS,
+        burst_quiet_seconds: float = BURST_QUIET_SECONDS,
+        burst_max_wait_seconds: float = BURST_MAX_WAIT_SECONDS,
+    ):
+        self.min_delta = timedelta(minutes=min_minutes)
+        self.max_delta = timedelta(minutes=max_minutes)
+        self.resync_delta = timedelta(seconds=resync_seconds)
+        self.quiet_delta = timedelta(seconds=burst_quiet_seconds)
+        self.max_wait_delta = timedelta(seconds=burst_max_wait_seconds)
+
+        self._heap: List[Tuple[datetime, int, datetime]] = []
+        self._pending: Dict[int, datetime] = {}  # client_id -> ts último recibido
+        self._handled: Dict[int, datetime] = {}  # client_id -> ts ya atendido
+        self._bursts: Dict[int, _Burst] = {}  # client_id -> ráfaga sin atender
+        # client_id -> ts ya atendido sin texto que se vuelve a programar al extraerlo
+        self._rearmed: Dict[int, datetime] = {}
+        self._cond = threading.Condition()
+        self._next_resync = datetime.min.replace(tzinfo=timezone.utc)
+
+        self._woken = 0
+        self._dispatched = 0
+        self._expired = 0
+        self._resyncs = 0
+        self._bursts_dispatched = 0
+        self._burst_messages = 0
+        self._held = 0
+
+    def _cap(self, burst: _Burst) -> datetime:
+        return burst.start + self.min_delta + self.max_wait_delta
+
+    def _due(self, burst: _Burst, ts: datetime) -> datetime:
+        return min(ts + max(self.min_delta, self.quiet_delta), self._cap(burst))
+
+    # ---- entrada desde el ingest ----
+    def notify(self, client_id: int, direction: str, timestamp: datetime):
+        ts = to_aware_utc(timestamp)
+        with self._cond:
+            if direction == "received":
+                if self._handled.get(client_id) == ts:
+                    return
+                current = self._pending.get(client_id)
+                if current is None or ts > current:
+                    burst = self._bursts.get(client_id)
+                    if burst is None:
+                        burst = self._bursts[client_id] = _Burst(ts)
+                    burst.messages += 1
+                    self._pending[client_id] = ts
+                    heapq.heappush(self._heap, (self._due(burst, ts), client_id, ts))
+                    self._cond.notify()
+            elif direction == "sent":
+                current = self._pending.get(client_id)
+                if current is not None and ts > current:
+                    # Respondido: la entrada del heap queda obsoleta y se descarta al salir.
+                    del self._pending[client_id]
+                    self._bursts.pop(client_id, None)
+                    self._rearmed.pop(client_id, None)
+
+    def expect_content(self, client_id: int, direction: str, timestamp: datetime):
+        """Un mensaje recibido tiene media en extracción: la ráfaga espera a su texto."""
+        if direction != "received":
+            return
+        with self._cond:
+            burst = self._bursts.get(client_id)
+            if burst is not None:
+                burst.extracting.add(to_aware_utc(timestamp))
+
+    def content_unavailable(self, client_id: int, direction: str, timestamp: datetime):
+        """La extracción terminó sin texto: no hay nada que esperar."""
+        with self._cond:
+            burst = self._bursts.get(client_id)
+            if burst is not None:
+                burst.extracting.discard(to_aware_utc(timestamp))
+
+    def content_available(
+        self, client_id: int, direction: str, timestamp: datetime, rearm: bool = True
+    ):
+        """
+        Un mensaje recibido acaba de obtener texto (OCR, audio, documento).
+        Si ya se había despachado sin texto, se vuelve a programar y el handler lo
+        recibe con rearm=True (mismo ts: la cola tiene que aceptarlo igualmente).
+        """
+        if direction != "received":
+            return
+        ts = to_aware_utc(timestamp)
+        with self._cond:
+            burst = self._bursts.get(client_id)
+            if burst is not None:
+                burst.extracting.discard(ts)
+            if rearm and self._handled.get(client_id) == ts:
+                del self._handled[client_id]
+                self._rearmed[client_id] = ts
+            if self._pending.get(client_id) == ts:
+                return  # sigue pendiente; al vencer ya verá el texto
+            current = self._pending.get(client_id)
+            if self._handled.get(client_id) == ts or (current is not None and current > ts):
+                return
+            self._pending[client_id] = ts
+            due = max(ts + self.min_delta, datetime.now(timezone.utc))
+            heapq.heappush(self._heap, (due, client_id, ts))
+            self._cond.notify()
+
+    # ---- hidratación ----
+    def resync(self, session: Session):
+        now = datetime.now(timezone.utc)
+        rows = load_unattended(session, now - self.max_delta)
+        with self._cond:
+            self._resyncs += 1
+            # Olvidamos lo atendido que ya salió de la ventana
+            horizon = now - self.max_delta
+            self._handled = {c: t for c, t in self._handled.items() if t >= horizon}
+            self._rearmed = {c: t for c, t in self._rearmed.items() if t >= horizon}
+            for row in rows:
+                self.notify(row.client_id, "received", row.timestamp)
+            self._next_resync = now + self.resync_delta
+        logging.info(f"Unattended scheduler resync: {len(rows)} pending conversations")
+
+    def _next(self) -> Optional[Tuple[int, datetime, bool]]:
+        """
+        Bloquea hasta que vence la siguiente conversación (o toca resync -> None).
+        Devuelve (client_id, ts, rearm): rearm si es un reenvío de `content_available`.
+        """
+        with self._cond:
+            while True:
+                now = datetime.now(timezone.utc)
+                if now >= self._next_resync:
+                    return None
+
+                while self._heap and self._heap[0][0] <= now:
+                    _, client_id, ts = heapq.heappop(self._heap)
+                    if self._pending.get(client_id) != ts:
+                        continue  # obsoleta: respondida o llegó otro mensaje
+                    burst = self._bursts.get(client_id)
+                    if burst is not None and burst.extracting and now < self._cap(burst):
+                        # Falta el texto de alguna foto/audio de la ráfaga
+                        self._held += 1
+                        retry = min(now + self.quiet_delta, self._cap(burst))
+                        heapq.heappush(self._heap, (retry, client_id, ts))
+                        continue
+                    del self._pending[client_id]
+                    self._bursts.pop(client_id, None)
+                    rearm = self._rearmed.pop(client_id, None) == ts
+                    self._handled[client_id] = ts
+                    self._woken += 1
+                    if now - ts > self.max_delta:
+                        self._expired += 1
+                        continue
+                    self._bursts_dispatched += 1
+                    self._burst_messages += burst.messages if burst is not None else 1
+                    return client_id, ts, rearm
+
+                wake_at = self._next_resync
+                if self._heap:
+                    wake_at = min(wake_at, self._heap[0][0])
+                self._cond.wait((wake_at - now).total_seconds())
+
+    def run(self, handler: Callable[..., None]):
+        """
+        Llama a `handler(client_id, ts, rearm=...)` con cada conversación que vence
+        (ts: último recibido; rearm: ya se despachó con ese ts, antes de tener su texto).
+        """
+        while True:
+            try:
+                item = self._next()
+                if item is None:
+                    with postgres_session() as session:
+                        self.resync(session)
+                    continue
+                client_id, ts, rearm = item
+                self._dispatched += 1
+                handler(client_id, ts, rearm=rearm)
+            except Exception as e:
+                logging.exception(f"Error en el planificador de mensajes no atendidos: {e}")
+                with self._cond:
+                    # Evita bucles calientes si la BD no responde
+                    self._cond.wait(5)
+
+    def stats(self) -> dict:
+        with self._cond:
+            next_due = self._heap[0][0].isoformat() if self._heap else None
+            return {
+                "pending": len(self._pending),
+                "heap": len(self._heap),
+                "next_due": next_due,
+                "woken": self._woken,
+                "dispatched": self._dispatched,
+                "expired": self._expired,
+                "resyncs": self._resyncs,
+                "bursts": len(self._bursts),
+                "held_for_media": self._held,
+                "messages_per_dispatch": (
+                    round(self._burst_messages / self._bursts_dispatched, 2)
+                    if self._bursts_dispatched
+                    else 0.0
+                ),
+            }
+
+
+unattended_scheduler = UnattendedScheduler()
+metrics.register("unattended", unattended_scheduler.stats)
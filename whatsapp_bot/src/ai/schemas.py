@@ -27,3 +27,10 @@ class OrderYesNo(BaseModel):
 class ChatDecision(BaseModel):
     responder: bool
     respuesta: Optional[str] = None
+
+class AgentTurn(BaseModel):
+    """Salida del modo de una sola llamada: intención de pedido, ítems y respuesta."""
+    order: bool = False
+    items: List[MentionedItem] = Field(default_factory=list)
+    responder: bool = False
+    respuesta: Optional[str] = None
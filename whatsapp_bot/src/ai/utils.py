@@ -11,9 +11,10 @@ import logging
 import os
 import re
 
-from src.models.product import Articulo
+from src.core.catalog import product_catalog
 from src.models.message import Message
-from src.media.sftp import find_image_file, build_order_image_table
+from src.media.sftp import build_order_image_table
+from src.media.thumbs import get_thumbnails
 
 def update_order(
     session: Session, productos: List[Tuple[str, str]]
@@ -33,13 +34,16 @@ def update_order(
         return None
 
     items = []
+    articulos = product_catalog.get_many(session, [codigo for codigo, _ in productos])
+
+    images = get_thumbnails([codigo for codigo, _ in productos])
 
     for codigo, cantidad in productos:
-        articulo = Articulo.get_by_codigo(session, codigo)
+        articulo = articulos.get(codigo)
         descripcion = (
             articulo.descripcion1 if articulo else "Sin coincidencia de Articulos"
         )
-        img_bytes = find_image_file(codigo)
+        img_bytes = images.get(codigo)
         items.append((codigo, cantidad or "", descripcion, img_bytes))
 
     return build_order_image_table(items)
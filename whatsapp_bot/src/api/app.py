@@ -1,17 +1,25 @@
 # src/api/app.py
 from fastapi import FastAPI, HTTPException, UploadFile, Response, File, Form, Depends, Header
+from fastapi.responses import StreamingResponse
 import secrets
 from pydantic import BaseModel, constr
 from typing import Optional, List
 import tempfile
 import qrcode
+import asyncio
 import base64
+import json
 import logging
 import os
 
-from src.grpc.client import create_grpc_stub
-from src.proto.whatsapp_pb2 import Empty, SendRequest, DeviceID
-from src.core.database import get_postgres_session
+from starlette.concurrency import run_in_threadpool
+
+from src.grpc.client import create_async_stub
+from src.grpc.devices import device_registry
+from src.proto.whatsapp_pb2 import Empty, DeviceID
+from src.whatsapp.outbox import BatchTracker, queue_batch, queue_file, queue_message
+from src.core.database import postgres_session
+from src.core import metrics
 from src.models.user import User
 from src.mail.mail_handler import send_qr_email
 
@@ -23,6 +31,7 @@ app = FastAPI(
 )
 
 # ---- gRPC stub lazy singleton ----
+# Stub async sobre el canal grpc.aio del proceso (el mismo que usan listener e IA).
 _STUB = None
 def get_stub():
     global _STUB
@@ -31,7 +40,7 @@ def get_stub():
         grpc_port = os.getenv("GRPC_PORT", None)
         if grpc_port:
             grpc_port = int(grpc_port)
-        _STUB = create_grpc_stub(grpc_host, grpc_port)
+        _STUB = create_async_stub(grpc_host, grpc_port)
     return _STUB
 
 
@@ -56,11 +65,25 @@ class SendMessageBody(BaseModel):
     text: constr(strip_whitespace=True, min_length=1, max_length=4096) # type: ignore
     from_jid: Optional[constr(strip_whitespace=True, min_length=5, max_length=128)] = None # type: ignore
 
+class BatchMessageItem(BaseModel):
+    to: constr(strip_whitespace=True, min_length=5, max_length=64) # type: ignore
+    text: Optional[constr(strip_whitespace=True, min_length=1, max_length=4096)] = None # type: ignore
+
+class SendBatchBody(BaseModel):
+    from_jid: constr(strip_whitespace=True, min_length=5, max_length=128) # type: ignore
+    # texto común para `to` y para los `messages` sin texto propio
+    text: Optional[constr(strip_whitespace=True, min_length=1, max_length=4096)] = None # type: ignore
+    to: List[constr(strip_whitespace=True, min_length=5, max_length=64)] = [] # type: ignore
+    messages: List[BatchMessageItem] = []
+
+# Cada cuánto se consulta el estado de un envío masivo en GET /messages/batch/{job_id}
+BATCH_STATUS_POLL_SECONDS = float(os.getenv("BATCH_STATUS_POLL_SECONDS", "1"))
+
 
 # ======= ENDPOINTS EQUIVALENTES A COMANDOS =======
 
 @app.post("/login", dependencies=[Depends(auth_required)])
-def login():
+async def login():
     """
     Equivale a comando `login`:
     - Llama StartLogin.
@@ -68,10 +91,11 @@ def login():
     """
     stub = get_stub()
     try:
-        resp = stub.StartLogin(Empty())
+        resp = await stub.StartLogin(Empty())
     except Exception as e:
         logging.exception("gRPC StartLogin falló")
         raise HTTPException(status_code=502, detail=f"gRPC error: {e}")
+    device_registry.invalidate("login")
 
     status = getattr(resp, "status", None)
     if status == "already_connected":
@@ -97,116 +121,123 @@ def login():
 
 
 @app.post("/loginqr", dependencies=[Depends(auth_required)])
-def login_qr(body: LoginQrBody):
+async def login_qr(body: LoginQrBody):
     """
     Equivale a `loginqr`:
     - StartLogin -> si code: busca el email por `to` y envía el QR por email.
     """
     stub = get_stub()
     try:
-        resp = stub.StartLogin(Empty())
+        resp = await stub.StartLogin(Empty())
     except Exception as e:
         logging.exception("gRPC StartLogin falló")
         raise HTTPException(status_code=502, detail=f"gRPC error: {e}")
+    device_registry.invalidate("login")
 
     if resp.status == "already_connected":
         return {"status": "already_connected"}
 
     if resp.status == "code":
-        session = get_postgres_session()
-        try:
-            user = User.get_by_phone(session, body.to)
-            if not user:
-                raise HTTPException(status_code=404, detail=f"No se encontró usuario con phone={body.to}")
-
-            with tempfile.NamedTemporaryFile(suffix=".jpg", delete=False) as tmp:
-                qr_path = tmp.name
-            try:
-                img = qrcode.make(resp.code)
-                img.save(qr_path, format="JPEG")
-                send_qr_email(user.email, qr_path)
-                return {"status": "sent", "email": user.email}
-            finally:
-                try:
-                    os.remove(qr_path)
-                except Exception:
-                    pass
-        finally:
-            session.close()
+        # BD + SMTP son bloqueantes: fuera del event loop
+        return await run_in_threadpool(_send_qr_to_user, body.to, resp.code)
 
     raise HTTPException(status_code=502, detail=f"Estado de login no manejado: {resp.status}")
 
 
+def _send_qr_to_user(to: str, code: str):
+    with postgres_session() as session:
+        user = User.get_by_phone(session, to)
+        if not user:
+            raise HTTPException(status_code=404, detail=f"No se encontró usuario con phone={to}")
+
+        with tempfile.NamedTemporaryFile(suffix=".jpg", delete=False) as tmp:
+            qr_path = tmp.name
+        try:
+            img = qrcode.make(code)
+            img.save(qr_path, format="JPEG")
+            send_qr_email(user.email, qr_path)
+            return {"status": "sent", "email": user.email}
+        finally:
+            try:
+                os.remove(qr_path)
+            except Exception:
+                pass
+
+
 @app.post("/loginqr_all", dependencies=[Depends(auth_required)])
-def login_qr_all():
+async def login_qr_all():
     """
     Equivale a `loginqr_all`: envía el QR a todos los admins.
     """
     stub = get_stub()
     try:
-        resp = stub.StartLogin(Empty())
+        resp = await stub.StartLogin(Empty())
     except Exception as e:
         logging.exception("gRPC StartLogin falló")
         raise HTTPException(status_code=502, detail=f"gRPC error: {e}")
+    device_registry.invalidate("login")
 
     if resp.status == "already_connected":
         return {"status": "already_connected"}
 
     if resp.status == "code":
-        session = get_postgres_session()
-        try:
-            admins = User.get_admins(session) or []
-            if not admins:
-                return {"status": "no_admins"}
-            with tempfile.NamedTemporaryFile(suffix=".jpg", delete=False) as tmp:
-                qr_path = tmp.name
-            try:
-                img = qrcode.make(resp.code)
-                img.save(qr_path, format="JPEG")
-                count = 0
-                sent_to: List[str] = []
-                for adm in admins:
-                    send_qr_email(adm.email, qr_path)
-                    sent_to.append(adm.email)
-                    count += 1
-                return {"status": "sent", "count": count, "emails": sent_to}
-            finally:
-                try:
-                    os.remove(qr_path)
-                except Exception:
-                    pass
-        finally:
-            session.close()
+        return await run_in_threadpool(_send_qr_to_admins, resp.code)
 
     raise HTTPException(status_code=502, detail=f"Estado de login no manejado: {resp.status}")
 
 
+def _send_qr_to_admins(code: str):
+    with postgres_session() as session:
+        admins = User.get_admins(session) or []
+        if not admins:
+            return {"status": "no_admins"}
+        with tempfile.NamedTemporaryFile(suffix=".jpg", delete=False) as tmp:
+            qr_path = tmp.name
+        try:
+            img = qrcode.make(code)
+            img.save(qr_path, format="JPEG")
+            count = 0
+            sent_to: List[str] = []
+            for adm in admins:
+                send_qr_email(adm.email, qr_path)
+                sent_to.append(adm.email)
+                count += 1
+            return {"status": "sent", "count": count, "emails": sent_to}
+        finally:
+            try:
+                os.remove(qr_path)
+            except Exception:
+                pass
+
+
 @app.get("/devices", dependencies=[Depends(auth_required)])
-def list_devices():
+async def list_devices():
     """
     Equivale a `list`: devuelve jids registrados.
     """
     stub = get_stub()
     try:
-        resp = stub.ListDevices(Empty())
+        resp = await stub.ListDevices(Empty())
     except Exception as e:
         logging.exception("gRPC ListDevices falló")
         raise HTTPException(status_code=502, detail=f"gRPC error: {e}")
+    device_registry.update(d.jid for d in resp.devices)
 
     return {"devices": [{"jid": d.jid} for d in resp.devices]}
 
 
 @app.delete("/devices/{jid}", dependencies=[Depends(auth_required)])
-def delete_device(jid: str):
+async def delete_device(jid: str):
     """
     Equivale a `delete`: elimina dispositivo por JID.
     """
     stub = get_stub()
     try:
-        resp = stub.DeleteDevice(DeviceID(jid=jid))
+        resp = await stub.DeleteDevice(DeviceID(jid=jid))
     except Exception as e:
         logging.exception("gRPC DeleteDevice falló")
         raise HTTPException(status_code=502, detail=f"gRPC error: {e}")
+    device_registry.invalidate("device deleted")
 
     if resp.success:
         return {"status": "deleted", "jid": jid}
@@ -214,46 +245,110 @@ def delete_device(jid: str):
 
 
 @app.post("/messages", dependencies=[Depends(auth_required)])
-def send_message(body: SendMessageBody):
+async def send_message(body: SendMessageBody):
     """
-    Equivale a `send`: envía texto. Valida que from_jid esté conectado.
+    Equivale a `send`: encola el texto en la outbox y responde en cuanto es durable.
+    Valida que from_jid esté conectado; el envío lo hacen los sender workers.
     """
     stub = get_stub()
 
     if not body.from_jid:
         raise HTTPException(status_code=422, detail="from_jid es obligatorio")
 
-    # validar from_jid
+    # validar from_jid (caché de dispositivos, sin ListDevices por envío)
     try:
-        devices = stub.ListDevices(Empty()).devices
-        device_jids = {d.jid for d in devices}
+        connected = await device_registry.is_connected_async(stub, body.from_jid)
     except Exception as e:
         logging.exception("gRPC ListDevices falló")
         raise HTTPException(status_code=502, detail=f"gRPC error: {e}")
 
-    if body.from_jid not in device_jids:
+    if not connected:
         raise HTTPException(status_code=400, detail=f"from_jid {body.from_jid} no está conectado")
 
-    req = SendRequest(to=body.to, text=body.text, from_jid=body.from_jid)
     try:
-        resp = stub.SendMessage(req)
+        message_id = await run_in_threadpool(queue_message, body.to, body.text, body.from_jid)
     except Exception as e:
-        logging.exception("gRPC SendMessage falló")
+        logging.exception("No se pudo encolar el mensaje")
+        raise HTTPException(status_code=503, detail=f"outbox error: {e}")
+
+    return {"status": "queued", "id": message_id, "to": body.to}
+
+
+@app.post("/messages/batch", dependencies=[Depends(auth_required)])
+async def send_message_batch(body: SendBatchBody):
+    """
+    Equivale a `sendbatch`: encola muchos mensajes de un mismo dispositivo en una
+    sola petición (un INSERT, una validación de from_jid). Devuelve un job_id;
+    el estado por destinatario se sigue en GET /messages/batch/{job_id}.
+    """
+    items = [(to, body.text) for to in body.to]
+    items += [(m.to, m.text or body.text) for m in body.messages]
+    if any(text is None for _, text in items):
+        raise HTTPException(status_code=422, detail="falta el texto (común o por mensaje)")
+    if not items:
+        raise HTTPException(status_code=422, detail="sin destinatarios")
+
+    stub = get_stub()
+    try:
+        connected = await device_registry.is_connected_async(stub, body.from_jid)
+    except Exception as e:
+        logging.exception("gRPC ListDevices falló")
         raise HTTPException(status_code=502, detail=f"gRPC error: {e}")
 
-    if resp.success:
-        return {"status": "sent", "to": body.to}
-    raise HTTPException(status_code=400, detail=resp.error or "send failed")
+    if not connected:
+        raise HTTPException(status_code=400, detail=f"from_jid {body.from_jid} no está conectado")
+
+    try:
+        job_id, ids = await run_in_threadpool(queue_batch, body.from_jid, items)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except Exception as e:
+        logging.exception("No se pudo encolar el envío masivo")
+        raise HTTPException(status_code=503, detail=f"outbox error: {e}")
+
+    return {
+        "status": "queued",
+        "job_id": job_id,
+        "queued": len(ids),
+        "status_url": f"/messages/batch/{job_id}",
+    }
+
+
+@app.get("/messages/batch/{job_id}", dependencies=[Depends(auth_required)])
+async def message_batch_status(job_id: str, follow: bool = True):
+    """
+    Estado de un envío masivo en NDJSON: una línea por destinatario cada vez que
+    cambia su estado y una línea final {"summary": ...}. Con follow=false devuelve
+    la foto actual; si no, mantiene la respuesta abierta hasta que todos terminan.
+    """
+    tracker = BatchTracker(job_id)
+    changes, summary = await run_in_threadpool(tracker.poll)
+    if not summary["total"]:
+        raise HTTPException(status_code=404, detail=f"job {job_id} no existe")
+
+    async def _lines():
+        nonlocal changes, summary
+        while True:
+            for line in changes:
+                yield json.dumps(line) + "\n"
+            if summary["done"] or not follow:
+                yield json.dumps({"summary": summary}) + "\n"
+                return
+            await asyncio.sleep(BATCH_STATUS_POLL_SECONDS)
+            changes, summary = await run_in_threadpool(tracker.poll)
+
+    return StreamingResponse(_lines(), media_type="application/x-ndjson")
 
 
 @app.post("/files", dependencies=[Depends(auth_required)])
-def send_file(
+async def send_file(
     to: str = Form(...),
     from_jid: Optional[str] = Form(None),
     file: UploadFile = File(...)
 ):
     """
     Equivale a `sendfile`: multipart/form-data con campos to, from_jid y file.
+    El fichero se copia a la outbox y se responde en cuanto está encolado.
     """
     stub = get_stub()
 
@@ -262,37 +357,32 @@ def send_file(
         raise HTTPException(status_code=422, detail="from_jid es obligatorio")
 
     try:
-        devices = stub.ListDevices(Empty()).devices
-        device_jids = {d.jid for d in devices}
+        connected = await device_registry.is_connected_async(stub, from_jid)
     except Exception as e:
         logging.exception("gRPC ListDevices falló")
         raise HTTPException(status_code=502, detail=f"gRPC error: {e}")
 
-    if from_jid not in device_jids:
+    if not connected:
         raise HTTPException(status_code=400, detail=f"from_jid {from_jid} no está conectado")
 
-    # leer binario
-    binary = file.file.read()
-    req = SendRequest(
-        to=to,
-        text=file.filename or "file",
-        binary=binary,
-        filename=file.filename or "upload.bin",
-        from_jid=from_jid,
-    )
-
+    # Se copia por trozos desde el fichero temporal de la subida (sin leerlo entero)
     try:
-        resp = stub.SendMessage(req)
+        message_id = await run_in_threadpool(
+            queue_file,
+            to,
+            file.file,
+            from_jid,
+            filename=file.filename or "upload.bin",
+            text=file.filename or "file",
+        )
     except Exception as e:
-        logging.exception("gRPC SendMessage falló")
-        raise HTTPException(status_code=502, detail=f"gRPC error: {e}")
+        logging.exception("No se pudo encolar el fichero")
+        raise HTTPException(status_code=503, detail=f"outbox error: {e}")
 
-    if resp.success:
-        return {"status": "sent", "to": to, "filename": file.filename}
-    raise HTTPException(status_code=400, detail=resp.error or "send file failed")
+    return {"status": "queued", "id": message_id, "to": to, "filename": file.filename}
 
 @app.delete("/devices/{jid}", dependencies=[Depends(auth_required)])
-def delete_device(jid: str):
+async def delete_device(jid: str):
     """
     Equivale al comando `delete --jid <JID>`:
     - Elimina el dispositivo por JID vía gRPC.
@@ -300,11 +390,20 @@ def delete_device(jid: str):
     """
     stub = get_stub()
     try:
-        resp = stub.DeleteDevice(DeviceID(jid=jid))
+        resp = await stub.DeleteDevice(DeviceID(jid=jid))
     except Exception as e:
         logging.exception("gRPC DeleteDevice falló")
         raise HTTPException(status_code=502, detail=f"gRPC error: {e}")
+    device_registry.invalidate("device deleted")
 
     if resp.success:
         return Response(status_code=204)
     raise HTTPException(status_code=400, detail=resp.error or "delete failed")
+
+
+@app.get("/stats", dependencies=[Depends(auth_required)])
+def stats():
+    """
+    Métricas internas del proceso (pools de BD, colas, cachés).
+    """
+    return metrics.snapshot()
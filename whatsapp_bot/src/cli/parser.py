@@ -11,6 +11,9 @@ def build_parser():
 
     # --- nuevo: start (API + IA + listener) ---
     subparsers.add_parser("start", help="Start API server and listener")
+    subparsers.add_parser(
+        "aiworker", help="Only attend queued AI jobs (scale out across hosts / Ollama servers)"
+    )
 
     send_parser = subparsers.add_parser("send", help="Send a text message")
     send_parser.add_argument("--to", required=True, help="Recipient phone number")
@@ -22,6 +25,20 @@ def build_parser():
     file_parser.add_argument("--file", required=True, help="Path to the file")
     file_parser.add_argument("--from", dest="from_jid", help="Device JID (optional)")
 
+    batch_parser = subparsers.add_parser(
+        "sendbatch", help="Queue a text message to many recipients (bulk send)"
+    )
+    batch_parser.add_argument(
+        "--file", required=True,
+        help="Recipients file: one phone per line, or CSV 'phone,text' for per-recipient texts",
+    )
+    batch_parser.add_argument("--text", help="Common text for recipients without their own")
+    batch_parser.add_argument("--from", dest="from_jid", required=True, help="Device JID")
+    batch_parser.add_argument(
+        "--no-follow", dest="follow", action="store_false",
+        help="Do not wait for per-recipient delivery status",
+    )
+
     delete_parser = subparsers.add_parser("delete", help="Delete a device")
     delete_parser.add_argument("--jid", required=True, help="Device JID to remove")
 
@@ -30,4 +47,8 @@ def build_parser():
 
     subparsers.add_parser("loginqr_all", help="Enviar QR a todos los administradores")
 
+    subparsers.add_parser(
+        "warm_thumbs", help="Precalentar la caché de miniaturas con el catálogo activo"
+    )
+
     return parser
@@ -0,0 +1,75 @@
+import logging
+import os
+from typing import Dict, Iterable, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from src.core.database import sqlserver_session
+from src.core.snapshot import SnapshotIndex
+from src.models.product import Articulo
+
+load_dotenv()
+CATALOG_REFRESH_SECONDS = int(os.getenv("CATALOG_REFRESH_SECONDS", "300"))
+
+
+def normalize_code(codigo: str) -> str:
+    """Misma normalización que Articulo.get_by_codigo: trim, mayúsculas, sin ceros a la izquierda."""
+    return str(codigo).strip().upper().lstrip("0")
+
+
+class ProductCatalog(SnapshotIndex[Dict[str, Articulo]]):
+    """
+    Índice de Articulos (con filtros_basura) por código normalizado.
+
+    Los Articulo devueltos son instancias desligadas de sesión con codigo y descripcion1.
+    """
+
+    def _load(
+        self, session: Session, current: Optional[Dict[str, Articulo]]
+    ) -> Dict[str, Articulo]:
+        rows = session.execute(
+            select(Articulo.codigo, Articulo.descripcion1).where(Articulo.filtros_basura())
+        ).all()
+
+        current = current or {}
+        index: Dict[str, Articulo] = {}
+        added = changed = 0
+        for codigo, descripcion in rows:
+            key = normalize_code(codigo)
+            if not key or key in index:
+                continue
+            prev = current.get(key)
+            if prev is not None and prev.codigo == codigo and prev.descripcion1 == descripcion:
+                index[key] = prev  # sin cambios: se reutiliza la instancia
+                continue
+            if prev is None:
+                added += 1
+            else:
+                changed += 1
+            index[key] = Articulo(codigo=codigo, descripcion1=descripcion)
+
+        removed = sum(1 for key in current if key not in index)
+        if current:
+            logging.info(f"{self.name} delta: +{added} ~{changed} -{removed}")
+        return index
+
+    def get(self, session: Session, codigo: str) -> Optional[Articulo]:
+        return self.get_many(session, [codigo]).get(codigo)
+
+    def get_many(self, session: Session, codigos: Iterable[str]) -> Dict[str, Optional[Articulo]]:
+        """
+        Devuelve {codigo_pedido: Articulo | None}. Sin ida y vuelta al ERP si el índice
+        está cargado; si no lo está (ERP caído al arrancar) consulta uno a uno.
+        """
+        codigos = list(codigos)
+        if self.ensure_loaded():
+            index = self.state
+            return {c: index.get(normalize_code(c)) for c in codigos}
+
+        logging.warning(f"{self.name} not loaded; falling back to Articulo.get_by_codigo")
+        return {c: Articulo.get_by_codigo(session, c) for c in codigos}
+
+
+product_catalog = ProductCatalog("catalog", sqlserver_session, CATALOG_REFRESH_SECONDS)
@@ -0,0 +1,59 @@
+import os
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy.orm import Session
+
+from src.core.database import sqlserver_session
+from src.core.snapshot import SnapshotIndex
+from src.models.client import Cliente
+from src.models.user import digits_only
+
+load_dotenv()
+CLIENT_INDEX_REFRESH_SECONDS = int(os.getenv("CLIENT_INDEX_REFRESH_SECONDS", "600"))
+PHONE_KEY_DIGITS = 9  # número nacional español; lo que queda tras quitar el prefijo
+
+PhoneMap = Dict[str, List[Tuple[str, Cliente]]]
+
+
+class ClientPhoneIndex(SnapshotIndex[PhoneMap]):
+    """
+    Índice de Clientes por los últimos 9 dígitos de Telefono/Telefono2/Telefono3.
+
+    Un número coincide si uno de los dos (solo dígitos) termina en el otro, así
+    '34688773722' encuentra '688 77 37 22' y viceversa.
+    """
+
+    def _load(self, session: Session, current: Optional[PhoneMap]) -> PhoneMap:
+        # Al cerrar la sesión las instancias quedan desligadas con sus columnas cargadas.
+        clientes = session.query(Cliente).order_by(Cliente.codigo_cliente).all()
+        index: PhoneMap = {}
+        for cliente in clientes:
+            for raw in (cliente.telefono1, cliente.telefono2, cliente.telefono3):
+                digits = digits_only(raw or "")
+                if len(digits) < PHONE_KEY_DIGITS:
+                    continue
+                index.setdefault(digits[-PHONE_KEY_DIGITS:], []).append((digits, cliente))
+        return index
+
+    def lookup(self, telefono: str) -> Optional[Cliente]:
+        index = self.state
+        query = digits_only(telefono)
+        if index is None or not query:
+            return None
+
+        if len(query) >= PHONE_KEY_DIGITS:
+            candidates = index.get(query[-PHONE_KEY_DIGITS:], ())
+        else:
+            # Número corto (extensiones, fijos raros): recorrido completo, poco habitual
+            candidates = [c for bucket in index.values() for c in bucket]
+
+        for digits, cliente in candidates:
+            if digits.endswith(query) or query.endswith(digits):
+                return cliente
+        return None
+
+
+client_phone_index = ClientPhoneIndex(
+    "client_phones", sqlserver_session, CLIENT_INDEX_REFRESH_SECONDS
+)
@@ -1,36 +1,244 @@
 import os
-import urllib
+import time
+import logging
+import threading
+import urllib.parse
+from contextlib import contextmanager
+from typing import ContextManager, Dict, Iterator
+
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import QueuePool
+
+from src.core import metrics
 
 load_dotenv()  # Carga variables desde .env
 
+# --- Pool: un engine por backend y por proceso ---
+# El listener, el loop de IA y la API comparten estos pools, dimensiónalos juntos.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+SQLSERVER_FAST_EXECUTEMANY = os.getenv("SQLSERVER_FAST_EXECUTEMANY", "1") == "1"
+
+_ENGINES: Dict[str, Engine] = {}
+_SESSION_FACTORIES: Dict[str, sessionmaker] = {}
+_POOL_STATS: Dict[str, "PoolStats"] = {}
+_LOCK = threading.Lock()
+
+
+class PoolStats:
+    """Contadores de checkout/espera de un pool (thread-safe)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.checkins = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record_wait(self, seconds: float):
+        with self._lock:
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+
+    def incr(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "connects": self.connects,
+                "invalidations": self.invalidations,
+                "timeouts": self.timeouts,
+                "wait_avg_ms": round(1000 * self.wait_total / self.checkouts, 2)
+                if self.checkouts
+                else 0.0,
+                "wait_max_ms": round(1000 * self.wait_max, 2),
+            }
+
+
+class _TimedQueuePool(QueuePool):
+    """QueuePool que mide cuánto espera cada checkout por una conexión libre."""
+
+    stats: PoolStats
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except Exception:
+            self.stats.incr("timeouts")
+            raise
+        finally:
+            self.stats.record_wait(time.perf_counter() - start)
 
-def get_sqlserver_session():
+    def recreate(self):
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+
+def _sqlserver_url() -> str:
     user = os.getenv("SQLSERVER_USER")
     password = urllib.parse.quote_plus(os.getenv("SQLSERVER_PASSWORD"))
     host = os.getenv("SQLSERVER_HOST")
     db = os.getenv("SQLSERVER_DB")
+    return f"mssql+pyodbc://{user}:{password}@{host}/{db}?driver=ODBC+Driver+17+for+SQL+Server"
 
-    conn_str = f"mssql+pyodbc://{user}:{password}@{host}/{db}?driver=ODBC+Driver+17+for+SQL+Server"
-    engine = create_engine(conn_str)
-    return sessionmaker(bind=engine)()
 
-
-def get_sqlite_session():
-    path = os.getenv("SQLITE_PATH", "./db.sqlite3")
-    engine = create_engine(f"sqlite:///{path}")
-    return sessionmaker(bind=engine)()
-
-
-def get_postgres_session():
+def _postgres_url() -> str:
     user = os.getenv("POSTGRES_USER")
     password = os.getenv("POSTGRES_PASSWORD")
     host = os.getenv("POSTGRES_HOST")
     port = os.getenv("POSTGRES_PORT", "5432")
     db = os.getenv("POSTGRES_DB")
+    return f"postgresql://{user}:{password}@{host}:{port}/{db}"
+
+
+def _sqlite_url() -> str:
+    path = os.getenv("SQLITE_PATH", "./db.sqlite3")
+    return f"sqlite:///{path}"
+
+
+def _build_engine(backend: str) -> Engine:
+    stats = PoolStats()
+
+    if backend == "sqlite":
+        # SQLite no necesita pool con tamaño; dejamos el de por defecto.
+        engine = create_engine(_sqlite_url())
+    else:
+        kwargs = dict(
+            poolclass=_TimedQueuePool,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_pre_ping=DB_POOL_PRE_PING,
+        )
+        if backend == "sqlserver":
+            url = _sqlserver_url()
+            kwargs["fast_executemany"] = SQLSERVER_FAST_EXECUTEMANY
+        else:
+            url = _postgres_url()
+        engine = create_engine(url, **kwargs)
+        engine.pool.stats = stats
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_conn, conn_record):
+        stats.incr("connects")
+
+    @event.listens_for(engine, "checkout")
+    def _on_checkout(dbapi_conn, conn_record, conn_proxy):
+        stats.incr("checkouts")
+
+    @event.listens_for(engine, "checkin")
+    def _on_checkin(dbapi_conn, conn_record):
+        stats.incr("checkins")
+
+    @event.listens_for(engine, "invalidate")
+    def _on_invalidate(dbapi_conn, conn_record, exception):
+        stats.incr("invalidations")
+
+    _POOL_STATS[backend] = stats
+    logging.info(f"Engine created for {backend} (pool_size={DB_POOL_SIZE}, max_overflow={DB_MAX_OVERFLOW})")
+    return engine
+
+
+def get_engine(backend: str) -> Engine:
+    """Devuelve el engine compartido del backend ('postgres', 'sqlserver', 'sqlite'), creándolo la primera vez."""
+    engine = _ENGINES.get(backend)
+    if engine is not None:
+        return engine
+    with _LOCK:
+        if backend not in _ENGINES:
+            engine = _build_engine(backend)
+            # La factory se publica antes que el engine: quien vea el engine en la
+            # ruta rápida (sin lock) encuentra ya su factory
+            _SESSION_FACTORIES[backend] = sessionmaker(bind=engine)
+            _ENGINES[backend] = engine
+        return _ENGINES[backend]
+
+
+def _session_factory(backend: str) -> sessionmaker:
+    factory = _SESSION_FACTORIES.get(backend)
+    if factory is not None:
+        return factory
+    get_engine(backend)
+    return _SESSION_FACTORIES[backend]
+
+
+def get_sqlserver_session() -> Session:
+    return _session_factory("sqlserver")()
+
+
+def get_sqlite_session() -> Session:
+    return _session_factory("sqlite")()
+
+
+def get_postgres_session() -> Session:
+    return _session_factory("postgres")()
+
+
+@contextmanager
+def session_scope(backend: str) -> Iterator[Session]:
+    """
+    Sesión de corta duración sobre el pool compartido.
+    Hace rollback si hay excepción y siempre devuelve la conexión al pool.
+    """
+    session = _session_factory(backend)()
+    try:
+        yield session
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+def postgres_session() -> ContextManager[Session]:
+    return session_scope("postgres")
+
+
+def sqlserver_session() -> ContextManager[Session]:
+    return session_scope("sqlserver")
+
+
+def pool_stats() -> Dict[str, dict]:
+    """Estado actual de cada pool creado: tamaño, en uso, overflow y tiempos de espera."""
+    out = {}
+    for backend, engine in list(_ENGINES.items()):
+        pool = engine.pool
+        info = {"status": pool.status()}
+        if isinstance(pool, QueuePool):
+            info.update(
+                size=pool.size(),
+                checked_out=pool.checkedout(),
+                checked_in=pool.checkedin(),
+                overflow=pool.overflow(),
+            )
+        info.update(_POOL_STATS[backend].snapshot())
+        out[backend] = info
+    return out
+
+
+metrics.register("db", pool_stats)
+
 
-    conn_str = f"postgresql://{user}:{password}@{host}:{port}/{db}"
-    engine = create_engine(conn_str)
-    return sessionmaker(bind=engine)()
+def dispose_engines():
+    """Cierra todos los pools (p.ej. tras un fork o al apagar)."""
+    with _LOCK:
+        for engine in _ENGINES.values():
+            engine.dispose()
+        _ENGINES.clear()
+        _SESSION_FACTORIES.clear()
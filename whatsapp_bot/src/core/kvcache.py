@@ -0,0 +1,138 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+from src.core import metrics
+
+
+class TieredCache:
+    """
+    Caché clave -> valor JSON con dos niveles:
+    - memoria: LRU de `max_entries` entradas
+    - disco (opcional): tabla SQLite en `path`, compartible entre procesos
+
+    `ttl` en segundos (None = sin caducidad). Expone contadores de aciertos/fallos.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_entries: int = 1024,
+        path: Optional[str] = None,
+        ttl: Optional[float] = None,
+    ):
+        self.name = name
+        self.max_entries = max_entries
+        self.path = path
+        self.ttl = ttl
+
+        self._memory: "OrderedDict[str, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "errors": 0}
+
+        if path:
+            try:
+                self._open_db()
+            except Exception as e:
+                logging.warning(f"{name}: disk tier disabled ({e})")
+                self._db = None
+        metrics.register(name, self.stats)
+
+    def _open_db(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        db = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        db.commit()
+        self._db = db
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl is not None and time.time() - created_at > self.ttl
+
+    def _remember(self, key: str, created_at: float, value: Any):
+        with self._lock:
+            self._memory[key] = (created_at, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if not self._expired(entry[0]):
+                    self._memory.move_to_end(key)
+                    self._stats["memory_hits"] += 1
+                    return entry[1]
+                del self._memory[key]
+
+        if self._db is not None:
+            try:
+                with self._db_lock:
+                    row = self._db.execute(
+                        "SELECT value, created_at FROM cache WHERE key = ?", (key,)
+                    ).fetchone()
+                if row and not self._expired(row[1]):
+                    value = json.loads(row[0])
+                    self._remember(key, row[1], value)
+                    with self._lock:
+                        self._stats["disk_hits"] += 1
+                    return value
+            except Exception as e:
+                with self._lock:
+                    self._stats["errors"] += 1
+                logging.warning(f"{self.name}: disk read failed: {e}")
+
+        with self._lock:
+            self._stats["misses"] += 1
+        return None
+
+    def set(self, key: str, value: Any):
+        now = time.time()
+        self._remember(key, now, value)
+        if self._db is None:
+            return
+        try:
+            payload = json.dumps(value, ensure_ascii=False)
+            with self._db_lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO cache (key, value, created_at) VALUES (?, ?, ?)",
+                    (key, payload, now),
+                )
+                self._db.commit()
+        except Exception as e:
+            with self._lock:
+                self._stats["errors"] += 1
+            logging.warning(f"{self.name}: disk write failed: {e}")
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("DELETE FROM cache")
+                self._db.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            st = dict(self._stats)
+            st["memory_entries"] = len(self._memory)
+        lookups = st["memory_hits"] + st["disk_hits"] + st["misses"]
+        st["hit_rate"] = (
+            round((st["memory_hits"] + st["disk_hits"]) / lookups, 3) if lookups else 0.0
+        )
+        st["disk_tier"] = self._db is not None
+        return st
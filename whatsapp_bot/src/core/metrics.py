@@ -0,0 +1,31 @@
+import logging
+import threading
+from typing import Callable, Dict
+
+# Registro de proveedores de métricas del proceso (pools, colas, cachés...).
+# Cada componente registra una función que devuelve un dict serializable.
+_PROVIDERS: Dict[str, Callable[[], dict]] = {}
+_LOCK = threading.Lock()
+
+
+def register(name: str, provider: Callable[[], dict]):
+    with _LOCK:
+        _PROVIDERS[name] = provider
+
+
+def unregister(name: str):
+    with _LOCK:
+        _PROVIDERS.pop(name, None)
+
+
+def snapshot() -> Dict[str, dict]:
+    with _LOCK:
+        providers = list(_PROVIDERS.items())
+    out = {}
+    for name, provider in providers:
+        try:
+            out[name] = provider()
+        except Exception as e:
+            logging.warning(f"Metrics provider {name} failed: {e}")
+            out[name] = {"error": str(e)}
+    return out
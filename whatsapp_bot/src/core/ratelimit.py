@@ -0,0 +1,66 @@
+import threading
+import time
+from typing import Dict, Hashable, List
+
+
+class TokenBucket:
+    """
+    Token bucket clásico: `rate` tokens por segundo hasta un máximo de `burst`.
+    `try_acquire()` no bloquea; `wait_time()` dice cuánto falta para el siguiente token.
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        with self._lock:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def wait_time(self, tokens: float = 1.0) -> float:
+        with self._lock:
+            self._refill()
+            missing = tokens - self._tokens
+            if missing <= 0:
+                return 0.0
+            return missing / self.rate if self.rate > 0 else float("inf")
+
+    def acquire(self, tokens: float = 1.0):
+        """Bloquea hasta conseguir `tokens`."""
+        while not self.try_acquire(tokens):
+            time.sleep(max(self.wait_time(tokens), 0.01))
+
+
+class KeyedTokenBuckets:
+    """Un TokenBucket por clave (p.ej. por dispositivo), creado al primer uso."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._buckets: Dict[Hashable, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> TokenBucket:
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self.rate, self.burst)
+            return bucket
+
+    def exhausted(self) -> List[Hashable]:
+        """Claves que ahora mismo no tienen ni un token."""
+        with self._lock:
+            items = list(self._buckets.items())
+        return [key for key, bucket in items if bucket.wait_time() > 0]
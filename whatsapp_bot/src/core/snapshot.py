@@ -0,0 +1,121 @@
+import abc
+import logging
+import threading
+import time
+from typing import Callable, ContextManager, Generic, Optional, TypeVar
+
+from sqlalchemy.orm import Session
+
+from src.core import metrics
+
+T = TypeVar("T")
+
+
+class SnapshotIndex(abc.ABC, Generic[T]):
+    """
+    Índice en memoria cargado en bloque desde BD y refrescado en segundo plano.
+
+    Las subclases implementan `_load(session, current)` y devuelven el nuevo estado; el
+    cambio es atómico (se sustituye la referencia). Si un refresco falla se conserva el
+    último snapshot bueno, así las búsquedas sobreviven a caídas cortas de la BD.
+    Sin snapshot todavía, `ensure_loaded` no reintenta la carga hasta `retry_seconds`
+    después del último fallo: una BD caída no añade un timeout a cada llamada.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        session_factory: Callable[[], ContextManager[Session]],
+        refresh_seconds: int,
+        retry_seconds: Optional[float] = None,
+    ):
+        self.name = name
+        self.session_factory = session_factory
+        self.refresh_seconds = refresh_seconds
+        self.retry_seconds = refresh_seconds if retry_seconds is None else retry_seconds
+
+        self._state: Optional[T] = None
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._loaded_at: Optional[float] = None
+        self._last_duration = 0.0
+        self._refreshes = 0
+        self._failures = 0
+        self._failed_at: Optional[float] = None  # monotonic del último fallo
+        self._last_error: Optional[str] = None
+        metrics.register(name, self.stats)
+
+    # ---- a implementar ----
+    @abc.abstractmethod
+    def _load(self, session: Session, current: Optional[T]) -> T:
+        """Estado completo nuevo; `current` es el snapshot vigente (None en la primera carga)."""
+
+    def _size(self, state: T) -> int:
+        return len(state)
+
+    # ---- ciclo de vida ----
+    @property
+    def state(self) -> Optional[T]:
+        return self._state
+
+    def refresh(self) -> bool:
+        started = time.perf_counter()
+        try:
+            with self.session_factory() as session:
+                new_state = self._load(session, self._state)
+        except Exception as e:
+            self._failures += 1
+            self._failed_at = time.monotonic()
+            self._last_error = str(e)
+            logging.warning(f"{self.name} refresh failed, keeping last snapshot: {e}")
+            return False
+        self._state = new_state
+        self._loaded_at = time.time()
+        self._last_duration = time.perf_counter() - started
+        self._refreshes += 1
+        self._failed_at = None
+        self._last_error = None
+        logging.info(
+            f"{self.name} refreshed: {self._size(new_state)} entries in {self._last_duration:.2f}s"
+        )
+        return True
+
+    def ensure_loaded(self) -> bool:
+        """Carga inicial perezosa + arranque del refresco en segundo plano."""
+        if self._state is None and not self._backing_off():
+            with self._lock:
+                if self._state is None and not self._backing_off():
+                    self.refresh()
+        self.start()
+        return self._state is not None
+
+    def _backing_off(self) -> bool:
+        failed_at = self._failed_at
+        return failed_at is not None and time.monotonic() - failed_at < self.retry_seconds
+
+    def start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(
+                target=self._run, daemon=True, name=f"{self.name}-refresh"
+            )
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.refresh_seconds)
+            self.refresh()
+
+    def stats(self) -> dict:
+        state = self._state
+        return {
+            "entries": self._size(state) if state is not None else 0,
+            "loaded_at": self._loaded_at,
+            "last_refresh_seconds": round(self._last_duration, 3),
+            "refreshes": self._refreshes,
+            "failures": self._failures,
+            "last_error": self._last_error,
+        }
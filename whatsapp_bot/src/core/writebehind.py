@@ -0,0 +1,155 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, ContextManager, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from src.core import metrics
+
+_STOP = object()
+
+
+class WriteBehindBuffer:
+    """
+    Agrupa inserciones en lotes multi-fila.
+
+    `submit(row)` devuelve un Future con el id generado. Un hilo vacía la cola cada
+    `max_batch` filas o, como muy tarde, `max_delay_ms` después de la primera fila
+    pendiente. `close()` (registrado en atexit) vacía lo pendiente antes de salir.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        session_factory: Callable[[], ContextManager[Session]],
+        insert_many: Callable[[Session, List[dict]], List[Any]],
+        max_batch: int = 100,
+        max_delay_ms: float = 5.0,
+    ):
+        self.name = name
+        self.session_factory = session_factory
+        self.insert_many = insert_many
+        self.max_batch = max_batch
+        self.max_delay = max_delay_ms / 1000.0
+
+        self._queue: "queue.Queue[Any]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._closed = False
+        self._batches = 0
+        self._rows = 0
+        self._failed = 0
+        self._last_batch_ms = 0.0
+        metrics.register(name, self.stats)
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True, name=self.name)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def submit(self, row: dict) -> Future:
+        if self._closed:
+            raise RuntimeError(f"{self.name} is closed")
+        self.start()
+        future: Future = Future()
+        self._queue.put((row, future))
+        return future
+
+    def _collect(self) -> Tuple[List[Tuple[dict, Future]], bool]:
+        first = self._queue.get()
+        if first is _STOP:
+            return [], True
+        batch = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    item = self._queue.get(timeout=remaining)
+                else:
+                    item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        while True:
+            batch, stop = self._collect()
+            if batch:
+                self._flush(batch)
+            if stop:
+                # Vaciar lo que quede tras la señal de parada
+                rest = []
+                while True:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is not _STOP:
+                        rest.append(item)
+                for i in range(0, len(rest), self.max_batch):
+                    self._flush(rest[i : i + self.max_batch])
+                return
+
+    def _flush(self, batch: List[Tuple[dict, Future]]):
+        rows = [row for row, _ in batch]
+        started = time.perf_counter()
+        try:
+            with self.session_factory() as session:
+                ids = self.insert_many(session, rows)
+        except Exception as e:
+            logging.warning(f"{self.name}: batch of {len(rows)} failed ({e}); retrying row by row")
+            self._flush_one_by_one(batch)
+            return
+
+        for (_, future), row_id in zip(batch, ids):
+            future.set_result(row_id)
+        with self._lock:
+            self._batches += 1
+            self._rows += len(rows)
+            self._last_batch_ms = (time.perf_counter() - started) * 1000
+
+    def _flush_one_by_one(self, batch: List[Tuple[dict, Future]]):
+        for row, future in batch:
+            try:
+                with self.session_factory() as session:
+                    (row_id,) = self.insert_many(session, [row])
+                future.set_result(row_id)
+                with self._lock:
+                    self._rows += 1
+            except Exception as e:
+                logging.error(f"{self.name}: could not persist row {row}: {e}")
+                future.set_exception(e)
+                with self._lock:
+                    self._failed += 1
+
+    def close(self, timeout: Optional[float] = 30):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            thread = self._thread
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join(timeout)
+            logging.info(f"{self.name} flushed and closed")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "pending": self._queue.qsize(),
+                "batches": self._batches,
+                "rows": self._rows,
+                "failed": self._failed,
+                "avg_batch_size": round(self._rows / self._batches, 1) if self._batches else 0.0,
+                "last_batch_ms": round(self._last_batch_ms, 2),
+            }
@@ -1,24 +1,252 @@
+import asyncio
 import grpc
 import logging
-import time
+import os
+import queue
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Any, Awaitable, Iterator, Optional
 
+from src.core import metrics
 from src.proto.whatsapp_pb2_grpc import WhatsAppServiceStub
 
+GRPC_KEEPALIVE_MS = int(float(os.getenv("GRPC_KEEPALIVE_SECONDS", "30")) * 1000)
+GRPC_KEEPALIVE_TIMEOUT_MS = int(float(os.getenv("GRPC_KEEPALIVE_TIMEOUT_SECONDS", "10")) * 1000)
+# Espera máxima de una llamada async (API) mientras el bridge aún no ha conectado
+GRPC_READY_TIMEOUT = float(os.getenv("GRPC_READY_TIMEOUT_SECONDS", "10"))
 
-def create_grpc_stub(host="localhost", port=50051) -> WhatsAppServiceStub:
-    address = f"{host}:{port}"
-    while True:
+GRPC_OPTIONS = [
+    ("grpc.max_receive_message_length", 64 * 1024 * 1024),
+    ("grpc.max_send_message_length", 64 * 1024 * 1024),
+    # Pings HTTP/2 para detectar conexiones medio abiertas aunque el stream esté callado
+    ("grpc.keepalive_time_ms", GRPC_KEEPALIVE_MS),
+    ("grpc.keepalive_timeout_ms", GRPC_KEEPALIVE_TIMEOUT_MS),
+    ("grpc.keepalive_permit_without_calls", 1),
+    ("grpc.http2.max_pings_without_data", 0),
+    # Reintentos de conexión del canal acotados (el supervisor añade su propio backoff)
+    ("grpc.initial_reconnect_backoff_ms", 500),
+    ("grpc.max_reconnect_backoff_ms", 10000),
+]
+
+# RPC con respuesta en stream (el resto devuelven una sola respuesta)
+STREAM_METHODS = {"StreamMessages", "DownloadMedia"}
+
+_STREAM_END = object()
+
+
+class GrpcNotReady(TimeoutError):
+    """El canal aún no ha conectado con el bridge dentro del tiempo de espera."""
+
+
+class GrpcRuntime:
+    """
+    Un único canal grpc.aio por proceso, con su propio event loop en un hilo.
+
+    El listener, la IA (hilos) y FastAPI (loop de uvicorn) comparten este canal:
+    - desde hilos: `run(coro)` bloquea hasta el resultado
+    - desde otro event loop: `await call(coro)`
+    - desde el propio loop gRPC: `await coro` directamente (p.ej. el consumidor del stream)
+
+    `start()` no bloquea: la conexión se reintenta en el loop del canal y las llamadas
+    esperan a que esté lista (`wait_ready` / `await ready()`), así que crear el runtime
+    desde una ruta de FastAPI no congela el loop de uvicorn si el bridge está caído.
+    """
+
+    def __init__(self, address: str):
+        self.address = address
+        self.loop = asyncio.new_event_loop()
+        self.channel: Optional[grpc.aio.Channel] = None
+        self.stub: Optional[WhatsAppServiceStub] = None
+        self._thread = threading.Thread(
+            target=self._run_loop, daemon=True, name="grpc-aio"
+        )
+        self._connected: Optional[Future] = None
+        self._lock = threading.Lock()
+        self._calls = 0
+        self._failed = 0
+        self._in_flight = 0
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    async def _connect(self):
+        while True:
+            channel = grpc.aio.insecure_channel(self.address, options=GRPC_OPTIONS)
+            try:
+                await asyncio.wait_for(channel.channel_ready(), timeout=5)
+                logging.info(f"Connected to gRPC server at {self.address}")
+                self.channel = channel
+                self.stub = WhatsAppServiceStub(channel)
+                return
+            except Exception as e:
+                await channel.close()
+                logging.warning(f"Waiting for gRPC server at {self.address}... ({e!r})")
+                await asyncio.sleep(2)
+
+    def start(self) -> "GrpcRuntime":
+        self._thread.start()
+        self._connected = asyncio.run_coroutine_threadsafe(self._connect(), self.loop)
+        return self
+
+    def wait_ready(self, timeout: Optional[float] = None):
+        """Desde hilos: bloquea hasta que el canal conecta (sin timeout, como antes)."""
+        if self.stub is not None:
+            return
+        if self.in_loop():
+            raise RuntimeError("wait_ready() called from the gRPC event loop; await ready() instead")
+        try:
+            self._connected.result(timeout)
+        except FutureTimeout:
+            raise GrpcNotReady(f"gRPC server at {self.address} not ready after {timeout}s")
+
+    async def ready(self, timeout: Optional[float] = None):
+        """Desde cualquier event loop (incluido el del canal)."""
+        if self.stub is not None:
+            return
+        # shield: un timeout aquí no debe cancelar la conexión en curso
+        waiter = asyncio.shield(asyncio.wrap_future(self._connected))
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            raise GrpcNotReady(f"gRPC server at {self.address} not ready after {timeout}s")
+
+    def in_loop(self) -> bool:
+        return threading.current_thread() is self._thread
+
+    async def _tracked(self, coro: Awaitable) -> Any:
+        with self._lock:
+            self._calls += 1
+            self._in_flight += 1
         try:
-            channel = grpc.insecure_channel(
-                address,
-                options=[
-                    ("grpc.max_receive_message_length", 64 * 1024 * 1024),
-                    ("grpc.max_send_message_length", 64 * 1024 * 1024),
-                ],
+            return await coro
+        except Exception:
+            with self._lock:
+                self._failed += 1
+            raise
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def submit(self, coro: Awaitable) -> Future:
+        return asyncio.run_coroutine_threadsafe(self._tracked(coro), self.loop)
+
+    def run(self, coro: Awaitable, timeout: Optional[float] = None) -> Any:
+        if self.in_loop():
+            # Bloquear el loop del canal sería un deadlock
+            raise RuntimeError("GrpcRuntime.run() called from the gRPC event loop; await instead")
+        return self.submit(coro).result(timeout)
+
+    async def call(self, coro: Awaitable) -> Any:
+        if self.in_loop():
+            return await self._tracked(coro)
+        return await asyncio.wrap_future(self.submit(coro))
+
+    def close(self):
+        if self.channel is not None:
+            asyncio.run_coroutine_threadsafe(self.channel.close(), self.loop).result(5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "address": self.address,
+                "connected": self.stub is not None,
+                "calls": self._calls,
+                "failed": self._failed,
+                "in_flight": self._in_flight,
+            }
+
+
+class SyncStub:
+    """
+    Fachada bloqueante sobre el stub aio compartido, con la misma interfaz que
+    WhatsAppServiceStub: `stub.SendMessage(req)`, `for ev in stub.StreamMessages(req)`.
+    """
+
+    def __init__(self, runtime: GrpcRuntime):
+        self.runtime = runtime
+
+    def __getattr__(self, name: str):
+        self.runtime.wait_ready()
+        method = getattr(self.runtime.stub, name)
+
+        if name in STREAM_METHODS:
+            return lambda request, **kwargs: self._iterate(method, request, **kwargs)
+
+        async def _invoke(request, **kwargs):
+            return await method(request, **kwargs)
+
+        return lambda request, **kwargs: self.runtime.run(_invoke(request, **kwargs))
+
+    def _iterate(self, method, request, **kwargs) -> Iterator[Any]:
+        # Cola corta: en DownloadMedia acota la memoria a unos pocos trozos
+        items: "queue.Queue[Any]" = queue.Queue(maxsize=4)
+
+        async def _pump():
+            loop = asyncio.get_running_loop()
+            # items.put puede bloquear (cola llena): fuera del loop del canal
+            put = lambda item: loop.run_in_executor(None, items.put, item)
+            try:
+                async for item in method(request, **kwargs):
+                    await put(item)
+            except BaseException as e:
+                await put(e)
+                return
+            await put(_STREAM_END)
+
+        self.runtime.submit(_pump())
+        while True:
+            item = items.get()
+            if item is _STREAM_END:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+
+
+class AsyncStub:
+    """
+    Fachada async utilizable desde cualquier event loop (p.ej. rutas de FastAPI):
+    `await astub.SendMessage(req)` se ejecuta en el loop del canal compartido.
+    Los RPC con stream se consumen desde el propio loop gRPC con `runtime.stub`.
+    """
+
+    def __init__(self, runtime: GrpcRuntime):
+        self.runtime = runtime
+
+    def __getattr__(self, name: str):
+        async def _invoke(request, **kwargs):
+            return await getattr(self.runtime.stub, name)(request, **kwargs)
+
+        async def call(request, **kwargs):
+            await self.runtime.ready(GRPC_READY_TIMEOUT)
+            return await self.runtime.call(_invoke(request, **kwargs))
+
+        return call
+
+
+_RUNTIME: Optional[GrpcRuntime] = None
+_RUNTIME_LOCK = threading.Lock()
+
+
+def get_grpc_runtime(host="localhost", port=50051) -> GrpcRuntime:
+    global _RUNTIME
+    port = port or 50051
+    with _RUNTIME_LOCK:
+        if _RUNTIME is None:
+            _RUNTIME = GrpcRuntime(f"{host}:{port}").start()
+            metrics.register("grpc", _RUNTIME.stats)
+        elif _RUNTIME.address != f"{host}:{port}":
+            logging.warning(
+                f"gRPC runtime already bound to {_RUNTIME.address}; ignoring {host}:{port}"
             )
-            grpc.channel_ready_future(channel).result(timeout=5)
-            logging.info(f"Connected to gRPC server at {address}")
-            return WhatsAppServiceStub(channel)
-        except Exception as e:
-            logging.warning(f"Waiting for gRPC server at {address}... ({e})")
-            time.sleep(2)
+        return _RUNTIME
+
+
+def create_grpc_stub(host="localhost", port=50051) -> SyncStub:
+    return SyncStub(get_grpc_runtime(host, port))
+
+
+def create_async_stub(host="localhost", port=50051) -> AsyncStub:
+    return AsyncStub(get_grpc_runtime(host, port))
@@ -0,0 +1,101 @@
+import logging
+import os
+import threading
+import time
+from typing import FrozenSet, Iterable
+
+from src.core import metrics
+from src.proto.whatsapp_pb2 import Empty
+
+DEVICE_CACHE_TTL = float(os.getenv("DEVICE_CACHE_TTL", "30"))
+# Un JID desconocido fuerza un refresco, como mucho una vez cada tantos segundos
+DEVICE_MISS_REFRESH = float(os.getenv("DEVICE_MISS_REFRESH", "2"))
+
+# Error que devuelve el bridge cuando from_jid no es un dispositivo conectado
+DEVICE_NOT_FOUND = "device not found"
+
+
+class DeviceRegistry:
+    """
+    Caché de los JIDs conectados al bridge (ListDevices) con TTL corto.
+
+    Evita un ListDevices por cada envío. Se invalida al borrar dispositivos, tras un
+    login y cuando un envío falla con "device not found".
+    """
+
+    def __init__(self, ttl: float = DEVICE_CACHE_TTL):
+        self.ttl = ttl
+        self._jids: FrozenSet[str] = frozenset()
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "refreshes": 0, "invalidations": 0}
+
+    def _fresh(self) -> bool:
+        return time.monotonic() - self._loaded_at < self.ttl
+
+    def update(self, jids: Iterable[str]) -> FrozenSet[str]:
+        with self._lock:
+            self._jids = frozenset(jids)
+            self._loaded_at = time.monotonic()
+            self._stats["refreshes"] += 1
+            return self._jids
+
+    def invalidate(self, reason: str = ""):
+        with self._lock:
+            self._loaded_at = 0.0
+            self._stats["invalidations"] += 1
+        logging.info(f"Device registry invalidated{f' ({reason})' if reason else ''}")
+
+    def _cached(self):
+        with self._lock:
+            if self._fresh():
+                self._stats["hits"] += 1
+                return self._jids
+        return None
+
+    def jids(self, stub) -> FrozenSet[str]:
+        cached = self._cached()
+        if cached is not None:
+            return cached
+        return self.update(d.jid for d in stub.ListDevices(Empty()).devices)
+
+    async def jids_async(self, astub) -> FrozenSet[str]:
+        cached = self._cached()
+        if cached is not None:
+            return cached
+        return self.update(d.jid for d in (await astub.ListDevices(Empty())).devices)
+
+    def _should_recheck(self, jid: str, jids: FrozenSet[str]) -> bool:
+        # Un dispositivo recién emparejado aún no está en la caché
+        return jid not in jids and time.monotonic() - self._loaded_at >= DEVICE_MISS_REFRESH
+
+    def is_connected(self, stub, jid: str) -> bool:
+        jids = self.jids(stub)
+        if self._should_recheck(jid, jids):
+            self.invalidate("unknown jid")
+            jids = self.jids(stub)
+        return jid in jids
+
+    async def is_connected_async(self, astub, jid: str) -> bool:
+        jids = await self.jids_async(astub)
+        if self._should_recheck(jid, jids):
+            self.invalidate("unknown jid")
+            jids = await self.jids_async(astub)
+        return jid in jids
+
+    def check_send_error(self, error: str):
+        """Llamar con el error de un envío fallido: si el dispositivo ya no existe, refrescar."""
+        if error and DEVICE_NOT_FOUND in error.lower():
+            self.invalidate("send failed: device not found")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self._stats,
+                "devices": len(self._jids),
+                "fresh": self._fresh(),
+            }
+
+
+device_registry = DeviceRegistry()
+metrics.register("devices", device_registry.stats)
@@ -5,16 +5,21 @@ import qrcode
 from src.core.auth import verify_credentials
 from src.core.qr import show_qr_ascii
 from src.mail.mail_handler import send_qr_email
-from src.proto.whatsapp_pb2 import Empty, SendRequest, DeviceID
-from src.core.database import get_postgres_session
+from src.proto.whatsapp_pb2 import Empty, SendRequest, DeviceID, FileChunk, MediaRequest
+from src.core.database import postgres_session
+from src.grpc.devices import device_registry
 from src.models.user import User
 
+# Tamaño de cada trozo en SendFile / DownloadMedia
+GRPC_CHUNK_SIZE = int(os.getenv("GRPC_CHUNK_SIZE", str(256 * 1024)))
+
 
 def login(stub):
     if not verify_credentials():
         return
     logging.info("Starting login process...")
     response = stub.StartLogin(Empty())
+    device_registry.invalidate("login")
     if response.status == "code":
         show_qr_ascii(response.code)
     elif response.status == "already_connected":
@@ -26,22 +31,17 @@ def login(stub):
 def send_message(stub, to, text, from_jid=None):
     logging.info(f"Sending to={to} from_jid={from_jid}")
 
-    # Obtener lista de dispositivos
-    try:
-        devices = stub.ListDevices(Empty()).devices
-        device_jids = [d.jid for d in devices]
-        logging.info(f"Available devices: {device_jids}")
-    except Exception as e:
-        logging.error(f"Error fetching device list: {e}")
+    if not from_jid:
+        logging.error("from_jid is required, but none was provided")
         return
 
-    # Validar que el from_jid esté en los dispositivos activos
-    if from_jid:
-        if from_jid not in device_jids:
+    # Validar que el from_jid esté en los dispositivos activos (caché con TTL)
+    try:
+        if not device_registry.is_connected(stub, from_jid):
             logging.error(f"from_jid {from_jid} not found in connected devices")
             return
-    else:
-        logging.error("from_jid is required, but none was provided")
+    except Exception as e:
+        logging.error(f"Error fetching device list: {e}")
         return
 
     # Enviar mensaje
@@ -51,36 +51,114 @@ def send_message(stub, to, text, from_jid=None):
         if resp.success:
             logging.info(f"Message sent to {to}")
         else:
+            device_registry.check_send_error(resp.error)
             logging.error(f"Failed to send message: {resp.error}")
     except Exception as e:
         logging.error(f"gRPC error while sending message: {e}")
 
 
+def file_chunks(fileobj, to, filename, text=None, from_jid=None):
+    """
+    Trozos para SendFile: el primero lleva los metadatos, el resto solo datos.
+    `fileobj` es cualquier fichero binario abierto (disco, UploadFile.file...).
+    """
+    yield FileChunk(
+        meta=SendRequest(
+            to=to,
+            text=text if text is not None else filename,
+            filename=filename,
+            from_jid=from_jid or "",
+        )
+    )
+    while True:
+        data = fileobj.read(GRPC_CHUNK_SIZE)
+        if not data:
+            return
+        yield FileChunk(data=data)
+
+
+def download_media(stub, media_id: str, dest_path: str) -> int:
+    """Descarga un adjunto por trozos escribiéndolo directamente en `dest_path`."""
+    size = 0
+    tmp_path = f"{dest_path}.part"
+    try:
+        with open(tmp_path, "wb") as f:
+            for chunk in stub.DownloadMedia(MediaRequest(media_id=media_id)):
+                f.write(chunk.data)
+                size += len(chunk.data)
+        os.replace(tmp_path, dest_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return size
+
+
 def send_file(stub, to, filepath, from_jid=None):
     if not os.path.exists(filepath):
         logging.error(f"File not found: {filepath}")
         return
 
     with open(filepath, "rb") as f:
-        binary_data = f.read()
-
-    req = SendRequest(
-        to=to,
-        text=os.path.basename(filepath),
-        binary=binary_data,
-        filename=os.path.basename(filepath),
-        from_jid=from_jid or "",
-    )
+        resp = stub.SendFile(
+            file_chunks(f, to, os.path.basename(filepath), from_jid=from_jid)
+        )
+    if resp.success:
+        logging.info(f"File sent to {to}: {filepath}")
+    else:
+        device_registry.check_send_error(resp.error)
+        logging.error(f"Failed to send file: {resp.error}")
 
-    resp = stub.SendMessage(req)
+
+async def send_message_async(astub, to, text, from_jid=None) -> bool:
+    """Igual que send_message pero con el stub async (rutas FastAPI, consumidor aio)."""
+    logging.info(f"Sending to={to} from_jid={from_jid}")
+    if not from_jid:
+        logging.error("from_jid is required, but none was provided")
+        return False
+
+    try:
+        connected = await device_registry.is_connected_async(astub, from_jid)
+    except Exception as e:
+        logging.error(f"Error fetching device list: {e}")
+        return False
+    if not connected:
+        logging.error(f"from_jid {from_jid} not found in connected devices")
+        return False
+
+    try:
+        resp = await astub.SendMessage(SendRequest(to=to, text=text, from_jid=from_jid))
+    except Exception as e:
+        logging.error(f"gRPC error while sending message: {e}")
+        return False
+    if resp.success:
+        logging.info(f"Message sent to {to}")
+    else:
+        device_registry.check_send_error(resp.error)
+        logging.error(f"Failed to send message: {resp.error}")
+    return resp.success
+
+
+async def send_file_async(astub, to, filepath, from_jid=None) -> bool:
+    if not os.path.exists(filepath):
+        logging.error(f"File not found: {filepath}")
+        return False
+
+    with open(filepath, "rb") as f:
+        resp = await astub.SendFile(
+            file_chunks(f, to, os.path.basename(filepath), from_jid=from_jid)
+        )
     if resp.success:
         logging.info(f"File sent to {to}: {filepath}")
     else:
+        device_registry.check_send_error(resp.error)
         logging.error(f"Failed to send file: {resp.error}")
+    return resp.success
 
 
 def list_devices(stub):
     response = stub.ListDevices(Empty())
+    device_registry.update(d.jid for d in response.devices)
     logging.info("Registered devices:")
     for device in response.devices:
         logging.info(f"• {device.jid}")
@@ -88,6 +166,7 @@ def list_devices(stub):
 
 def delete_device(stub, jid):
     resp = stub.DeleteDevice(DeviceID(jid=jid))
+    device_registry.invalidate("device deleted")
     if resp.success:
         logging.info(f"Device deleted: {jid}")
     else:
@@ -96,11 +175,11 @@ def delete_device(stub, jid):
 
 def login_and_send_qr(stub, to_phone: str):
     response = stub.StartLogin(Empty())
+    device_registry.invalidate("login")
 
     if response.status == "code":
         # Buscar email del usuario desde SQLite
-        session = get_postgres_session()
-        try:
+        with postgres_session() as session:
             user = User.get_by_phone(session, to_phone)
             if not user:
                 logging.warning(f"No user found with phone: {to_phone}")
@@ -113,9 +192,6 @@ def login_and_send_qr(stub, to_phone: str):
 
             send_qr_email(user.email, qr_path)
 
-        finally:
-            session.close()
-
     elif response.status == "already_connected":
         logging.info("Session already active.")
     else:
@@ -124,10 +200,10 @@ def login_and_send_qr(stub, to_phone: str):
 
 def login_and_send_qr_to_all_admins(stub):
     response = stub.StartLogin(Empty())
+    device_registry.invalidate("login")
 
     if response.status == "code":
-        session = get_postgres_session()
-        try:
+        with postgres_session() as session:
             admins = User.get_admins(session)
             if not admins:
                 logging.warning("No admins found in the database.")
@@ -144,9 +220,6 @@ def login_and_send_qr_to_all_admins(stub):
                 logging.info(f"Sending QR to admin: {admin.email}")
                 send_qr_email(admin.email, qr_path)
 
-        finally:
-            session.close()
-
     elif response.status == "already_connected":
         logging.info("Session already active.")
     else:
@@ -0,0 +1,160 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Optional
+
+from dotenv import load_dotenv
+
+from src.core import metrics
+
+load_dotenv()
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", "2"))
+
+IMAGE_EXTS = [".jpg", ".jpeg", ".png", ".webp"]
+AUDIO_EXTS = [".mp3", ".ogg", ".wav", ".opus"]
+VIDEO_EXTS = [".mp4", ".avi", ".mkv"]
+
+
+def media_subdir(ext: str) -> str:
+    return (
+        "images"
+        if ext in IMAGE_EXTS
+        else (
+            "audio"
+            if ext in AUDIO_EXTS
+            else "video" if ext in VIDEO_EXTS else "documents"
+        )
+    )
+
+
+# ---- código que corre en los procesos del pool ----
+
+def _init_worker():
+    """Carga PaddleOCR y Vosk una vez por proceso, antes del primer trabajo."""
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
+    import src.media.ocr  # noqa: F401
+    import src.media.audio  # noqa: F401
+    logging.info(f"Media extraction worker ready (pid={os.getpid()})")
+
+
+def extract_text(file_path: str, subdir: str, ext: str) -> Optional[str]:
+    """OCR / transcripción / parseo de documento de un fichero ya guardado en disco."""
+    if subdir == "images":
+        from src.media.ocr import extract_text_from_image
+
+        with open(file_path, "rb") as f:
+            return extract_text_from_image(f.read())
+
+    if subdir == "audio":
+        from src.media.audio import transcribe_audio
+
+        with open(file_path, "rb") as f:
+            return transcribe_audio(f.read(), extension=ext)
+
+    if subdir == "documents":
+        from src.media.documents import (
+            extract_text_from_csv,
+            extract_text_from_docx,
+            extract_text_from_pdf,
+            extract_text_from_txt,
+            extract_text_from_xlsx,
+        )
+
+        extractors = {
+            ".pdf": extract_text_from_pdf,
+            ".docx": extract_text_from_docx,
+            ".txt": extract_text_from_txt,
+            ".csv": extract_text_from_csv,
+            ".xlsx": extract_text_from_xlsx,
+        }
+        extractor = extractors.get(ext)
+        return extractor(file_path) if extractor else None
+
+    return None
+
+
+# ---- lado del proceso principal ----
+
+class MediaExtractor:
+    """
+    Ejecuta la extracción de texto de adjuntos en un ProcessPoolExecutor (fuera del GIL
+    del listener, la IA y uvicorn) y entrega el resultado a un callback en un hilo aparte.
+    """
+
+    def __init__(self, workers: int = EXTRACTION_WORKERS):
+        self.workers = workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        # Los callbacks tocan la BD: fuera del hilo gestor del ProcessPoolExecutor
+        self._callbacks = ThreadPoolExecutor(max_workers=2, thread_name_prefix="extract-cb")
+        self._lock = threading.Lock()
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+
+    def _executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # spawn: el proceso padre tiene hilos y canales gRPC abiertos
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                )
+            return self._pool
+
+    def submit(
+        self,
+        file_path: str,
+        subdir: str,
+        ext: str,
+        on_done: Callable[[Optional[str]], None],
+    ) -> Future:
+        with self._lock:
+            self._submitted += 1
+        future = self._executor().submit(extract_text, file_path, subdir, ext)
+
+        def _done(f: Future):
+            try:
+                text = f.result()
+            except Exception as e:
+                logging.error(f"Media extraction failed for {file_path}: {e}")
+                with self._lock:
+                    self._failed += 1
+                text = None
+            else:
+                with self._lock:
+                    self._completed += 1
+            self._callbacks.submit(self._run_callback, on_done, text, file_path)
+
+        future.add_done_callback(_done)
+        return future
+
+    @staticmethod
+    def _run_callback(on_done, text, file_path):
+        try:
+            on_done(text)
+        except Exception as e:
+            logging.exception(f"Error applying extracted text for {file_path}: {e}")
+
+    def shutdown(self, wait: bool = True):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=wait)
+        self._callbacks.shutdown(wait=wait)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "failed": self._failed,
+                "in_flight": self._submitted - self._completed - self._failed,
+            }
+
+
+media_extractor = MediaExtractor()
+metrics.register("media_extraction", media_extractor.stats)
@@ -1,8 +1,12 @@
+import hashlib
 import logging
+import os
 import numpy as np
 import cv2
 from paddleocr import PaddleOCR
 
+from src.core.kvcache import TieredCache
+
 # --- parámetros anti-ruido (tunea a tu dataset) ---
 MIN_SCORE = 0.60            # subido un poco
 MIN_BOX_AREA = 150.0        # ignora cajas muy pequeñas
@@ -119,6 +123,13 @@ def compose_text_by_rows(items):
 
     return text
 
+# --- caché de resultados OCR (memoria LRU + SQLite local) ---
+ocr_cache = TieredCache(
+    "ocr_cache",
+    max_entries=int(os.getenv("OCR_CACHE_SIZE", "512")),
+    path=os.getenv("OCR_CACHE_PATH", "media/cache/ocr.sqlite3") or None,
+)
+
 # --- tu OCR model igual que lo tienes ---
 ocr_model = PaddleOCR(
     lang="es",
@@ -165,6 +176,12 @@ def preprocess(image: np.ndarray) -> np.ndarray:
     return cv2.cvtColor(bin_morph, cv2.COLOR_GRAY2BGR)
 
 def extract_text_from_image(image_bytes: bytes) -> str:
+    # Los clientes reenvían mucho la misma captura: caché por SHA-256 del contenido
+    key = hashlib.sha256(image_bytes).hexdigest()
+    cached = ocr_cache.get(key)
+    if cached is not None:
+        return cached["text"]
+
     try:
         np_img = np.frombuffer(image_bytes, np.uint8)
         img = cv2.imdecode(np_img, cv2.IMREAD_COLOR)
@@ -181,17 +198,17 @@ def extract_text_from_image(image_bytes: bytes) -> str:
 
         items = []
         for block in result:
-            for line in block:
+            for line in block or []:
                 box, (text, score) = line
                 y_min = min(pt[1] for pt in box)
                 x_min = min(pt[0] for pt in box)
                 area = polygon_area(box)
-                items.append((y_min, x_min, text, float(score), float(area)))
+                items.append((float(y_min), float(x_min), text, float(score), float(area)))
 
         extracted_text = compose_text_by_rows(items)
+        ocr_cache.set(key, {"items": items, "text": extracted_text})
         return extracted_text
 
     except Exception as e:
         logging.exception(f"OCR error: {e}")
         return ""
-
@@ -1,12 +1,19 @@
 import io
 import logging
-from typing import List, Tuple, Optional
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Tuple, Optional
 from PIL import Image, ImageDraw, ImageFont
 import paramiko
 import os
 import textwrap
 from dotenv import load_dotenv
 
+from src.core import metrics
+
 load_dotenv()
 
 # SFTP config (cargar antes desde dotenv)
@@ -17,43 +24,178 @@ SFTP_PASSWORD: str = os.getenv("SFTP_PASSWORD", "")
 SFTP_REMOTE_DIR: str = os.getenv("SFTP_REMOTE_DIR", "articulos")
 
 
+SFTP_POOL_SIZE: int = int(os.getenv("SFTP_POOL_SIZE", "4"))
+SFTP_LISTING_TTL: int = int(os.getenv("SFTP_LISTING_TTL", "300"))
+SFTP_TIMEOUT: float = float(os.getenv("SFTP_TIMEOUT", "10"))
+
+
 def connect_sftp() -> Tuple[paramiko.SFTPClient, paramiko.Transport]:
     transport = paramiko.Transport((SFTP_HOST, SFTP_PORT))
+    transport.banner_timeout = SFTP_TIMEOUT
     transport.connect(username=SFTP_USERNAME, password=SFTP_PASSWORD)
+    transport.set_keepalive(30)
     sftp = paramiko.SFTPClient.from_transport(transport)
+    sftp.get_channel().settimeout(SFTP_TIMEOUT)
     return sftp, transport
 
 
+class SFTPPool:
+    """
+    Pool de conexiones SFTP persistentes.
+    Cada conexión se comprueba al sacarla (transporte activo) y se reabre si murió.
+    """
+
+    def __init__(self, size: int = SFTP_POOL_SIZE):
+        self.size = size
+        self._idle: "queue.LifoQueue[Tuple[paramiko.SFTPClient, paramiko.Transport]]" = (
+            queue.LifoQueue()
+        )
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._opened = 0
+        self._reconnects = 0
+
+    def _healthy(self, conn) -> bool:
+        sftp, transport = conn
+        return transport.is_active() and not sftp.sock.closed
+
+    def _close(self, conn):
+        sftp, transport = conn
+        try:
+            sftp.close()
+        finally:
+            transport.close()
+
+    @contextmanager
+    def connection(self) -> Iterator[paramiko.SFTPClient]:
+        self._slots.acquire()
+        conn = None
+        try:
+            try:
+                conn = self._idle.get_nowait()
+                if not self._healthy(conn):
+                    self._close(conn)
+                    conn = None
+                    with self._lock:
+                        self._reconnects += 1
+            except queue.Empty:
+                pass
+            if conn is None:
+                conn = connect_sftp()
+                with self._lock:
+                    self._opened += 1
+
+            try:
+                yield conn[0]
+            except Exception:
+                # Si la conexión se rompió a mitad de operación no vuelve al pool
+                if not self._healthy(conn):
+                    self._close(conn)
+                    conn = None
+                raise
+        finally:
+            if conn is not None:
+                self._idle.put(conn)
+            self._slots.release()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": self.size,
+                "idle": self._idle.qsize(),
+                "opened": self._opened,
+                "reconnects": self._reconnects,
+            }
+
+
+sftp_pool = SFTPPool()
+
+_listing: Dict[str, int] = {}
+_listing_at: float = 0.0
+_listing_lock = threading.Lock()
+
+
+def _refresh_listing() -> Dict[str, int]:
+    global _listing, _listing_at
+    with sftp_pool.connection() as sftp:
+        listing = {
+            attr.filename: int(attr.st_mtime or 0)
+            for attr in sftp.listdir_attr(SFTP_REMOTE_DIR)
+        }
+    _listing, _listing_at = listing, time.monotonic()
+    logging.info(f"SFTP listing refreshed: {len(listing)} files")
+    return listing
+
+
+def _refresh_listing_quietly():
+    try:
+        with _listing_lock:
+            if time.monotonic() - _listing_at >= SFTP_LISTING_TTL:
+                _refresh_listing()
+    except Exception as e:
+        logging.warning(f"SFTP listing refresh failed: {e}")
+
+
+def list_remote_images(force: bool = False, allow_stale: bool = False) -> Dict[str, int]:
+    """
+    Listado del directorio remoto {nombre: mtime}, cacheado SFTP_LISTING_TTL segundos.
+    Con allow_stale devuelve el listado que haya y refresca en segundo plano.
+    """
+    fresh = time.monotonic() - _listing_at < SFTP_LISTING_TTL
+    if not force and fresh:
+        return _listing
+    if allow_stale and _listing and not force:
+        if not _listing_lock.locked():
+            threading.Thread(
+                target=_refresh_listing_quietly, daemon=True
+            ).start()
+        return _listing
+    with _listing_lock:
+        if not force and time.monotonic() - _listing_at < SFTP_LISTING_TTL:
+            return _listing
+        return _refresh_listing()
+
+
+def remote_image_name(image_name: str) -> Optional[str]:
+    target_filename = f"{image_name}.jpg"
+    if "mini" in target_filename.lower() or "_" in target_filename:
+        return None
+    return target_filename
+
+
 def find_image_file(image_name: str) -> Optional[bytes]:
     """
     Finds and returns the image content from SFTP (as bytes), or None if not found.
     """
-    sftp, transport = connect_sftp()
+    target_filename = remote_image_name(image_name)
+    if target_filename is None:
+        return None
+
     try:
-        sftp.chdir(SFTP_REMOTE_DIR)
-        files = sftp.listdir()
-        target_filename = f"{image_name}.jpg"
-
-        matches = [
-            f
-            for f in files
-            if f == target_filename
-            and f.lower().endswith(".jpg")
-            and "mini" not in f.lower()
-            and "_" not in f
-        ]
-
-        if not matches:
+        if target_filename not in list_remote_images():
             return None
 
-        with sftp.open(matches[0], "rb") as f:
-            return f.read()
+        with sftp_pool.connection() as sftp:
+            with sftp.open(f"{SFTP_REMOTE_DIR}/{target_filename}", "rb") as f:
+                f.prefetch()
+                return f.read()
     except Exception as e:
         logging.warning(f"Error loading image {image_name}: {e}")
         return None
-    finally:
-        sftp.close()
-        transport.close()
+
+
+def find_image_files(image_names: List[str]) -> Dict[str, Optional[bytes]]:
+    """
+    Descarga varias imágenes en paralelo (tantas como conexiones tiene el pool).
+    """
+    names = list(dict.fromkeys(image_names))
+    if not names:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(len(names), sftp_pool.size)) as executor:
+        return dict(zip(names, executor.map(find_image_file, names)))
+
+
+metrics.register("sftp", lambda: {**sftp_pool.stats(), "listing_size": len(_listing)})
 
 
 def build_order_image_table(
@@ -0,0 +1,265 @@
+import io
+import logging
+import os
+import re
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from PIL import Image
+
+from src.core import metrics
+from src.media.sftp import (
+    find_image_file,
+    list_remote_images,
+    remote_image_name,
+    sftp_pool,
+)
+
+load_dotenv()
+THUMB_CACHE_DIR: str = os.getenv("THUMB_CACHE_DIR", "media/thumbs")
+THUMB_CACHE_MAX_MB: int = int(os.getenv("THUMB_CACHE_MAX_MB", "200"))
+THUMB_SIZE: Tuple[int, int] = (100, 100)
+# Al pasarse del tope se evicta hasta esta fracción: el escaneo completo no se repite en cada fallo
+THUMB_CACHE_LOW_WATER = 0.9
+
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "stale_hits": 0, "evictions": 0, "evict_scans": 0}
+
+# Índice en memoria de la caché en disco (se construye con un solo escaneo la primera vez):
+# código saneado -> {ruta: bytes}, y el total, para no listar el directorio en cada fallo
+_index: Optional[Dict[str, Dict[str, int]]] = None
+_index_bytes = 0
+# warm_thumbnail_cache en curso: la evicción se hace una vez al final
+_warming = 0
+
+
+def _incr(name: str, n: int = 1):
+    with _lock:
+        _stats[name] += n
+
+
+def _safe(code: str) -> str:
+    return re.sub(r"[^A-Za-z0-9-]", "-", code)
+
+
+def _cache_path(code: str, mtime: int) -> str:
+    # La mtime remota forma parte de la clave: si cambia la foto, cambia el fichero
+    return os.path.join(THUMB_CACHE_DIR, f"{_safe(code)}.{mtime}.jpg")
+
+
+def _scan() -> List[Tuple[float, int, str]]:
+    """(mtime, tamaño, ruta) de cada miniatura en disco."""
+    try:
+        entries = [e for e in os.scandir(THUMB_CACHE_DIR) if e.is_file() and e.name.endswith(".jpg")]
+    except FileNotFoundError:
+        return []
+    files = []
+    for e in entries:
+        try:
+            st = e.stat()
+        except OSError:
+            continue
+        files.append((st.st_mtime, st.st_size, e.path))
+    return files
+
+
+def _rebuild_index(files: List[Tuple[float, int, str]]):
+    """Llamar con _lock tomado."""
+    global _index, _index_bytes
+    _index = {}
+    _index_bytes = 0
+    for _, size, path in files:
+        safe = os.path.basename(path).rsplit(".", 2)[0]
+        _index.setdefault(safe, {})[path] = size
+        _index_bytes += size
+
+
+def _ensure_index():
+    with _lock:
+        if _index is not None:
+            return
+    files = _scan()
+    with _lock:
+        if _index is None:
+            _rebuild_index(files)
+
+
+def _cached_versions(code: str) -> List[str]:
+    _ensure_index()
+    with _lock:
+        return list(_index.get(_safe(code), {}))
+
+
+def _cache_bytes() -> int:
+    _ensure_index()
+    with _lock:
+        return _index_bytes
+
+
+def _read(path: str) -> Optional[bytes]:
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        os.utime(path)  # mtime local = último acceso (LRU)
+        return data
+    except OSError:
+        return None
+
+
+def make_thumbnail(raw: bytes) -> bytes:
+    img = Image.open(io.BytesIO(raw))
+    img = img.convert("RGB")
+    img.thumbnail(THUMB_SIZE)
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=90)
+    return out.getvalue()
+
+
+def _store(code: str, mtime: int, thumb: bytes):
+    global _index_bytes
+    _ensure_index()
+    os.makedirs(THUMB_CACHE_DIR, exist_ok=True)
+    path = _cache_path(code, mtime)
+    fd, tmp = tempfile.mkstemp(dir=THUMB_CACHE_DIR, suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(thumb)
+    os.replace(tmp, path)
+
+    with _lock:
+        versions = _index.setdefault(_safe(code), {})
+        old = dict(versions)
+        versions.clear()
+        versions[path] = len(thumb)
+        _index_bytes += len(thumb) - sum(old.values())
+    for old_path in old:
+        if old_path != path:
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+
+
+def _max_bytes() -> int:
+    return THUMB_CACHE_MAX_MB * 1024 * 1024
+
+
+def evict(max_bytes: Optional[int] = None) -> int:
+    """
+    Borra las miniaturas menos usadas hasta quedar bajo `max_bytes` (por defecto, el
+    THUMB_CACHE_LOW_WATER de THUMB_CACHE_MAX_MB). Escanea el directorio y rehace el índice.
+    """
+    if max_bytes is None:
+        max_bytes = int(_max_bytes() * THUMB_CACHE_LOW_WATER)
+    _incr("evict_scans")
+    files = sorted(_scan())
+    total = sum(size for _, size, _ in files)
+    removed = 0
+    kept = []
+    for entry in files:
+        _, size, path = entry
+        if total <= max_bytes:
+            kept.append(entry)
+            continue
+        try:
+            os.remove(path)
+            total -= size
+            removed += 1
+        except OSError:
+            kept.append(entry)
+    with _lock:
+        _rebuild_index(kept)
+    if removed:
+        _incr("evictions", removed)
+        logging.info(f"Thumbnail cache evicted {removed} files")
+    return removed
+
+
+def get_thumbnail(code: str) -> Optional[bytes]:
+    """
+    Miniatura 100x100 del producto. Usa la caché local si coincide la mtime remota;
+    si no, descarga la foto por SFTP, la reduce y la guarda.
+    """
+    filename = remote_image_name(code)
+    if filename is None:
+        return None
+
+    try:
+        mtime = list_remote_images(allow_stale=True).get(filename)
+    except Exception as e:
+        # SFTP caído: servimos la última versión cacheada si existe
+        logging.warning(f"SFTP listing unavailable for {code}: {e}")
+        versions = _cached_versions(code)
+        if versions:
+            _incr("stale_hits")
+            return _read(max(versions, key=os.path.getmtime))
+        return None
+
+    if mtime is None:
+        return None
+
+    data = _read(_cache_path(code, mtime))
+    if data is not None:
+        _incr("hits")
+        return data
+
+    _incr("misses")
+    raw = find_image_file(code)
+    if raw is None:
+        return None
+    try:
+        thumb = make_thumbnail(raw)
+    except Exception as e:
+        logging.warning(f"Could not build thumbnail for {code}: {e}")
+        return None
+
+    try:
+        _store(code, mtime, thumb)
+        # Solo escanea el directorio cuando el total llevado en memoria pasa del tope
+        if not _warming and _cache_bytes() > _max_bytes():
+            evict()
+    except OSError as e:
+        logging.warning(f"Could not store thumbnail for {code}: {e}")
+    return thumb
+
+
+def get_thumbnails(codes: Iterable[str]) -> Dict[str, Optional[bytes]]:
+    names = list(dict.fromkeys(codes))
+    if not names:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(len(names), sftp_pool.size)) as executor:
+        return dict(zip(names, executor.map(get_thumbnail, names)))
+
+
+def warm_thumbnail_cache(codes: Iterable[str]) -> Dict[str, int]:
+    """Precalienta la caché para los códigos dados (p.ej. todo el catálogo activo)."""
+    global _warming
+    list_remote_images(force=True)
+    before = dict(_stats)
+    with _lock:
+        _warming += 1
+    try:
+        result = get_thumbnails(codes)
+    finally:
+        with _lock:
+            _warming -= 1
+    if _cache_bytes() > _max_bytes():
+        evict()
+    summary = {
+        "requested": len(result),
+        "available": sum(1 for v in result.values() if v),
+        "downloaded": _stats["misses"] - before["misses"],
+        "already_cached": _stats["hits"] - before["hits"],
+    }
+    logging.info(f"Thumbnail cache warm-up: {summary}")
+    return summary
+
+
+def thumb_stats() -> dict:
+    with _lock:
+        return dict(_stats)
+
+
+metrics.register("thumbnails", thumb_stats)
@@ -0,0 +1,206 @@
+from sqlalchemy import Column, DateTime, Integer, String, text as sql_text
+from sqlalchemy.orm import Session
+from datetime import datetime
+from typing import List
+
+from src.models import Base_sqlite
+
+
+# Una fila por conversación. Un mensaje más reciente la reprograma; si está 'running'
+# solo se anota (message_ts) y al terminar vuelve a 'pending' en vez de 'done'.
+# Con :rearm (el mensaje ya atendido acaba de recibir su texto de OCR/audio) basta el
+# mismo message_ts: la fila 'done'/'failed' vuelve a 'pending' y una 'running' se
+# marca moviendo due_at, que _COMPLETE_SQL compara con el que se reclamó.
+_SCHEDULE_SQL = sql_text(
+    """
+    INSERT INTO ai_jobs (client_id, message_ts, due_at, status, attempts, enqueued_by)
+    VALUES (:client_id, :message_ts, :due_at, 'pending', 0, :instance)
+    ON CONFLICT (client_id) DO UPDATE
+    SET message_ts = EXCLUDED.message_ts,
+        due_at = EXCLUDED.due_at,
+        enqueued_by = EXCLUDED.enqueued_by,
+        status = CASE WHEN ai_jobs.status = 'running' THEN 'running' ELSE 'pending' END,
+        attempts = CASE WHEN ai_jobs.status = 'running' THEN ai_jobs.attempts ELSE 0 END,
+        last_error = NULL,
+        updated_at = NOW()
+    WHERE EXCLUDED.message_ts > ai_jobs.message_ts
+       OR (CAST(:rearm AS BOOLEAN)
+           AND EXCLUDED.message_ts = ai_jobs.message_ts
+           AND ai_jobs.status <> 'pending')
+    """
+)
+
+# Reclama conversaciones vencidas sin bloquear a otros workers (SKIP LOCKED):
+# 'pending' con due_at pasado, o 'running' cuyo lease caducó (worker caído).
+# Primero las del carril LIVE (último mensaje hace menos de :live_seconds), luego
+# por due_at: un atraso tras un reinicio no retrasa la respuesta a quien acaba de escribir.
+# Con :live_only (el LLM está ocupado) solo se reclaman las del carril LIVE.
+# Devuelve también quién la atendió la última vez (last_worker).
+_CLAIM_SQL = sql_text(
+    """
+    WITH next AS (
+        SELECT j.client_id, j.locked_by AS last_worker
+        FROM ai_jobs j
+        WHERE ((j.status = 'pending' AND j.due_at <= NOW())
+               OR (j.status = 'running' AND j.locked_until < NOW()))
+          AND (NOT CAST(:live_only AS BOOLEAN)
+               OR j.message_ts >= NOW() - make_interval(secs => :live_seconds))
+        ORDER BY CASE WHEN j.message_ts >= NOW() - make_interval(secs => :live_seconds)
+                      THEN 0 ELSE 1 END,
+                 j.due_at
+        LIMIT :limit
+        FOR UPDATE OF j SKIP LOCKED
+    )
+    UPDATE ai_jobs
+    SET status = 'running',
+        attempts = ai_jobs.attempts + 1,
+        locked_by = :worker,
+        locked_until = NOW() + make_interval(secs => :lease_seconds),
+        updated_at = NOW()
+    FROM next
+    WHERE ai_jobs.client_id = next.client_id
+    RETURNING ai_jobs.client_id, ai_jobs.message_ts, ai_jobs.due_at, ai_jobs.attempts,
+              ai_jobs.enqueued_by, next.last_worker
+    """
+)
+
+_EXTEND_SQL = sql_text(
+    """
+    UPDATE ai_jobs
+    SET locked_until = NOW() + make_interval(secs => :lease_seconds)
+    WHERE client_id = ANY(:client_ids) AND locked_by = :worker AND status = 'running'
+    """
+)
+
+# Si llegó otro mensaje (o se rearmó) mientras se atendía, la conversación vuelve a la cola
+_COMPLETE_SQL = sql_text(
+    """
+    UPDATE ai_jobs
+    SET status = CASE WHEN message_ts > :message_ts OR due_at > :due_at THEN 'pending' ELSE 'done' END,
+        attempts = CASE WHEN message_ts > :message_ts OR due_at > :due_at THEN 0 ELSE attempts END,
+        locked_until = NULL,
+        last_error = NULL,
+        updated_at = NOW()
+    WHERE client_id = :client_id AND locked_by = :worker AND status = 'running'
+    """
+)
+
+_RETRY_SQL = sql_text(
+    """
+    UPDATE ai_jobs
+    SET status = 'pending',
+        due_at = NOW() + make_interval(secs => :delay_seconds),
+        locked_until = NULL,
+        last_error = :error,
+        updated_at = NOW()
+    WHERE client_id = :client_id AND locked_by = :worker AND status = 'running'
+    """
+)
+
+_FAIL_SQL = sql_text(
+    """
+    UPDATE ai_jobs
+    SET status = 'failed', locked_until = NULL, last_error = :error, updated_at = NOW()
+    WHERE client_id = :client_id AND locked_by = :worker AND status = 'running'
+    """
+)
+
+
+class AIJob(Base_sqlite):
+    __tablename__ = "ai_jobs"
+
+    client_id = Column(Integer, primary_key=True)
+    message_ts = Column(DateTime(timezone=True), nullable=False)  # último mensaje a atender
+    due_at = Column(DateTime(timezone=True), nullable=False)
+    status = Column(String, nullable=False, default="pending")  # pending/running/done/failed
+    attempts = Column(Integer, nullable=False, default=0)
+    enqueued_by = Column(String)  # instancia cuyo planificador la encoló
+    locked_by = Column(String)  # worker que la tiene (o la tuvo la última vez)
+    locked_until = Column(DateTime(timezone=True))
+    last_error = Column(String)
+    created_at = Column(DateTime(timezone=True), nullable=False)
+    updated_at = Column(DateTime(timezone=True), nullable=False)
+
+    @staticmethod
+    def schedule(
+        session: Session,
+        client_id: int,
+        message_ts: datetime,
+        due_at: datetime,
+        instance: str,
+        rearm: bool = False,
+    ) -> bool:
+        """
+        Encola (o reprograma) la conversación; False si ya estaba con ese mensaje o uno
+        posterior. Con rearm, el mismo mensaje vuelve a encolarse aunque ya se atendiera.
+        """
+        result = session.execute(
+            _SCHEDULE_SQL,
+            {
+                "client_id": client_id,
+                "message_ts": message_ts,
+                "due_at": due_at,
+                "instance": instance,
+                "rearm": rearm,
+            },
+        )
+        session.commit()
+        return result.rowcount > 0
+
+    @staticmethod
+    def claim(
+        session: Session,
+        limit: int,
+        lease_seconds: float,
+        worker: str,
+        live_seconds: float,
+        live_only: bool = False,
+    ) -> List[dict]:
+        """
+        live_seconds: antigüedad máxima del último mensaje para reclamarla antes que el resto.
+        live_only: no reclamar el atraso (BACKGROUND).
+        """
+        rows = session.execute(
+            _CLAIM_SQL,
+            {
+                "limit": limit,
+                "lease_seconds": lease_seconds,
+                "worker": worker,
+                "live_seconds": live_seconds,
+                "live_only": live_only,
+            },
+        ).mappings().all()
+        session.commit()
+        return [dict(r) for r in rows]
+
+    @staticmethod
+    def extend_leases(session: Session, client_ids: List[int], lease_seconds: float, worker: str) -> int:
+        result = session.execute(
+            _EXTEND_SQL,
+            {"client_ids": list(client_ids), "lease_seconds": lease_seconds, "worker": worker},
+        )
+        session.commit()
+        return result.rowcount
+
+    @staticmethod
+    def complete(
+        session: Session, client_id: int, message_ts: datetime, due_at: datetime, worker: str
+    ) -> None:
+        session.execute(
+            _COMPLETE_SQL,
+            {"client_id": client_id, "message_ts": message_ts, "due_at": due_at, "worker": worker},
+        )
+        session.commit()
+
+    @staticmethod
+    def retry(session: Session, client_id: int, worker: str, error: str, delay_seconds: float) -> None:
+        session.execute(
+            _RETRY_SQL,
+            {"client_id": client_id, "worker": worker, "error": error, "delay_seconds": delay_seconds},
+        )
+        session.commit()
+
+    @staticmethod
+    def fail(session: Session, client_id: int, worker: str, error: str) -> None:
+        session.execute(_FAIL_SQL, {"client_id": client_id, "worker": worker, "error": error})
+        session.commit()
@@ -50,6 +50,13 @@ class Cliente(Base_sqlserver):
             )
             return cliente_fake
 
+        # Índice local por sufijo de dígitos; la consulta ILIKE queda como respaldo
+        # mientras el índice no se haya podido cargar.
+        from src.core.client_index import client_phone_index
+
+        if client_phone_index.ensure_loaded():
+            return client_phone_index.lookup(telefono)
+
         like_pattern = f"%{telefono}"
         return (
             session.query(Cliente)
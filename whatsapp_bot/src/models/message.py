@@ -1,8 +1,8 @@
 from sqlalchemy import ForeignKey, DateTime
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import Column, Integer, String, insert
 from datetime import datetime, timezone
 from sqlalchemy.orm import Session
-from typing import Optional
+from typing import List, Optional
 
 from src.models import Base_sqlite
 
@@ -48,3 +48,23 @@ class Message(Base_sqlite):
         session.commit()
         session.refresh(msg)
         return msg
+
+    @staticmethod
+    def insert_many(session: Session, rows: List[dict]) -> List[int]:
+        """
+        INSERT multi-fila con RETURNING; devuelve los ids en el orden de `rows`.
+        Las claves de cada dict son los atributos del modelo (type, no type_).
+        """
+        stmt = insert(Message).returning(Message.id, sort_by_parameter_order=True)
+        ids = [row_id for (row_id,) in session.execute(stmt, rows)]
+        session.commit()
+        return ids
+
+    @staticmethod
+    def update_content(
+        session: Session, message_id: int, content: str, type_: str = "text"
+    ) -> None:
+        session.query(Message).filter(Message.id == message_id).update(
+            {Message.content: content, Message.type: type_}, synchronize_session=False
+        )
+        session.commit()
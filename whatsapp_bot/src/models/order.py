@@ -1,5 +1,7 @@
-from sqlalchemy import ForeignKey, DateTime
+from sqlalchemy import DateTime, insert
 from sqlalchemy import Column, Integer, String
+from sqlalchemy.orm import Session
+from typing import List
 
 from src.models import Base_sqlite
 
@@ -7,14 +9,21 @@ from src.models import Base_sqlite
 class Order(Base_sqlite):
     __tablename__ = "orders"
 
+    # Clientes y Articulos viven en SQL Server: sin FKs entre bases (V5__order_drafts.sql)
     id = Column("Id", Integer, primary_key=True)
     codigo_empresa = Column("CodigoEmpresa", Integer, nullable=False)
     codigo_cliente = Column("CodigoCliente", Integer, nullable=False)
     codigo_articulo = Column("CodigoArticulo", String, nullable=False)
     units = Column("units", Integer, nullable=False)
-    timestamp = Column("timestamp", DateTime, nullable=False)
+    timestamp = Column("timestamp", DateTime(timezone=True), nullable=False)
 
-    __table_args__ = (
-        ForeignKey("Clientes.CodigoCliente", onupdate="CASCADE", ondelete="CASCADE"),
-        ForeignKey("Articulos.CodigoArticulo", onupdate="CASCADE", ondelete="RESTRICT"),
-    )
+    @staticmethod
+    def insert_many(session: Session, rows: List[dict]) -> int:
+        """
+        INSERT multi-fila de líneas de pedido; cada dict lleva codigo_empresa,
+        codigo_cliente, codigo_articulo, units y timestamp. No hace commit.
+        """
+        if not rows:
+            return 0
+        session.execute(insert(Order), rows)
+        return len(rows)
@@ -0,0 +1,64 @@
+from sqlalchemy import Column, DateTime, Integer, String, delete, select, update
+from sqlalchemy.dialects.postgresql import JSONB, insert
+from sqlalchemy.orm import Session
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from src.models import Base_sqlite
+
+
+class OrderDraft(Base_sqlite):
+    __tablename__ = "order_drafts"
+
+    client_id = Column(Integer, primary_key=True)
+    items = Column(JSONB, nullable=False)  # [[codigo, cantidad], ...] en orden de llegada
+    version = Column(Integer, nullable=False, default=1)
+    image_hash = Column(String)  # hash del último resumen enviado al cliente
+    updated_at = Column(DateTime(timezone=True), nullable=False)
+
+    @staticmethod
+    def get(session: Session, client_id: int, for_update: bool = False) -> Optional["OrderDraft"]:
+        stmt = select(OrderDraft).where(OrderDraft.client_id == client_id)
+        if for_update:
+            stmt = stmt.with_for_update()
+        return session.execute(stmt).scalar_one_or_none()
+
+    @staticmethod
+    def upsert_statement(client_id: int, items: List[list], now: datetime):
+        stmt = insert(OrderDraft).values(
+            client_id=client_id, items=items, version=1, image_hash=None, updated_at=now
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[OrderDraft.client_id],
+            set_={
+                "items": stmt.excluded["items"],  # .items es el método de ColumnCollection
+                "version": OrderDraft.version + 1,
+                "image_hash": None,
+                "updated_at": now,
+            },
+        ).returning(OrderDraft.version)
+        return stmt
+
+    @staticmethod
+    def upsert(session: Session, client_id: int, items: List[list]) -> int:
+        """Guarda los ítems y sube la versión; el hash del resumen deja de valer. Devuelve la versión."""
+        stmt = OrderDraft.upsert_statement(client_id, items, datetime.now(timezone.utc))
+        version = session.execute(stmt).scalar_one()
+        session.commit()
+        return version
+
+    @staticmethod
+    def set_image_hash(session: Session, client_id: int, version: int, image_hash: str) -> bool:
+        # Solo si nadie ha cambiado el borrador entretanto
+        result = session.execute(
+            update(OrderDraft)
+            .where(OrderDraft.client_id == client_id, OrderDraft.version == version)
+            .values(image_hash=image_hash)
+        )
+        session.commit()
+        return result.rowcount > 0
+
+    @staticmethod
+    def delete(session: Session, client_id: int) -> None:
+        """Borra el borrador. No hace commit (va en la misma transacción que los pedidos)."""
+        session.execute(delete(OrderDraft).where(OrderDraft.client_id == client_id))
@@ -0,0 +1,195 @@
+from sqlalchemy import Column, DateTime, Integer, String, insert, select, text as sql_text, update
+from sqlalchemy.orm import Session
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+from src.models import Base_sqlite
+
+
+# Reclama filas listas sin bloquear a otros workers (SKIP LOCKED):
+# - 'pending' vencidas, o 'sending' cuyo lease caducó (worker caído)
+# - nunca una fila si hay otra anterior viva para el mismo (from_jid, to_phone):
+#   los dispositivos envían en paralelo pero cada chat recibe en orden
+# - se excluyen los from_jid sin tokens o sin hueco de concurrencia (`excluded`)
+_CLAIM_SQL = sql_text(
+    """
+    WITH next AS (
+        SELECT o.id
+        FROM outbox o
+        WHERE (
+                (o.status = 'pending' AND o.next_attempt_at <= NOW())
+             OR (o.status = 'sending' AND o.locked_until < NOW())
+              )
+          AND NOT (o.from_jid = ANY(:excluded))
+          AND NOT EXISTS (
+                SELECT 1 FROM outbox e
+                WHERE e.from_jid = o.from_jid
+                  AND e.to_phone = o.to_phone
+                  AND e.id < o.id
+                  AND e.status IN ('pending', 'sending')
+              )
+        ORDER BY o.id
+        LIMIT :limit
+        FOR UPDATE OF o SKIP LOCKED
+    )
+    UPDATE outbox
+    SET status = 'sending',
+        attempts = outbox.attempts + 1,
+        locked_until = NOW() + make_interval(secs => :lease_seconds)
+    FROM next
+    WHERE outbox.id = next.id
+    RETURNING outbox.id, outbox.from_jid, outbox.to_phone, outbox.kind,
+              outbox.text, outbox.file_path, outbox.attempts, outbox.created_at
+    """
+)
+
+
+class OutboxMessage(Base_sqlite):
+    __tablename__ = "outbox"
+
+    id = Column(Integer, primary_key=True)
+    from_jid = Column(String, nullable=False)
+    to_phone = Column(String, nullable=False)
+    kind = Column(String, nullable=False)  # 'text' o 'file'
+    text = Column(String)
+    file_path = Column(String)
+    status = Column(String, nullable=False, default="pending")  # pending/sending/sent/failed
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime(timezone=True), nullable=False)
+    locked_until = Column(DateTime(timezone=True))
+    last_error = Column(String)
+    created_at = Column(DateTime(timezone=True), nullable=False)
+    sent_at = Column(DateTime(timezone=True))
+    batch_id = Column(String)  # envíos masivos (POST /messages/batch)
+
+    @staticmethod
+    def enqueue(
+        session: Session,
+        from_jid: str,
+        to_phone: str,
+        kind: str,
+        text: Optional[str] = None,
+        file_path: Optional[str] = None,
+    ) -> int:
+        now = datetime.now(timezone.utc)
+        msg = OutboxMessage(
+            from_jid=from_jid,
+            to_phone=to_phone,
+            kind=kind,
+            text=text,
+            file_path=file_path,
+            status="pending",
+            attempts=0,
+            next_attempt_at=now,
+            created_at=now,
+        )
+        session.add(msg)
+        session.commit()
+        return msg.id
+
+    @staticmethod
+    def enqueue_many(session: Session, rows: List[dict], batch_id: Optional[str] = None) -> List[int]:
+        """
+        INSERT multi-fila de mensajes de texto; cada dict lleva from_jid, to_phone y text.
+        Devuelve los ids en el orden de `rows`.
+        """
+        now = datetime.now(timezone.utc)
+        values = [
+            {
+                "from_jid": row["from_jid"],
+                "to_phone": row["to_phone"],
+                "kind": "text",
+                "text": row["text"],
+                "status": "pending",
+                "attempts": 0,
+                "next_attempt_at": now,
+                "created_at": now,
+                "batch_id": batch_id,
+            }
+            for row in rows
+        ]
+        stmt = insert(OutboxMessage).returning(OutboxMessage.id, sort_by_parameter_order=True)
+        ids = [row_id for (row_id,) in session.execute(stmt, values)]
+        session.commit()
+        return ids
+
+    @staticmethod
+    def batch_status(session: Session, batch_id: str) -> List[dict]:
+        stmt = (
+            select(
+                OutboxMessage.id,
+                OutboxMessage.to_phone,
+                OutboxMessage.status,
+                OutboxMessage.attempts,
+                OutboxMessage.last_error,
+                OutboxMessage.sent_at,
+            )
+            .where(OutboxMessage.batch_id == batch_id)
+            .order_by(OutboxMessage.id)
+        )
+        return [dict(r) for r in session.execute(stmt).mappings().all()]
+
+    @staticmethod
+    def claim(
+        session: Session, limit: int, lease_seconds: float, excluded: List[str]
+    ) -> List[dict]:
+        rows = session.execute(
+            _CLAIM_SQL,
+            {"limit": limit, "lease_seconds": lease_seconds, "excluded": list(excluded)},
+        ).mappings().all()
+        session.commit()
+        return [dict(r) for r in rows]
+
+    @staticmethod
+    def extend_leases(session: Session, message_ids: List[int], lease_seconds: float) -> int:
+        """Renueva el lease de envíos en curso (token bucket, SendFile grande...)."""
+        result = session.execute(
+            update(OutboxMessage)
+            .where(OutboxMessage.id.in_(list(message_ids)), OutboxMessage.status == "sending")
+            .values(
+                locked_until=sql_text("NOW() + make_interval(secs => :lease_seconds)").bindparams(
+                    lease_seconds=lease_seconds
+                )
+            )
+        )
+        session.commit()
+        return result.rowcount
+
+    @staticmethod
+    def mark_sent(session: Session, message_id: int) -> None:
+        session.execute(
+            update(OutboxMessage)
+            .where(OutboxMessage.id == message_id)
+            .values(
+                status="sent",
+                sent_at=datetime.now(timezone.utc),
+                locked_until=None,
+                last_error=None,
+            )
+        )
+        session.commit()
+
+    @staticmethod
+    def mark_retry(
+        session: Session, message_id: int, error: str, delay_seconds: float
+    ) -> None:
+        session.execute(
+            update(OutboxMessage)
+            .where(OutboxMessage.id == message_id)
+            .values(
+                status="pending",
+                next_attempt_at=datetime.now(timezone.utc) + timedelta(seconds=delay_seconds),
+                locked_until=None,
+                last_error=error,
+            )
+        )
+        session.commit()
+
+    @staticmethod
+    def mark_failed(session: Session, message_id: int, error: str) -> None:
+        session.execute(
+            update(OutboxMessage)
+            .where(OutboxMessage.id == message_id)
+            .values(status="failed", locked_until=None, last_error=error)
+        )
+        session.commit()
@@ -73,6 +73,18 @@ class WhatsAppServiceStub(object):
             response_deserializer=whatsapp__pb2.StatusResponse.FromString,
             _registered_method=True,
         )
+        self.SendFile = channel.stream_unary(
+            "/whatsapp.WhatsAppService/SendFile",
+            request_serializer=whatsapp__pb2.FileChunk.SerializeToString,
+            response_deserializer=whatsapp__pb2.SendResponse.FromString,
+            _registered_method=True,
+        )
+        self.DownloadMedia = channel.unary_stream(
+            "/whatsapp.WhatsAppService/DownloadMedia",
+            request_serializer=whatsapp__pb2.MediaRequest.SerializeToString,
+            response_deserializer=whatsapp__pb2.FileChunk.FromString,
+            _registered_method=True,
+        )
 
 
 class WhatsAppServiceServicer(object):
@@ -114,6 +126,18 @@ class WhatsAppServiceServicer(object):
         context.set_details("Method not implemented!")
         raise NotImplementedError("Method not implemented!")
 
+    def SendFile(self, request_iterator, context):
+        """Adjuntos por trozos: el primer FileChunk lleva `meta`, el resto solo `data`"""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details("Method not implemented!")
+        raise NotImplementedError("Method not implemented!")
+
+    def DownloadMedia(self, request, context):
+        """Descarga por trozos del adjunto de un MessageEvent (media_id)"""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details("Method not implemented!")
+        raise NotImplementedError("Method not implemented!")
+
 
 def add_WhatsAppServiceServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -147,6 +171,16 @@ def add_WhatsAppServiceServicer_to_server(servicer, server):
             request_deserializer=whatsapp__pb2.DeviceID.FromString,
             response_serializer=whatsapp__pb2.StatusResponse.SerializeToString,
         ),
+        "SendFile": grpc.stream_unary_rpc_method_handler(
+            servicer.SendFile,
+            request_deserializer=whatsapp__pb2.FileChunk.FromString,
+            response_serializer=whatsapp__pb2.SendResponse.SerializeToString,
+        ),
+        "DownloadMedia": grpc.unary_stream_rpc_method_handler(
+            servicer.DownloadMedia,
+            request_deserializer=whatsapp__pb2.MediaRequest.FromString,
+            response_serializer=whatsapp__pb2.FileChunk.SerializeToString,
+        ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
         "whatsapp.WhatsAppService", rpc_method_handlers
@@ -340,3 +374,63 @@ class WhatsAppService(object):
             metadata,
             _registered_method=True,
         )
+
+    @staticmethod
+    def SendFile(
+        request_iterator,
+        target,
+        options=(),
+        channel_credentials=None,
+        call_credentials=None,
+        insecure=False,
+        compression=None,
+        wait_for_ready=None,
+        timeout=None,
+        metadata=None,
+    ):
+        return grpc.experimental.stream_unary(
+            request_iterator,
+            target,
+            "/whatsapp.WhatsAppService/SendFile",
+            whatsapp__pb2.FileChunk.SerializeToString,
+            whatsapp__pb2.SendResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True,
+        )
+
+    @staticmethod
+    def DownloadMedia(
+        request,
+        target,
+        options=(),
+        channel_credentials=None,
+        call_credentials=None,
+        insecure=False,
+        compression=None,
+        wait_for_ready=None,
+        timeout=None,
+        metadata=None,
+    ):
+        return grpc.experimental.unary_stream(
+            request,
+            target,
+            "/whatsapp.WhatsAppService/DownloadMedia",
+            whatsapp__pb2.MediaRequest.SerializeToString,
+            whatsapp__pb2.FileChunk.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True,
+        )
@@ -0,0 +1,143 @@
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Hashable, List, Optional
+
+from src.core import metrics
+
+
+class KeyedWorkerPool:
+    """
+    Pool de hilos con cola acotada y orden garantizado por clave.
+
+    - Los elementos con la misma clave (conversación) se procesan en orden, de uno en uno.
+    - Claves distintas se procesan en paralelo hasta `workers` a la vez.
+    - `submit` bloquea cuando hay `max_pending` elementos sin terminar (backpressure).
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[Any], None],
+        workers: int = 4,
+        max_pending: int = 200,
+        name: str = "ingest",
+    ):
+        self.handler = handler
+        self.name = name
+        self.workers = max(1, workers)
+        self.max_pending = max(1, max_pending)
+
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._ready: "queue.Queue[Optional[Hashable]]" = queue.Queue()
+        self._pending: Dict[Hashable, Deque[Any]] = {}
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._depth = 0
+        self._active = 0
+        self._processed = 0
+        self._failed = 0
+        self._blocked_submits = 0
+        self._max_depth_seen = 0
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> "KeyedWorkerPool":
+        for i in range(self.workers):
+            t = threading.Thread(
+                target=self._run, daemon=True, name=f"{self.name}-{i}"
+            )
+            t.start()
+            self._threads.append(t)
+        metrics.register(self.name, self.stats)
+        logging.info(
+            f"{self.name} pool started (workers={self.workers}, max_pending={self.max_pending})"
+        )
+        return self
+
+    def submit(self, key: Hashable, item: Any):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._blocked_submits += 1
+            logging.warning(
+                f"{self.name} queue full ({self.max_pending}); waiting for workers"
+            )
+            self._slots.acquire()
+
+        with self._lock:
+            self._depth += 1
+            self._max_depth_seen = max(self._max_depth_seen, self._depth)
+            pending = self._pending.get(key)
+            if pending is not None:
+                # La conversación ya está en cola o procesándose: se encadena detrás.
+                pending.append(item)
+                return
+            self._pending[key] = deque([item])
+        self._ready.put(key)
+
+    def _run(self):
+        while True:
+            key = self._ready.get()
+            if key is None:
+                return
+
+            with self._lock:
+                item = self._pending[key][0]
+                self._active += 1
+
+            try:
+                self.handler(item)
+            except Exception as e:
+                logging.exception(f"{self.name} worker error on {key}: {e}")
+                with self._lock:
+                    self._failed += 1
+            finally:
+                with self._lock:
+                    self._active -= 1
+                    self._processed += 1
+                    self._depth -= 1
+                    pending = self._pending[key]
+                    pending.popleft()
+                    if pending:
+                        self._ready.put(key)
+                    else:
+                        del self._pending[key]
+                    if self._depth == 0:
+                        self._idle.notify_all()
+                self._slots.release()
+
+    def depth(self) -> int:
+        with self._lock:
+            return self._depth
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """Espera a que se vacíe la cola. Devuelve False si vence el timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            while self._depth > 0:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        return True
+
+    def shutdown(self, wait: bool = True, timeout: Optional[float] = None):
+        if wait:
+            self.join(timeout)
+        for _ in self._threads:
+            self._ready.put(None)
+        metrics.unregister(self.name)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "depth": self._depth,
+                "active": self._active,
+                "conversations": len(self._pending),
+                "processed": self._processed,
+                "failed": self._failed,
+                "blocked_submits": self._blocked_submits,
+                "max_depth_seen": self._max_depth_seen,
+            }
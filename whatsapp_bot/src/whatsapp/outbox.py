@@ -0,0 +1,388 @@
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from typing import BinaryIO, Dict, Iterable, List, Optional, Set, Tuple, Union
+
+from dotenv import load_dotenv
+
+from src.core import metrics
+from src.core.database import postgres_session
+from src.core.ratelimit import KeyedTokenBuckets
+from src.grpc.devices import device_registry
+from src.grpc.handlers import file_chunks
+from src.models.outbox import OutboxMessage
+from src.proto.whatsapp_pb2 import SendRequest
+from src.whatsapp.supervisor import backoff_delay
+
+load_dotenv()
+OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", "4"))
+# Límite por dispositivo (from_jid): mensajes/segundo sostenidos y ráfaga máxima
+OUTBOX_RATE = float(os.getenv("OUTBOX_RATE", "0.5"))
+OUTBOX_BURST = float(os.getenv("OUTBOX_BURST", "5"))
+# Envíos simultáneos como mucho por dispositivo (el resto de workers atiende a otros)
+OUTBOX_DEVICE_CONCURRENCY = int(os.getenv("OUTBOX_DEVICE_CONCURRENCY", "2"))
+OUTBOX_BATCH_MAX = int(os.getenv("OUTBOX_BATCH_MAX", "1000"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "6"))
+OUTBOX_BACKOFF_BASE = float(os.getenv("OUTBOX_BACKOFF_BASE", "2"))
+OUTBOX_BACKOFF_MAX = float(os.getenv("OUTBOX_BACKOFF_MAX", "300"))
+# Un 'sending' sin resolver en este tiempo (worker caído) vuelve a reclamarse
+OUTBOX_LEASE_SECONDS = float(os.getenv("OUTBOX_LEASE_SECONDS", "120"))
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "1"))
+# Copia de los adjuntos encolados: el llamante puede borrar su fichero al volver
+OUTBOX_DIR = os.getenv("OUTBOX_DIR", os.path.join(os.getcwd(), "media", "outbox"))
+
+
+class PermanentSendError(Exception):
+    """Error que no se arregla reintentando (p.ej. el adjunto ya no existe)."""
+
+
+def spool_file(source: Union[str, BinaryIO], filename: str) -> str:
+    """Copia un fichero (ruta o fichero abierto) al directorio de la cola y devuelve la ruta."""
+    spool_dir = os.path.join(OUTBOX_DIR, uuid.uuid4().hex)
+    os.makedirs(spool_dir, exist_ok=True)
+    dest = os.path.join(spool_dir, os.path.basename(filename) or "file.bin")
+    if isinstance(source, str):
+        shutil.copyfile(source, dest)
+    else:
+        with open(dest, "wb") as f:
+            shutil.copyfileobj(source, f)
+    return dest
+
+
+def _remove_spooled(path: Optional[str]):
+    if not path or not os.path.abspath(path).startswith(os.path.abspath(OUTBOX_DIR)):
+        return
+    shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+
+
+def _enqueue(kind: str, to: str, from_jid: str, text=None, file_path=None) -> int:
+    with postgres_session() as session:
+        message_id = OutboxMessage.enqueue(
+            session, from_jid, to, kind, text=text, file_path=file_path
+        )
+    outbox_sender.notify()
+    logging.info(f"Queued {kind} #{message_id} to={to} from_jid={from_jid}")
+    return message_id
+
+
+def queue_message(to: str, text: str, from_jid: str) -> Optional[int]:
+    """Encola un texto y vuelve en cuanto está en Postgres; lo envían los sender workers."""
+    if not from_jid:
+        logging.error("from_jid is required, but none was provided")
+        return None
+    return _enqueue("text", to, from_jid, text=text)
+
+
+def queue_file(
+    to: str,
+    source: Union[str, BinaryIO],
+    from_jid: str,
+    filename: Optional[str] = None,
+    text: Optional[str] = None,
+) -> Optional[int]:
+    """
+    Encola un adjunto. `source` es una ruta o un fichero binario abierto; se copia
+    a OUTBOX_DIR, así que el llamante puede borrar el original al volver.
+    """
+    if not from_jid:
+        logging.error("from_jid is required, but none was provided")
+        return None
+    if isinstance(source, str) and not os.path.exists(source):
+        logging.error(f"File not found: {source}")
+        return None
+
+    path = spool_file(source, filename or (source if isinstance(source, str) else "file.bin"))
+    try:
+        return _enqueue("file", to, from_jid, text=text, file_path=path)
+    except Exception:
+        _remove_spooled(path)
+        raise
+
+
+def queue_batch(from_jid: str, items: Iterable[Tuple[str, str]]) -> Tuple[str, List[int]]:
+    """
+    Encola un envío masivo (pares destinatario, texto) en un solo INSERT.
+    Devuelve el id del trabajo (batch_id) y los ids de la outbox.
+    """
+    seen = set()
+    rows = []
+    for to, text in items:
+        if (to, text) in seen:
+            continue
+        seen.add((to, text))
+        rows.append({"from_jid": from_jid, "to_phone": to, "text": text})
+    if not rows:
+        raise ValueError("batch has no recipients")
+    if len(rows) > OUTBOX_BATCH_MAX:
+        raise ValueError(f"batch too large: {len(rows)} > {OUTBOX_BATCH_MAX}")
+
+    job_id = uuid.uuid4().hex
+    with postgres_session() as session:
+        ids = OutboxMessage.enqueue_many(session, rows, batch_id=job_id)
+    outbox_sender.notify()
+    logging.info(f"Queued batch {job_id}: {len(ids)} messages from_jid={from_jid}")
+    return job_id, ids
+
+
+class BatchTracker:
+    """
+    Sigue el estado de un envío masivo: cada `poll()` devuelve solo los
+    destinatarios que han cambiado desde la llamada anterior y un resumen.
+    """
+
+    FINAL = ("sent", "failed")
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self._seen: Dict[int, tuple] = {}
+
+    @staticmethod
+    def _line(row: dict) -> dict:
+        return {
+            "id": row["id"],
+            "to": row["to_phone"],
+            "status": row["status"],
+            "attempts": row["attempts"],
+            "error": row["last_error"],
+            "sent_at": row["sent_at"].isoformat() if row["sent_at"] else None,
+        }
+
+    def poll(self) -> Tuple[List[dict], dict]:
+        with postgres_session() as session:
+            rows = OutboxMessage.batch_status(session, self.job_id)
+
+        changes = []
+        for row in rows:
+            key = (row["status"], row["attempts"])
+            if self._seen.get(row["id"]) != key:
+                self._seen[row["id"]] = key
+                changes.append(self._line(row))
+
+        counts = Counter(row["status"] for row in rows)
+        summary = {
+            "job_id": self.job_id,
+            "total": len(rows),
+            **{status: counts.get(status, 0) for status in ("pending", "sending", "sent", "failed")},
+            "done": bool(rows) and all(row["status"] in self.FINAL for row in rows),
+        }
+        return changes, summary
+
+
+class OutboxSender:
+    """
+    Vacía la tabla outbox con `workers` hilos.
+
+    Cada worker reclama filas con FOR UPDATE SKIP LOCKED (ver OutboxMessage.claim):
+    los dispositivos avanzan en paralelo, pero un chat nunca tiene dos envíos en vuelo,
+    así que recibe en el orden de encolado. Un token bucket por from_jid limita el
+    ritmo de cada dispositivo y `device_concurrency` acota sus envíos simultáneos;
+    los fallos se reintentan con backoff exponencial. Un hilo renueva el lease de lo
+    que está en curso (esperas de token/dispositivo, SendFile largos) para que otro
+    worker no lo reclame y lo envíe dos veces.
+    """
+
+    def __init__(
+        self,
+        workers: int = OUTBOX_WORKERS,
+        rate: float = OUTBOX_RATE,
+        burst: float = OUTBOX_BURST,
+        device_concurrency: int = OUTBOX_DEVICE_CONCURRENCY,
+    ):
+        self.workers = workers
+        self.buckets = KeyedTokenBuckets(rate, burst)
+        self.device_concurrency = device_concurrency
+        self._device_cond = threading.Condition()
+        self._in_flight: Dict[str, int] = {}
+        self._claimed: Set[int] = set()  # ids reclamados por este proceso y aún sin cerrar
+        self.stub = None
+        self._wake = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._sent = 0
+        self._retried = 0
+        self._failed = 0
+        self._throttled_waits = 0
+        self._delivery_seconds = 0.0
+        self._max_delivery_seconds = 0.0
+
+    def start(self, stub) -> "OutboxSender":
+        with self._lock:
+            if self._threads:
+                return self
+            self.stub = stub
+            for i in range(self.workers):
+                t = threading.Thread(target=self._run, daemon=True, name=f"outbox-{i}")
+                t.start()
+                self._threads.append(t)
+            t = threading.Thread(target=self._heartbeat, daemon=True, name="outbox-lease")
+            t.start()
+            self._threads.append(t)
+        logging.info(f"Outbox sender started with {self.workers} workers")
+        return self
+
+    def notify(self):
+        """Despierta a los workers (mensaje encolado en este proceso)."""
+        self._wake.set()
+
+    def _saturated(self) -> List[str]:
+        with self._device_cond:
+            return [jid for jid, n in self._in_flight.items() if n >= self.device_concurrency]
+
+    def _acquire_device(self, jid: str):
+        # El claim ya excluye dispositivos saturados; esto cubre la carrera entre workers
+        with self._device_cond:
+            while self._in_flight.get(jid, 0) >= self.device_concurrency:
+                self._device_cond.wait()
+            self._in_flight[jid] = self._in_flight.get(jid, 0) + 1
+
+    def _release_device(self, jid: str):
+        with self._device_cond:
+            self._in_flight[jid] -= 1
+            if not self._in_flight[jid]:
+                del self._in_flight[jid]
+            self._device_cond.notify_all()
+
+    def _run(self):
+        while True:
+            # clear antes de reclamar: un notify() durante el claim no se pierde
+            self._wake.clear()
+            try:
+                with postgres_session() as session:
+                    excluded = set(self.buckets.exhausted()) | set(self._saturated())
+                    rows = OutboxMessage.claim(session, 1, OUTBOX_LEASE_SECONDS, list(excluded))
+            except Exception as e:
+                logging.error(f"Outbox claim failed: {e}")
+                rows = []
+
+            if not rows:
+                self._wake.wait(OUTBOX_POLL_SECONDS)
+                continue
+            with self._lock:
+                self._claimed.update(row["id"] for row in rows)
+            for row in rows:
+                try:
+                    self._acquire_device(row["from_jid"])
+                    try:
+                        self._process(row)
+                    finally:
+                        self._release_device(row["from_jid"])
+                except Exception as e:
+                    # La fila queda en 'sending' y se reclama al caducar el lease
+                    logging.exception(f"Outbox #{row['id']} could not be processed: {e}")
+                finally:
+                    with self._lock:
+                        self._claimed.discard(row["id"])
+
+    def _heartbeat(self):
+        while True:
+            time.sleep(OUTBOX_LEASE_SECONDS / 3)
+            with self._lock:
+                message_ids = list(self._claimed)
+            if not message_ids:
+                continue
+            try:
+                with postgres_session() as session:
+                    OutboxMessage.extend_leases(session, message_ids, OUTBOX_LEASE_SECONDS)
+            except Exception as e:
+                logging.error(f"Outbox lease renewal failed: {e}")
+
+    def _process(self, row: dict):
+        bucket = self.buckets.get(row["from_jid"])
+        if not bucket.try_acquire():
+            # Otro worker se llevó el último token entre el claim y aquí
+            with self._lock:
+                self._throttled_waits += 1
+            bucket.acquire()
+
+        try:
+            ok, error = self._deliver(row)
+        except PermanentSendError as e:
+            self._finish_failed(row, str(e))
+            return
+        except Exception as e:
+            ok, error = False, f"gRPC error: {e}"
+
+        if ok:
+            self._finish_sent(row)
+        elif row["attempts"] >= OUTBOX_MAX_ATTEMPTS:
+            self._finish_failed(row, error)
+        else:
+            delay = backoff_delay(row["attempts"], OUTBOX_BACKOFF_BASE, OUTBOX_BACKOFF_MAX)
+            logging.warning(
+                f"Outbox #{row['id']} to={row['to_phone']} failed "
+                f"(attempt {row['attempts']}/{OUTBOX_MAX_ATTEMPTS}): {error}; retrying in {delay:.1f}s"
+            )
+            with postgres_session() as session:
+                OutboxMessage.mark_retry(session, row["id"], error, delay)
+            with self._lock:
+                self._retried += 1
+
+    def _deliver(self, row: dict) -> Tuple[bool, str]:
+        if row["kind"] == "file":
+            path = row["file_path"]
+            if not path or not os.path.exists(path):
+                raise PermanentSendError(f"file not found: {path}")
+            with open(path, "rb") as f:
+                resp = self.stub.SendFile(
+                    file_chunks(
+                        f,
+                        row["to_phone"],
+                        os.path.basename(path),
+                        text=row["text"],
+                        from_jid=row["from_jid"],
+                    )
+                )
+        else:
+            resp = self.stub.SendMessage(
+                SendRequest(to=row["to_phone"], text=row["text"] or "", from_jid=row["from_jid"])
+            )
+        if not resp.success:
+            device_registry.check_send_error(resp.error)
+        return resp.success, resp.error
+
+    def _finish_sent(self, row: dict):
+        with postgres_session() as session:
+            OutboxMessage.mark_sent(session, row["id"])
+        _remove_spooled(row["file_path"])
+        latency = (datetime.now(timezone.utc) - row["created_at"]).total_seconds()
+        with self._lock:
+            self._sent += 1
+            self._delivery_seconds += latency
+            self._max_delivery_seconds = max(self._max_delivery_seconds, latency)
+        logging.info(f"Outbox #{row['id']} sent to {row['to_phone']} ({latency:.2f}s after queueing)")
+
+    def _finish_failed(self, row: dict, error: str):
+        logging.error(f"Outbox #{row['id']} to={row['to_phone']} gave up: {error}")
+        with postgres_session() as session:
+            OutboxMessage.mark_failed(session, row["id"], error)
+        _remove_spooled(row["file_path"])
+        with self._lock:
+            self._failed += 1
+
+    def stats(self) -> dict:
+        throttled = self.buckets.exhausted()
+        with self._device_cond:
+            in_flight = sum(self._in_flight.values())
+        with self._lock:
+            return {
+                "workers": self.workers if self._threads else 0,
+                "sent": self._sent,
+                "retried": self._retried,
+                "failed": self._failed,
+                "in_flight": in_flight,
+                "throttled_devices": len(throttled),
+                "throttled_waits": self._throttled_waits,
+                "avg_delivery_seconds": (
+                    round(self._delivery_seconds / self._sent, 3) if self._sent else 0.0
+                ),
+                "max_delivery_seconds": round(self._max_delivery_seconds, 3),
+            }
+
+
+outbox_sender = OutboxSender()
+metrics.register("outbox", outbox_sender.stats)
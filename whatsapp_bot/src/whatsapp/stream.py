@@ -1,25 +1,33 @@
+import asyncio
 import os
 import logging
-import grpc
 from datetime import datetime, timezone
 from sqlalchemy.orm import Session
 
-from src.proto.whatsapp_pb2 import Empty, MessageEvent
-from src.core.database import get_sqlserver_session, get_postgres_session
-from src.grpc.handlers import send_message, delete_device, login_and_send_qr
+from src.proto.whatsapp_pb2 import MessageEvent
+from src.core.database import postgres_session, sqlserver_session
+from src.grpc.handlers import send_message, delete_device, login_and_send_qr, download_media
 from src.ai.agent import handle_incoming_message
-from src.media.ocr import extract_text_from_image
-from src.media.audio import transcribe_audio
-from src.media.documents import (
-    extract_text_from_csv,
-    extract_text_from_docx,
-    extract_text_from_pdf,
-    extract_text_from_txt,
-    extract_text_from_xlsx,
-)
+from src.ai.scheduler import unattended_scheduler
+from src.ai.history import conversation_history
+from src.media.extraction import media_extractor, media_subdir
 from src.models.user import User
 from src.models.message import Message
 from src.models.client import Cliente
+from src.whatsapp.ingest import KeyedWorkerPool
+from src.whatsapp.supervisor import StreamSupervisor
+from src.core.writebehind import WriteBehindBuffer
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "4"))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "200"))
+
+message_writer = WriteBehindBuffer(
+    "message_writer",
+    postgres_session,
+    Message.insert_many,
+    max_batch=int(os.getenv("MESSAGE_BATCH_SIZE", "100")),
+    max_delay_ms=float(os.getenv("MESSAGE_FLUSH_MS", "5")),
+)
 
 
 def normalize_number(raw):
@@ -75,49 +83,74 @@ def handle_admin_command(
     return False
 
 
-def stream_messages(stub):
-    logging.info("Connecting to WhatsApp message stream...")
-    base_dir = "media"
-    os.makedirs(base_dir, exist_ok=True)
+def conversation_key(sender_norm: str, receiver_norm: str) -> tuple:
+    # Misma clave para ambos sentidos de una conversación: se procesan en orden.
+    return tuple(sorted((sender_norm, receiver_norm)))
 
-    sqlserver_session = get_sqlserver_session()
-    postgres_session = get_postgres_session()
 
-    try:
+def process_event(msg: MessageEvent, stub, base_dir: str):
+    sender = getattr(msg, "from").split("@")[0].split(":")[0]
+    receiver = msg.to.split(":")[0]
+    sender_norm = normalize_number(sender)
+    receiver_norm = normalize_number(receiver)
 
-        for msg in stub.StreamMessages(Empty()):
-            sender = getattr(msg, "from").split("@")[0].split(":")[0]
-            receiver = msg.to.split(":")[0]
-            sender_norm = normalize_number(sender)
-            receiver_norm = normalize_number(receiver)
+    with postgres_session() as pg_session, sqlserver_session() as ss_session:
+        if handle_admin_command(msg, sender_norm, receiver_norm, stub, pg_session):
+            return
 
-            logging.info(f"New message: {sender} → {receiver} ({msg.timestamp})")
+        matched_id, direction, message_type, final_content, saved_path = \
+        store_message_if_applicable(msg, sender, receiver, pg_session, ss_session, base_dir, stub)
 
-            if handle_admin_command(
-                msg, sender_norm, receiver_norm, stub, postgres_session
-            ):
-                continue
+    if message_type == "text" and final_content:
+        preview = final_content.replace("\n", " ")[:200]
+        logging.info(f"Message content (normalized): {preview}")
+    elif msg.binary or msg.media_id:
+        logging.info(
+            f"Binary message received: {msg.filename or 'unnamed_file'}; "
+            f"saved to {saved_path or 'N/A'}; bytes={len(msg.binary) or msg.media_size}"
+        )
+    elif msg.text.strip():
+        logging.info(f"Message content: {msg.text.strip()}")
 
-            matched_id, direction, message_type, final_content, saved_path = \
-            store_message_if_applicable(msg, sender, receiver, postgres_session, sqlserver_session, base_dir)
 
-            if message_type == "text" and final_content:
-                preview = final_content.replace("\n", " ")[:200]
-                logging.info(f"Message content (normalized): {preview}")
-            elif msg.binary:
-                logging.info(
-                    f"Binary message received: {msg.filename or 'unnamed_file'}; "
-                    f"saved to {saved_path or 'N/A'}; bytes={len(msg.binary)}"
-                )
-            elif msg.text.strip():
-                logging.info(f"Message content: {msg.text.strip()}")
+def stream_messages(stub):
+    """Bloqueante: ejecuta el consumidor async en el loop del canal gRPC compartido."""
+    stub.runtime.run(stream_messages_async(stub))
 
-    except grpc.RpcError as e:
-        logging.error(f"gRPC stream error: {e.code().name} - {e.details()}")
 
+async def stream_messages_async(stub):
+    """
+    Consume StreamMessages con grpc.aio y se reconecta solo si el bridge se cae.
+    `stub` es la fachada síncrona: los workers de ingesta (hilos) la usan para responder.
+    """
+    logging.info("Connecting to WhatsApp message stream...")
+    base_dir = "media"
+    os.makedirs(base_dir, exist_ok=True)
+    loop = asyncio.get_running_loop()
+
+    pool = KeyedWorkerPool(
+        lambda msg: process_event(msg, stub, base_dir),
+        workers=INGEST_WORKERS,
+        max_pending=INGEST_QUEUE_SIZE,
+        name="ingest",
+    ).start()
+
+    async def on_event(msg: MessageEvent):
+        sender = getattr(msg, "from").split("@")[0].split(":")[0]
+        receiver = msg.to.split(":")[0]
+        key = conversation_key(normalize_number(sender), normalize_number(receiver))
+
+        logging.info(
+            f"New message: {sender} → {receiver} ({msg.timestamp}); ingest depth={pool.depth()}"
+        )
+        # Si la cola está llena, submit bloquea en un hilo aparte y el stream
+        # deja de leer (backpressure) sin parar el loop del canal.
+        await loop.run_in_executor(None, pool.submit, key, msg)
+
+    try:
+        await StreamSupervisor(stub.runtime, on_event).run()
     finally:
-        sqlserver_session.close()
-        postgres_session.close()
+        await loop.run_in_executor(None, pool.shutdown, True)
 
 
 def store_message_if_applicable(
@@ -127,6 +160,7 @@ def store_message_if_applicable(
     postgres_session: Session,
     sqlserver_session: Session,
     base_dir: str,
+    stub=None,
 ):
     direction = None
     matched_cliente = Cliente.get_by_telefono(sqlserver_session, sender)
@@ -150,76 +184,80 @@ def store_message_if_applicable(
     )
     saved_path = None
 
-    if msg.binary:
+    extraction = None
+    if msg.binary or msg.media_id:
         message_type = "media"
         filename = msg.filename or f"file_{msg.timestamp}.bin"
         ext = os.path.splitext(filename)[1].lower()
-
-        subdir = (
-            "images"
-            if ext in [".jpg", ".jpeg", ".png", ".webp"]
-            else (
-                "audio"
-                if ext in [".mp3", ".ogg", ".wav", ".opus"]
-                else "video" if ext in [".mp4", ".avi", ".mkv"] else "documents"
-            )
-        )
+        subdir = media_subdir(ext)
 
         full_dir = os.path.join(base_dir, subdir)
         os.makedirs(full_dir, exist_ok=True)
         file_path = os.path.join(full_dir, filename)
-        saved_path = file_path
-        text = ""
         try:
-            with open(file_path, "wb") as f:
-                f.write(msg.binary)
+            if msg.media_id:
+                # Adjunto por trozos desde el bridge, directo a disco
+                download_media(stub, msg.media_id, file_path)
+            else:
+                with open(file_path, "wb") as f:
+                    f.write(msg.binary)
             logging.info(f"Saved media file: {file_path}")
-
-            if subdir == "images":
-                text = extract_text_from_image(msg.binary)
-                if text:
-                    content = text
-                    message_type = "text"
-            elif subdir == "audio":
-                text = transcribe_audio(msg.binary, extension=ext)
-                if text:
-                    content = text
-                    message_type = "text"
-            elif subdir == "documents":
-                text = None
-                if ext == ".pdf":
-                    text = extract_text_from_pdf(file_path)
-                elif ext == ".docx":
-                    text = extract_text_from_docx(file_path)
-                elif ext == ".txt":
-                    text = extract_text_from_txt(file_path)
-                elif ext == ".csv":
-                    text = extract_text_from_csv(file_path)
-                elif ext == ".xlsx":
-                    text = extract_text_from_xlsx(file_path)
-
-                if text and text.strip():
-                    content = text.strip()
-                    message_type = "text"
-            
-            logging.info(f"Extracted text: {text}")
+            saved_path = file_path
+            if subdir != "video":
+                extraction = (file_path, subdir, ext)
         except Exception as e:
             logging.error(f"Error saving media: {e}")
 
-    Message.create(
-        session=postgres_session,
-        client_id=matched_id,
-        client_phone=receiver if direction == "sent" else sender,
-        direction=direction,
-        type_=message_type,
-        content=content.replace("\n", " "),
-        user_id=user.id,
-        user_phone=sender if direction == "sent" else receiver,
-        timestamp=parse_flexible_timestamp(msg.timestamp),
+    timestamp = parse_flexible_timestamp(msg.timestamp)
+    # Write-behind: se inserta en el siguiente lote; el id llega por el Future
+    stored_id = message_writer.submit(
+        dict(
+            client_id=matched_id,
+            client_phone=receiver if direction == "sent" else sender,
+            direction=direction,
+            type=message_type,
+            content=content.replace("\n", " "),
+            user_id=user.id,
+            user_phone=sender if direction == "sent" else receiver,
+            timestamp=timestamp,
+        )
     )
+    conversation_history.append(matched_id, direction, content.replace("\n", " "), timestamp)
+    unattended_scheduler.notify(matched_id, direction, timestamp)
+
+    if extraction:
+        # OCR/Vosk/PDF fuera de proceso: la fila ya está guardada como 'media'
+        # y se actualiza cuando termine la extracción.
+        had_text = bool(content.strip())
+        unattended_scheduler.expect_content(matched_id, direction, timestamp)
+        media_extractor.submit(
+            *extraction,
+            on_done=lambda text: apply_extracted_text(
+                stored_id.result(), matched_id, direction, timestamp, text, had_text
+            ),
+        )
     return matched_id, direction, message_type, content, saved_path
 
 
+def apply_extracted_text(
+    message_id: int,
+    client_id: int,
+    direction: str,
+    timestamp: datetime,
+    text: str | None,
+    had_text: bool,
+):
+    logging.info(f"Extracted text for message {message_id}: {text}")
+    if not text or not text.strip():
+        unattended_scheduler.content_unavailable(client_id, direction, timestamp)
+        return
+    with postgres_session() as session:
+        Message.update_content(session, message_id, text.strip().replace("\n", " "), "text")
+    conversation_history.update_content(client_id, direction, timestamp, text.strip().replace("\n", " "))
+    # Avisamos a la etapa de IA de que ya hay texto que procesar
+    unattended_scheduler.content_available(client_id, direction, timestamp, rearm=not had_text)
+
+
 def parse_flexible_timestamp(ts: str) -> datetime:
     s = str(ts).strip()
     if s.endswith("Z"):
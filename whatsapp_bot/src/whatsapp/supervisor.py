@@ -0,0 +1,178 @@
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Optional
+
+import grpc
+
+from src.core import metrics
+from src.proto.whatsapp_pb2 import Empty
+
+STREAM_BACKOFF_BASE = float(os.getenv("STREAM_BACKOFF_BASE", "0.5"))
+STREAM_BACKOFF_MAX = float(os.getenv("STREAM_BACKOFF_MAX", "30"))
+# Sin eventos durante este tiempo se comprueba el canal con un RPC corto
+STREAM_IDLE_TIMEOUT = float(os.getenv("STREAM_IDLE_TIMEOUT", "120"))
+STREAM_PROBE_TIMEOUT = float(os.getenv("STREAM_PROBE_TIMEOUT", "5"))
+# Un stream que aguanta este tiempo se considera sano: la backoff vuelve a empezar
+STREAM_STABLE_SECONDS = float(os.getenv("STREAM_STABLE_SECONDS", "60"))
+
+
+class StreamStalled(Exception):
+    pass
+
+
+def backoff_delay(attempt: int, base: float = STREAM_BACKOFF_BASE, cap: float = STREAM_BACKOFF_MAX) -> float:
+    """Backoff exponencial con 'full jitter': uniforme en [0, min(cap, base * 2^attempt)]."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def _iso(ts: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat() if ts else None
+
+
+class StreamSupervisor:
+    """
+    Mantiene vivo StreamMessages: si el bridge Go se reinicia o el stream queda
+    medio abierto, vuelve a suscribirse con backoff exponencial con jitter.
+
+    Se ejecuta en el loop del canal gRPC (`runtime.run(supervisor.run())`).
+    `on_event(msg)` es una corrutina; si tarda (backpressure) el stream deja de leer.
+    """
+
+    def __init__(self, runtime, on_event: Callable[[Any], Awaitable[None]], name: str = "stream"):
+        self.runtime = runtime
+        self.on_event = on_event
+        self.name = name
+
+        self._lock = threading.Lock()
+        self._connected = False
+        self._connects = 0
+        self._reconnects = 0
+        self._stalls = 0
+        self._probes = 0
+        self._events = 0
+        self._last_event_at: Optional[float] = None
+        self._down_since: Optional[float] = None
+        self._last_gap: Optional[dict] = None
+        self._max_gap_seconds = 0.0
+        self._total_gap_seconds = 0.0
+        metrics.register(name, self.stats)
+
+    async def _probe(self) -> bool:
+        """¿Sigue vivo el canal? Un stream sin tráfico no distingue 'sin mensajes' de 'medio abierto'."""
+        with self._lock:
+            self._probes += 1
+        try:
+            await self.runtime.stub.ListDevices(Empty(), timeout=STREAM_PROBE_TIMEOUT)
+            return True
+        except Exception as e:
+            logging.warning(f"{self.name}: idle probe failed ({e!r})")
+            return False
+
+    async def _consume(self):
+        await self.runtime.ready()
+        call = self.runtime.stub.StreamMessages(Empty())
+        read = None
+        try:
+            read = asyncio.ensure_future(call.read())
+            first = True
+            while True:
+                done, _ = await asyncio.wait({read}, timeout=STREAM_IDLE_TIMEOUT)
+                if not done:
+                    if await self._probe():
+                        if first:
+                            self._mark_up()
+                            first = False
+                        continue
+                    raise StreamStalled(f"no events for {STREAM_IDLE_TIMEOUT:.0f}s and channel probe failed")
+
+                msg = read.result()
+                if msg is grpc.aio.EOF:
+                    raise StreamStalled("server closed the stream")
+                if first:
+                    self._mark_up()
+                    first = False
+                with self._lock:
+                    self._events += 1
+                    self._last_event_at = time.time()
+                await self.on_event(msg)
+                read = asyncio.ensure_future(call.read())
+        finally:
+            if read is not None:
+                read.cancel()
+            call.cancel()
+
+    def _mark_up(self):
+        now = time.time()
+        with self._lock:
+            self._connected = True
+            if self._down_since is None:
+                return
+            gap = now - self._down_since
+            # Ventana en la que pudieron perderse eventos: del último evento visto
+            # al primero recibido tras reconectar
+            self._last_gap = {
+                "seconds": round(gap, 2),
+                "down_since": _iso(self._down_since),
+                "last_event_before": _iso(self._last_event_at),
+                "first_event_after": _iso(now),
+            }
+            self._max_gap_seconds = max(self._max_gap_seconds, gap)
+            self._total_gap_seconds += gap
+            self._down_since = None
+        logging.info(f"{self.name}: stream recovered after {gap:.1f}s")
+
+    def _mark_down(self):
+        with self._lock:
+            self._connected = False
+            if self._down_since is None:
+                self._down_since = time.time()
+
+    async def run(self):
+        attempt = 0
+        while True:
+            started = time.monotonic()
+            with self._lock:
+                self._connects += 1
+                if self._connects > 1:
+                    self._reconnects += 1
+            logging.info(f"{self.name}: subscribing to StreamMessages (attempt {attempt + 1})")
+            try:
+                await self._consume()
+            except asyncio.CancelledError:
+                raise
+            except StreamStalled as e:
+                with self._lock:
+                    self._stalls += 1
+                logging.warning(f"{self.name}: {e}")
+            except grpc.RpcError as e:
+                logging.error(f"{self.name}: gRPC stream error: {e.code().name} - {e.details()}")
+            except Exception as e:
+                logging.exception(f"{self.name}: unexpected error consuming stream: {e}")
+            self._mark_down()
+
+            if time.monotonic() - started >= STREAM_STABLE_SECONDS:
+                attempt = 0
+            delay = backoff_delay(attempt)
+            attempt += 1
+            logging.info(f"{self.name}: reconnecting in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "connected": self._connected,
+                "reconnects": self._reconnects,
+                "stalls": self._stalls,
+                "idle_probes": self._probes,
+                "events": self._events,
+                "last_event_at": _iso(self._last_event_at),
+                "down_since": _iso(self._down_since),
+                "last_gap": self._last_gap,
+                "max_gap_seconds": round(self._max_gap_seconds, 2),
+                "total_gap_seconds": round(self._total_gap_seconds, 2),
+            }
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Los módulos se importan como `src.*` desde whatsapp_bot/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,39 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from src.ai import agent
+from src.ai.drafts import DraftOrder
+from src.ai.post import FastPathResult
+
+DRAFT = DraftOrder(7, {"A100": 2}, 1, None, datetime.now(timezone.utc))
+CONFIRMATION = FastPathResult(True, None, "confirmation")
+
+
+class _NoLLM:
+    def invoke(self, *args, **kwargs):
+        raise AssertionError("the LLM must not be called to confirm a draft")
+
+
+@pytest.fixture
+def confirmed(monkeypatch):
+    calls = []
+    monkeypatch.setattr(agent, "_confirm_order", lambda *args: calls.append(args[-1]))
+    monkeypatch.setattr(agent, "single_call_chat", _NoLLM())
+    return calls
+
+
+def test_multi_call_confirms_draft_without_llm(confirmed):
+    llm_calls = agent._run_multi_call(
+        None, None, "r", "s", "Es correcto", None, None, "Ana", "", [], _NoLLM(), CONFIRMATION, DRAFT
+    )
+    assert llm_calls == 0
+    assert confirmed == [DRAFT]
+
+
+def test_single_call_confirms_draft_without_llm(confirmed):
+    llm_calls = agent._run_single_call(
+        None, None, "r", "s", "Es correcto", None, None, "Ana", "", [], CONFIRMATION, DRAFT
+    )
+    assert llm_calls == 0
+    assert confirmed == [DRAFT]
@@ -0,0 +1,149 @@
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from src.ai import jobs
+from src.ai.jobs import AIJobQueue
+from src.ai.scheduler import UnattendedScheduler
+from src.models.ai_job import AIJob
+
+
+class _Stop(BaseException):
+    pass
+
+
+@pytest.fixture
+def scheduler():
+    sched = UnattendedScheduler(min_minutes=0, burst_quiet_seconds=0)
+    # Sin resync: solo lo que se notifica en el test
+    sched._next_resync = datetime.now(timezone.utc) + timedelta(hours=1)
+    return sched
+
+
+def test_media_text_after_dispatch_rearms_the_same_message(scheduler):
+    ts = datetime.now(timezone.utc) - timedelta(seconds=1)
+    scheduler.notify(7, "received", ts)
+    assert scheduler._next() == (7, ts, False)
+
+    scheduler.content_available(7, "received", ts, rearm=True)
+    assert scheduler._next() == (7, ts, True)
+
+
+def test_media_text_before_dispatch_is_not_a_rearm(scheduler):
+    ts = datetime.now(timezone.utc) - timedelta(seconds=1)
+    scheduler.notify(7, "received", ts)
+    scheduler.expect_content(7, "received", ts)
+    scheduler.content_available(7, "received", ts, rearm=True)
+    assert scheduler._next() == (7, ts, False)
+
+
+def test_run_passes_rearm_to_the_handler(scheduler):
+    ts = datetime.now(timezone.utc) - timedelta(seconds=1)
+    scheduler.notify(7, "received", ts)
+    scheduler._next()
+    scheduler.content_available(7, "received", ts, rearm=True)
+    calls = []
+
+    def handler(client_id, message_ts, rearm=False):
+        calls.append((client_id, message_ts, rearm))
+        raise _Stop
+
+    with pytest.raises(_Stop):
+        scheduler.run(handler)
+    assert calls == [(7, ts, True)]
+
+
+class _Session:
+    def __init__(self, rowcount=1):
+        self.executed = []
+        self.rowcount = rowcount
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, stmt, params):
+        self.executed.append((str(stmt), params))
+        return SimpleNamespace(rowcount=self.rowcount, mappings=lambda: SimpleNamespace(all=list))
+
+    def commit(self):
+        pass
+
+
+def test_rearm_reaches_the_upsert(monkeypatch):
+    session = _Session()
+    monkeypatch.setattr(jobs, "postgres_session", lambda: session)
+    queue = AIJobQueue(workers=0)
+    ts = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+    queue.schedule(7, ts, rearm=True)
+
+    sql, params = session.executed[0]
+    assert params["rearm"] is True and params["message_ts"] == ts
+    # Mismo message_ts: solo entra por la rama de rearm
+    assert "EXCLUDED.message_ts = ai_jobs.message_ts" in sql
+    assert queue.stats()["rearmed"] == 1
+
+
+def test_plain_schedule_does_not_rearm(monkeypatch):
+    session = _Session(rowcount=0)
+    monkeypatch.setattr(jobs, "postgres_session", lambda: session)
+    queue = AIJobQueue(workers=0)
+
+    queue.schedule(7, datetime(2026, 1, 1, tzinfo=timezone.utc))
+
+    assert session.executed[0][1]["rearm"] is False
+    assert queue.stats()["scheduled"] == 0
+
+
+def test_complete_requeues_a_job_rearmed_while_running():
+    session = _Session()
+    ts = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    AIJob.complete(session, 7, ts, ts + timedelta(minutes=15), "w1")
+    sql, params = session.executed[0]
+    assert "due_at > :due_at" in sql
+    assert params["due_at"] == ts + timedelta(minutes=15)
+
+
+def test_claim_orders_live_conversations_before_the_backlog():
+    session = _Session()
+    assert AIJob.claim(session, 1, 60, "w1", live_seconds=1020) == []
+    sql, params = session.executed[0]
+    order_by = sql[sql.index("ORDER BY"):sql.index("LIMIT")]
+    assert order_by.index("message_ts") < order_by.index("due_at")
+    assert params["live_seconds"] == 1020
+
+
+def test_live_window_matches_the_llm_lane():
+    from src.ai.scheduler import AI_LIVE_WINDOW_SECONDS, MIN_MINUTES
+
+    assert AIJobQueue(workers=0).live_seconds == MIN_MINUTES * 60 + AI_LIVE_WINDOW_SECONDS
+
+
+@pytest.mark.parametrize("background_ok", [True, False])
+def test_backlog_is_only_claimed_while_the_llm_has_room(monkeypatch, background_ok):
+    monkeypatch.setattr(jobs, "postgres_session", lambda: _Session())
+    claims = []
+
+    def claim(session, limit, lease_seconds, worker, live_seconds, live_only=False):
+        claims.append(live_only)
+        raise _Stop
+
+    monkeypatch.setattr(AIJob, "claim", staticmethod(claim))
+    queue = AIJobQueue(workers=0)
+    queue.background_ok = lambda: background_ok
+
+    with pytest.raises(_Stop):
+        queue._run()
+    assert claims == [not background_ok]
+
+
+def test_live_only_claim_filters_the_backlog():
+    session = _Session()
+    AIJob.claim(session, 1, 60, "w1", live_seconds=1020, live_only=True)
+    sql, params = session.executed[0]
+    assert params["live_only"] is True
+    assert "NOT CAST(:live_only AS BOOLEAN)" in sql
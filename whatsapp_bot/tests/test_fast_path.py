@@ -0,0 +1,82 @@
+import pytest
+
+from src.ai.post import fast_classify
+from src.core.catalog import normalize_code
+
+CATALOG = {normalize_code(code): object() for code in ("A100", "B20")}
+
+
+def _items(result):
+    return {it.code: it.qty for it in result.items.items}
+
+
+def test_plain_order_is_parsed():
+    result = fast_classify("2 A100 y 3 B20", CATALOG)
+    assert result.is_order is True
+    assert _items(result) == {"A100": 2, "B20": 3}
+
+
+def test_relative_clause_is_still_an_order():
+    assert fast_classify("quiero 2 A100 que sean nuevos", CATALOG).is_order is True
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "¿Cuánto cuestan 2 A100?",
+        "Cuanto cuestan 2 A100",
+        "¿Tenéis 20 A100 en stock?",
+        "Tenéis 20 A100 en stock",
+        "¿Cuándo llega el pedido de 3 A100?",
+        "No quiero 2 A100",
+        "El A100 que me llegó tiene 3 defectos",
+        "Precio de 5 A100",
+    ],
+)
+def test_questions_negations_and_inquiries_defer_to_llm(text):
+    result = fast_classify(text, CATALOG)
+    assert result.is_order is None
+    assert result.items is None
+
+
+def test_small_talk_without_codes_is_not_an_order():
+    assert fast_classify("¿Qué tal?", CATALOG).is_order is False
+
+
+def test_removal_verb_removes_from_draft():
+    result = fast_classify("quita el B20", CATALOG, draft={"A100": 2, "B20": 3})
+    assert result.is_order is True
+    assert result.removals == ("B20",)
+
+
+@pytest.mark.parametrize("text", ["¿Cuánto cuesta el B20 sin IVA?", "El B20 sin caja"])
+def test_sin_never_removes_from_draft(text):
+    result = fast_classify(text, CATALOG, draft={"A100": 2, "B20": 3})
+    assert result.is_order is None
+    assert result.removals == ()
+
+
+def test_correction_replaces_quantity_with_draft():
+    result = fast_classify("mejor 4 del A100", CATALOG, draft={"A100": 2})
+    assert result.is_order is True
+    assert _items(result) == {"A100": 4}
+
+
+@pytest.mark.parametrize("text", ["Es correcto", "es correcto, gracias!"])
+def test_confirmation_with_draft_is_decided_without_llm(text):
+    result = fast_classify(text, CATALOG, draft={"A100": 2})
+    assert (result.is_order, result.items, result.reason) == (True, None, "confirmation")
+
+
+@pytest.mark.parametrize(
+    "text, draft",
+    [
+        ("Es correcto", None),
+        ("No es correcto, quería 4", {"A100": 2}),
+        ("¿Es correcto el precio?", {"A100": 2}),
+    ],
+)
+def test_confirmation_without_draft_or_ambiguous_defers_to_llm(text, draft):
+    result = fast_classify(text, CATALOG, draft=draft)
+    assert result.is_order is None
+    assert result.reason == "confirmation"
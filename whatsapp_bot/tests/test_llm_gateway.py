@@ -0,0 +1,48 @@
+import threading
+import time
+
+from src.ai.pipeline import BACKGROUND, LIVE, LLMGateway
+
+
+def test_capacity_counts_running_and_waiting_requests():
+    gateway = LLMGateway(max_parallel=1)
+    assert gateway.has_capacity()
+
+    started, release = threading.Event(), threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+
+    t = threading.Thread(target=gateway.run, args=(slow,), kwargs={"lane": BACKGROUND})
+    t.start()
+    started.wait(5)
+    assert not gateway.has_capacity()
+
+    release.set()
+    t.join(5)
+    assert gateway.has_capacity()
+
+
+def test_live_request_runs_before_waiting_background():
+    gateway = LLMGateway(max_parallel=1)
+    order = []
+    started, release = threading.Event(), threading.Event()
+
+    def first():
+        started.set()
+        release.wait(5)
+
+    threads = [threading.Thread(target=gateway.run, args=(first,), kwargs={"lane": BACKGROUND})]
+    threads[0].start()
+    started.wait(5)
+    for lane, name in ((BACKGROUND, "background"), (LIVE, "live")):
+        t = threading.Thread(target=gateway.run, args=(lambda n=name: order.append(n),), kwargs={"lane": lane})
+        t.start()
+        threads.append(t)
+        while gateway.stats()["lanes"][name]["waiting"] == 0:
+            time.sleep(0.001)
+    release.set()
+    for t in threads:
+        t.join(5)
+    assert order == ["live", "background"]
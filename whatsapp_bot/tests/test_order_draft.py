@@ -0,0 +1,91 @@
+import json
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from src.models.order_draft import OrderDraft
+
+
+def _compile(items):
+    stmt = OrderDraft.upsert_statement(7, items, datetime(2026, 1, 1, tzinfo=timezone.utc))
+    return stmt.compile(dialect=postgresql.dialect())
+
+
+def test_upsert_updates_items_from_excluded_row():
+    sql = str(_compile([["A100", 2]]))
+    assert "ON CONFLICT (client_id) DO UPDATE" in sql
+    assert "items = excluded.items" in sql
+    assert "version = (order_drafts.version + " in sql
+
+
+def test_upsert_parameters_are_json_serializable():
+    items = [["A100", 2], ["B20", 3]]
+    params = _compile(items).construct_params()
+    assert all(not callable(value) for value in params.values())
+    assert params["items"] == items
+    json.dumps(params["items"])
+
+
+class _Session:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+@pytest.fixture
+def store(monkeypatch):
+    from src.ai import drafts
+
+    rows = {}
+    monkeypatch.setattr(drafts, "postgres_session", _Session)
+    monkeypatch.setattr(drafts.OrderDraft, "get", staticmethod(lambda s, cid, for_update=False: rows.get(cid)))
+    monkeypatch.setattr(drafts.OrderDraft, "delete", staticmethod(lambda s, cid: rows.pop(cid, None)))
+    monkeypatch.setattr(drafts.Order, "insert_many", staticmethod(lambda s, lines: len(lines)))
+
+    def upsert(session, cid, items):
+        version = rows[cid].version + 1 if cid in rows else 1
+        rows[cid] = SimpleNamespace(
+            client_id=cid, items=items, version=version, image_hash=None,
+            updated_at=datetime.now(timezone.utc),
+        )
+        return version
+
+    monkeypatch.setattr(drafts.OrderDraft, "upsert", staticmethod(upsert))
+    return drafts.DraftOrderStore(ttl_minutes=60), rows
+
+
+def test_emptied_draft_is_deleted(store):
+    store, rows = store
+    store.save(7, {"A100": 2})
+    assert store.save(7, {}) is None
+    assert 7 not in rows
+    assert store.get(7) is None
+    assert store.confirm(7, 1) is None
+
+
+def test_expired_draft_is_ignored(store):
+    store, rows = store
+    store.save(7, {"A100": 2})
+    rows[7].updated_at -= timedelta(hours=2)
+    store.forget(7)
+    assert store.get(7) is None
+    assert store.confirm(7, 1) is None
+
+
+def test_confirm_returns_current_draft_and_deletes_it(store):
+    store, rows = store
+    store.save(7, {"A100": 2, "B20": 3})
+    confirmed = store.confirm(7, 1)
+    assert confirmed.items == {"A100": 2, "B20": 3}
+    assert confirmed.to_text() == "PEDIDO: \\A100 \\2 \\B20 \\3"
+    assert 7 not in rows
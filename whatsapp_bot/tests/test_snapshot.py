@@ -0,0 +1,58 @@
+from contextlib import contextmanager
+
+import pytest
+
+from src.core import snapshot
+from src.core.snapshot import SnapshotIndex
+
+
+class _Flaky(SnapshotIndex[dict]):
+    def __init__(self, **kw):
+        super().__init__("test_snapshot", self._session, refresh_seconds=3600, **kw)
+        self.down = True
+        self.loads = 0
+
+    @contextmanager
+    def _session(self):
+        yield None
+
+    def _load(self, session, current):
+        self.loads += 1
+        if self.down:
+            raise ConnectionError("erp down")
+        return {"A100": 1}
+
+    def start(self):
+        pass
+
+
+def test_failed_load_is_not_retried_before_retry_seconds(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(snapshot.time, "monotonic", lambda: now[0])
+    index = _Flaky(retry_seconds=30)
+
+    assert index.ensure_loaded() is False
+    assert index.ensure_loaded() is False
+    assert index.loads == 1
+
+    index.down = False
+    now[0] += 29
+    assert index.ensure_loaded() is False
+    assert index.loads == 1
+
+    now[0] += 2
+    assert index.ensure_loaded() is True
+    assert index.state == {"A100": 1}
+    assert index.loads == 2
+
+
+def test_retry_interval_defaults_to_refresh_seconds():
+    assert _Flaky().retry_seconds == 3600
+
+
+def test_subclass_must_implement_load():
+    class _NoLoad(SnapshotIndex[dict]):
+        pass
+
+    with pytest.raises(TypeError):
+        _NoLoad("test_snapshot_abstract", None, refresh_seconds=60)
@@ -0,0 +1,53 @@
+import os
+
+import pytest
+
+from src.media import thumbs
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(thumbs, "THUMB_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(thumbs, "_index", None)
+    monkeypatch.setattr(thumbs, "_index_bytes", 0)
+    monkeypatch.setattr(thumbs, "remote_image_name", lambda code: f"{code}.jpg")
+    monkeypatch.setattr(thumbs, "list_remote_images", lambda **kw: {f"P{i}.jpg": 1 for i in range(200)})
+    monkeypatch.setattr(thumbs, "find_image_file", lambda code: b"raw")
+    monkeypatch.setattr(thumbs, "make_thumbnail", lambda raw: b"x" * 1024)
+    return tmp_path
+
+
+def _disk_bytes(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def test_warm_run_evicts_only_when_over_budget(cache, monkeypatch):
+    monkeypatch.setattr(thumbs, "_max_bytes", lambda: 50 * 1024)
+    scans_before = thumbs._stats["evict_scans"]
+
+    for i in range(200):
+        assert thumbs.get_thumbnail(f"P{i}") == b"x" * 1024
+
+    assert _disk_bytes(cache) <= 50 * 1024
+    assert thumbs._cache_bytes() == _disk_bytes(cache)
+    # Con low-water al 90% cada escaneo libera ~5 entradas, no uno por fallo
+    assert thumbs._stats["evict_scans"] - scans_before <= 200 // 4
+
+
+def test_new_version_replaces_old_one(cache):
+    thumbs._store("P1", 1, b"a" * 10)
+    thumbs._store("P1", 2, b"b" * 20)
+    assert os.listdir(cache) == ["P1.2.jpg"]
+    assert thumbs._cache_bytes() == 20
+
+
+def test_warm_up_evicts_once_at_the_end(cache, monkeypatch):
+    monkeypatch.setattr(thumbs, "_max_bytes", lambda: 50 * 1024)
+    monkeypatch.setattr(thumbs.sftp_pool, "size", 4, raising=False)
+    scans_before = thumbs._stats["evict_scans"]
+
+    summary = thumbs.warm_thumbnail_cache([f"P{i}" for i in range(200)])
+
+    assert summary["available"] == 200
+    assert thumbs._stats["evict_scans"] - scans_before == 1
+    assert _disk_bytes(cache) <= 50 * 1024
@@ -1,10 +1,8 @@
 package grpchandler
 
 import (
-	"bytes"
 	"context"
 	"fmt"
-	"io"
 	"os"
 	"path/filepath"
 	"strings"
@@ -43,105 +41,28 @@ type WhatsAppClient interface {
 	GetStore() WhatsAppStore
 }
 
-type inMemoryFile struct {
-	buf *bytes.Buffer
-	pos int64
-}
-
-func newInMemoryFile() *inMemoryFile {
-	return &inMemoryFile{
-		buf: bytes.NewBuffer(make([]byte, 0, 512*1024)), // buffer inicial
-		pos: 0,
-	}
-}
-
-func (f *inMemoryFile) Write(p []byte) (int, error) {
-	return f.buf.Write(p)
-}
-
-func (f *inMemoryFile) WriteAt(p []byte, off int64) (int, error) {
-	end := int(off) + len(p)
-	current := f.buf.Bytes()
-
-	if len(current) < end {
-		newBuf := make([]byte, end)
-		copy(newBuf, current)
-		copy(newBuf[off:], p)
-		f.buf = bytes.NewBuffer(newBuf)
-	} else {
-		tmp := make([]byte, len(current))
-		copy(tmp, current)
-		copy(tmp[off:], p)
-		f.buf = bytes.NewBuffer(tmp)
-	}
-
-	return len(p), nil
-}
-
-func (f *inMemoryFile) Read(p []byte) (int, error) {
-	r := bytes.NewReader(f.buf.Bytes())
-	r.Seek(f.pos, io.SeekStart)
-	n, err := r.Read(p)
-	f.pos += int64(n)
-	return n, err
-}
-
-func (f *inMemoryFile) ReadAt(p []byte, off int64) (int, error) {
-	return bytes.NewReader(f.buf.Bytes()).ReadAt(p, off)
-}
+// MediaDir is where inbound media is written before clients fetch it with DownloadMedia.
+var MediaDir = "/tmp/media"
 
-func (f *inMemoryFile) Seek(offset int64, whence int) (int64, error) {
-	var abs int64
-	switch whence {
-	case io.SeekStart:
-		abs = offset
-	case io.SeekCurrent:
-		abs = f.pos + offset
-	case io.SeekEnd:
-		abs = int64(f.buf.Len()) + offset
-	default:
-		return 0, fmt.Errorf("invalid whence")
-	}
-	if abs < 0 {
-		return 0, fmt.Errorf("negative position")
-	}
-	f.pos = abs
-	return abs, nil
-}
+// mediaMaxAge is how long downloaded media stays in MediaDir.
+const mediaMaxAge = time.Hour
 
-func (f *inMemoryFile) Truncate(size int64) error {
-	if size < 0 {
-		return fmt.Errorf("invalid size")
+// PruneMedia removes files in dir older than maxAge.
+func PruneMedia(dir string, maxAge time.Duration) {
+	entries, err := os.ReadDir(dir)
+	if err != nil {
+		return
 	}
-	data := f.buf.Bytes()
-	if int64(len(data)) > size {
-		f.buf = bytes.NewBuffer(data[:size])
-	} else if int64(len(data)) < size {
-		padding := make([]byte, size-int64(len(data)))
-		f.buf.Write(padding)
+	cutoff := time.Now().Add(-maxAge)
+	for _, e := range entries {
+		info, err := e.Info()
+		if err != nil || info.IsDir() || info.ModTime().After(cutoff) {
+			continue
+		}
+		_ = os.Remove(filepath.Join(dir, e.Name()))
 	}
-	return nil
-}
-
-func (f *inMemoryFile) Close() error {
-	return nil
-}
-
-func (f *inMemoryFile) Stat() (os.FileInfo, error) {
-	return dummyStat{size: f.buf.Len()}, nil
-}
-
-type dummyStat struct {
-	size int
 }
 
-func (d dummyStat) Name() string       { return "memoryfile" }
-func (d dummyStat) Size() int64        { return int64(d.size) }
-func (d dummyStat) Mode() os.FileMode  { return 0444 }
-func (d dummyStat) ModTime() time.Time { return time.Now() }
-func (d dummyStat) IsDir() bool        { return false }
-func (d dummyStat) Sys() interface{}   { return nil }
-
 // makeGrpcHandler returns a message event handler function for a given WhatsApp client.
 // It handles incoming messages (text or media), performs basic parsing, downloads media, and broadcasts the event.
 func MakeGrpcHandler(
@@ -220,8 +141,9 @@ func MakeGrpcHandler(
 			"to":   to,
 		}).Info("Media message received")
 
-		_ = os.MkdirAll("/tmp/media", 0755)
-		base := fmt.Sprintf("/tmp/media/%s_%s", from, timestamp)
+		_ = os.MkdirAll(MediaDir, 0755)
+		PruneMedia(MediaDir, mediaMaxAge)
+		base := filepath.Join(MediaDir, fmt.Sprintf("%s_%s", from, timestamp))
 
 		type media struct {
 			msg      proto.Message
@@ -281,16 +203,27 @@ func MakeGrpcHandler(
 			"expectedBytes": expectedSize,
 		}).Info("Downloading media")
 
-		f := newInMemoryFile()
+		// Straight to disk: clients fetch it in chunks with DownloadMedia
+		f, err := os.Create(m.filename)
+		if err != nil {
+			logger.WithError(err).Error("Failed to create media file")
+			return
+		}
 		if err := clients[0].DownloadToFile(ctx, dm, f); err != nil {
+			f.Close()
+			_ = os.Remove(m.filename)
 			logger.WithError(err).Error("Failed to download media file")
 			return
 		}
-		data := f.buf.Bytes()
+		var size int64
+		if info, err := f.Stat(); err == nil {
+			size = info.Size()
+		}
+		f.Close()
 
 		logger.WithFields(logrus.Fields{
 			"file":     m.filename,
-			"bytes":    len(data),
+			"bytes":    size,
 			"from":     from,
 			"to":       to,
 			"filename": filepath.Base(m.filename),
@@ -302,8 +235,9 @@ func MakeGrpcHandler(
 			Name:      name,
 			Timestamp: timestamp,
 			Text:      "MEDIA:" + filepath.Base(m.filename),
-			Binary:    data,
 			Filename:  filepath.Base(m.filename),
+			MediaId:   filepath.Base(m.filename),
+			MediaSize: size,
 		})
 	}
 }
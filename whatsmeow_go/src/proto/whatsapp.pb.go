@@ -66,6 +66,8 @@ type MessageEvent struct {
 	Timestamp     string                 `protobuf:"bytes,5,opt,name=timestamp,proto3" json:"timestamp,omitempty"`
 	Binary        []byte                 `protobuf:"bytes,6,opt,name=binary,proto3" json:"binary,omitempty"`
 	Filename      string                 `protobuf:"bytes,7,opt,name=filename,proto3" json:"filename,omitempty"`
+	MediaId       string                 `protobuf:"bytes,8,opt,name=media_id,json=mediaId,proto3" json:"media_id,omitempty"`        // adjunto pendiente de DownloadMedia (binary vacío)
+	MediaSize     int64                  `protobuf:"varint,9,opt,name=media_size,json=mediaSize,proto3" json:"media_size,omitempty"` // tamaño del adjunto en bytes
 	unknownFields protoimpl.UnknownFields
 	sizeCache     protoimpl.SizeCache
 }
@@ -149,6 +151,20 @@ func (x *MessageEvent) GetFilename() string {
 	return ""
 }
 
+func (x *MessageEvent) GetMediaId() string {
+	if x != nil {
+		return x.MediaId
+	}
+	return ""
+}
+
+func (x *MessageEvent) GetMediaSize() int64 {
+	if x != nil {
+		return x.MediaSize
+	}
+	return 0
+}
+
 type QRCodeResponse struct {
 	state         protoimpl.MessageState `protogen:"open.v1"`
 	Code          string                 `protobuf:"bytes,1,opt,name=code,proto3" json:"code,omitempty"`     // QR como string
@@ -513,12 +529,108 @@ func (x *StatusResponse) GetError() string {
 	return ""
 }
 
+type FileChunk struct {
+	state         protoimpl.MessageState `protogen:"open.v1"`
+	Meta          *SendRequest           `protobuf:"bytes,1,opt,name=meta,proto3" json:"meta,omitempty"` // solo en el primer trozo (sin binary)
+	Data          []byte                 `protobuf:"bytes,2,opt,name=data,proto3" json:"data,omitempty"`
+	unknownFields protoimpl.UnknownFields
+	sizeCache     protoimpl.SizeCache
+}
+
+func (x *FileChunk) Reset() {
+	*x = FileChunk{}
+	mi := &file_proto_whatsapp_proto_msgTypes[9]
+	ms := protoimpl.X.MessageStateOf(protoimpl.Pointer(x))
+	ms.StoreMessageInfo(mi)
+}
+
+func (x *FileChunk) String() string {
+	return protoimpl.X.MessageStringOf(x)
+}
+
+func (*FileChunk) ProtoMessage() {}
+
+func (x *FileChunk) ProtoReflect() protoreflect.Message {
+	mi := &file_proto_whatsapp_proto_msgTypes[9]
+	if x != nil {
+		ms := protoimpl.X.MessageStateOf(protoimpl.Pointer(x))
+		if ms.LoadMessageInfo() == nil {
+			ms.StoreMessageInfo(mi)
+		}
+		return ms
+	}
+	return mi.MessageOf(x)
+}
+
+// Deprecated: Use FileChunk.ProtoReflect.Descriptor instead.
+func (*FileChunk) Descriptor() ([]byte, []int) {
+	return file_proto_whatsapp_proto_rawDescGZIP(), []int{9}
+}
+
+func (x *FileChunk) GetMeta() *SendRequest {
+	if x != nil {
+		return x.Meta
+	}
+	return nil
+}
+
+func (x *FileChunk) GetData() []byte {
+	if x != nil {
+		return x.Data
+	}
+	return nil
+}
+
+type MediaRequest struct {
+	state         protoimpl.MessageState `protogen:"open.v1"`
+	MediaId       string                 `protobuf:"bytes,1,opt,name=media_id,json=mediaId,proto3" json:"media_id,omitempty"`
+	unknownFields protoimpl.UnknownFields
+	sizeCache     protoimpl.SizeCache
+}
+
+func (x *MediaRequest) Reset() {
+	*x = MediaRequest{}
+	mi := &file_proto_whatsapp_proto_msgTypes[10]
+	ms := protoimpl.X.MessageStateOf(protoimpl.Pointer(x))
+	ms.StoreMessageInfo(mi)
+}
+
+func (x *MediaRequest) String() string {
+	return protoimpl.X.MessageStringOf(x)
+}
+
+func (*MediaRequest) ProtoMessage() {}
+
+func (x *MediaRequest) ProtoReflect() protoreflect.Message {
+	mi := &file_proto_whatsapp_proto_msgTypes[10]
+	if x != nil {
+		ms := protoimpl.X.MessageStateOf(protoimpl.Pointer(x))
+		if ms.LoadMessageInfo() == nil {
+			ms.StoreMessageInfo(mi)
+		}
+		return ms
+	}
+	return mi.MessageOf(x)
+}
+
+// Deprecated: Use MediaRequest.ProtoReflect.Descriptor instead.
+func (*MediaRequest) Descriptor() ([]byte, []int) {
+	return file_proto_whatsapp_proto_rawDescGZIP(), []int{10}
+}
+
+func (x *MediaRequest) GetMediaId() string {
+	if x != nil {
+		return x.MediaId
+	}
+	return ""
+}
+
 var File_proto_whatsapp_proto protoreflect.FileDescriptor
 
 const file_proto_whatsapp_proto_rawDesc = "" +
 	"\n" +
 	"\x14proto/whatsapp.proto\x12\bwhatsapp\"\a\n" +
-	"\x05Empty\"\xac\x01\n" +
+	"\x05Empty\"\xe6\x01\n" +
 	"\fMessageEvent\x12\x12\n" +
 	"\x04from\x18\x01 \x01(\tR\x04from\x12\x0e\n" +
 	"\x02to\x18\x02 \x01(\tR\x02to\x12\x12\n" +
@@ -526,7 +638,10 @@ const file_proto_whatsapp_proto_rawDesc = "" +
 	"\x04text\x18\x04 \x01(\tR\x04text\x12\x1c\n" +
 	"\ttimestamp\x18\x05 \x01(\tR\ttimestamp\x12\x16\n" +
 	"\x06binary\x18\x06 \x01(\fR\x06binary\x12\x1a\n" +
-	"\bfilename\x18\a \x01(\tR\bfilename\"<\n" +
+	"\bfilename\x18\a \x01(\tR\bfilename\x12\x19\n" +
+	"\bmedia_id\x18\b \x01(\tR\amediaId\x12\x1d\n" +
+	"\n" +
+	"media_size\x18\t \x01(\x03R\tmediaSize\"<\n" +
 	"\x0eQRCodeResponse\x12\x12\n" +
 	"\x04code\x18\x01 \x01(\tR\x04code\x12\x16\n" +
 	"\x06status\x18\x02 \x01(\tR\x06status\"\x80\x01\n" +
@@ -549,7 +664,12 @@ const file_proto_whatsapp_proto_rawDesc = "" +
 	"\x03jid\x18\x01 \x01(\tR\x03jid\"@\n" +
 	"\x0eStatusResponse\x12\x18\n" +
 	"\asuccess\x18\x01 \x01(\bR\asuccess\x12\x14\n" +
-	"\x05error\x18\x02 \x01(\tR\x05error2\xf7\x02\n" +
+	"\x05error\x18\x02 \x01(\tR\x05error\"J\n" +
+	"\tFileChunk\x12)\n" +
+	"\x04meta\x18\x01 \x01(\v2\x15.whatsapp.SendRequestR\x04meta\x12\x12\n" +
+	"\x04data\x18\x02 \x01(\fR\x04data\")\n" +
+	"\fMediaRequest\x12\x19\n" +
+	"\bmedia_id\x18\x01 \x01(\tR\amediaId2\xf2\x03\n" +
 	"\x0fWhatsAppService\x12;\n" +
 	"\x0eStreamMessages\x12\x0f.whatsapp.Empty\x1a\x16.whatsapp.MessageEvent0\x01\x127\n" +
 	"\n" +
@@ -557,7 +677,9 @@ const file_proto_whatsapp_proto_rawDesc = "" +
 	"\vSendMessage\x12\x15.whatsapp.SendRequest\x1a\x16.whatsapp.SendResponse\x124\n" +
 	"\vListDevices\x12\x0f.whatsapp.Empty\x1a\x14.whatsapp.DeviceList\x12<\n" +
 	"\fLogoutDevice\x12\x12.whatsapp.DeviceID\x1a\x18.whatsapp.StatusResponse\x12<\n" +
-	"\fDeleteDevice\x12\x12.whatsapp.DeviceID\x1a\x18.whatsapp.StatusResponseB\tZ\a./protob\x06proto3"
+	"\fDeleteDevice\x12\x12.whatsapp.DeviceID\x1a\x18.whatsapp.StatusResponse\x129\n" +
+	"\bSendFile\x12\x13.whatsapp.FileChunk\x1a\x16.whatsapp.SendResponse(\x01\x12>\n" +
+	"\rDownloadMedia\x12\x16.whatsapp.MediaRequest\x1a\x13.whatsapp.FileChunk0\x01B\tZ\a./protob\x06proto3"
 
 var (
 	file_proto_whatsapp_proto_rawDescOnce sync.Once
@@ -571,7 +693,7 @@ func file_proto_whatsapp_proto_rawDescGZIP() []byte {
 	return file_proto_whatsapp_proto_rawDescData
 }
 
-var file_proto_whatsapp_proto_msgTypes = make([]protoimpl.MessageInfo, 9)
+var file_proto_whatsapp_proto_msgTypes = make([]protoimpl.MessageInfo, 11)
 var file_proto_whatsapp_proto_goTypes = []any{
 	(*Empty)(nil),          // 0: whatsapp.Empty
 	(*MessageEvent)(nil),   // 1: whatsapp.MessageEvent
@@ -582,26 +704,33 @@ var file_proto_whatsapp_proto_goTypes = []any{
 	(*DeviceList)(nil),     // 6: whatsapp.DeviceList
 	(*DeviceID)(nil),       // 7: whatsapp.DeviceID
 	(*StatusResponse)(nil), // 8: whatsapp.StatusResponse
+	(*FileChunk)(nil),      // 9: whatsapp.FileChunk
+	(*MediaRequest)(nil),   // 10: whatsapp.MediaRequest
 }
 var file_proto_whatsapp_proto_depIdxs = []int32{
-	5, // 0: whatsapp.DeviceList.devices:type_name -> whatsapp.DeviceInfo
-	0, // 1: whatsapp.WhatsAppService.StreamMessages:input_type -> whatsapp.Empty
-	0, // 2: whatsapp.WhatsAppService.StartLogin:input_type -> whatsapp.Empty
-	3, // 3: whatsapp.WhatsAppService.SendMessage:input_type -> whatsapp.SendRequest
-	0, // 4: whatsapp.WhatsAppService.ListDevices:input_type -> whatsapp.Empty
-	7, // 5: whatsapp.WhatsAppService.LogoutDevice:input_type -> whatsapp.DeviceID
-	7, // 6: whatsapp.WhatsAppService.DeleteDevice:input_type -> whatsapp.DeviceID
-	1, // 7: whatsapp.WhatsAppService.StreamMessages:output_type -> whatsapp.MessageEvent
-	2, // 8: whatsapp.WhatsAppService.StartLogin:output_type -> whatsapp.QRCodeResponse
-	4, // 9: whatsapp.WhatsAppService.SendMessage:output_type -> whatsapp.SendResponse
-	6, // 10: whatsapp.WhatsAppService.ListDevices:output_type -> whatsapp.DeviceList
-	8, // 11: whatsapp.WhatsAppService.LogoutDevice:output_type -> whatsapp.StatusResponse
-	8, // 12: whatsapp.WhatsAppService.DeleteDevice:output_type -> whatsapp.StatusResponse
-	7, // [7:13] is the sub-list for method output_type
-	1, // [1:7] is the sub-list for method input_type
-	1, // [1:1] is the sub-list for extension type_name
-	1, // [1:1] is the sub-list for extension extendee
-	0, // [0:1] is the sub-list for field type_name
+	5,  // 0: whatsapp.DeviceList.devices:type_name -> whatsapp.DeviceInfo
+	3,  // 1: whatsapp.FileChunk.meta:type_name -> whatsapp.SendRequest
+	0,  // 2: whatsapp.WhatsAppService.StreamMessages:input_type -> whatsapp.Empty
+	0,  // 3: whatsapp.WhatsAppService.StartLogin:input_type -> whatsapp.Empty
+	3,  // 4: whatsapp.WhatsAppService.SendMessage:input_type -> whatsapp.SendRequest
+	0,  // 5: whatsapp.WhatsAppService.ListDevices:input_type -> whatsapp.Empty
+	7,  // 6: whatsapp.WhatsAppService.LogoutDevice:input_type -> whatsapp.DeviceID
+	7,  // 7: whatsapp.WhatsAppService.DeleteDevice:input_type -> whatsapp.DeviceID
+	9,  // 8: whatsapp.WhatsAppService.SendFile:input_type -> whatsapp.FileChunk
+	10, // 9: whatsapp.WhatsAppService.DownloadMedia:input_type -> whatsapp.MediaRequest
+	1,  // 10: whatsapp.WhatsAppService.StreamMessages:output_type -> whatsapp.MessageEvent
+	2,  // 11: whatsapp.WhatsAppService.StartLogin:output_type -> whatsapp.QRCodeResponse
+	4,  // 12: whatsapp.WhatsAppService.SendMessage:output_type -> whatsapp.SendResponse
+	6,  // 13: whatsapp.WhatsAppService.ListDevices:output_type -> whatsapp.DeviceList
+	8,  // 14: whatsapp.WhatsAppService.LogoutDevice:output_type -> whatsapp.StatusResponse
+	8,  // 15: whatsapp.WhatsAppService.DeleteDevice:output_type -> whatsapp.StatusResponse
+	4,  // 16: whatsapp.WhatsAppService.SendFile:output_type -> whatsapp.SendResponse
+	9,  // 17: whatsapp.WhatsAppService.DownloadMedia:output_type -> whatsapp.FileChunk
+	10, // [10:18] is the sub-list for method output_type
+	2,  // [2:10] is the sub-list for method input_type
+	2,  // [2:2] is the sub-list for extension type_name
+	2,  // [2:2] is the sub-list for extension extendee
+	0,  // [0:2] is the sub-list for field type_name
 }
 
 func init() { file_proto_whatsapp_proto_init() }
@@ -615,7 +744,7 @@ func file_proto_whatsapp_proto_init() {
 			GoPackagePath: reflect.TypeOf(x{}).PkgPath(),
 			RawDescriptor: unsafe.Slice(unsafe.StringData(file_proto_whatsapp_proto_rawDesc), len(file_proto_whatsapp_proto_rawDesc)),
 			NumEnums:      0,
-			NumMessages:   9,
+			NumMessages:   11,
 			NumExtensions: 0,
 			NumServices:   1,
 		},
@@ -25,6 +25,8 @@ const (
 	WhatsAppService_ListDevices_FullMethodName    = "/whatsapp.WhatsAppService/ListDevices"
 	WhatsAppService_LogoutDevice_FullMethodName   = "/whatsapp.WhatsAppService/LogoutDevice"
 	WhatsAppService_DeleteDevice_FullMethodName   = "/whatsapp.WhatsAppService/DeleteDevice"
+	WhatsAppService_SendFile_FullMethodName       = "/whatsapp.WhatsAppService/SendFile"
+	WhatsAppService_DownloadMedia_FullMethodName  = "/whatsapp.WhatsAppService/DownloadMedia"
 )
 
 // WhatsAppServiceClient is the client API for WhatsAppService service.
@@ -37,6 +39,10 @@ type WhatsAppServiceClient interface {
 	ListDevices(ctx context.Context, in *Empty, opts ...grpc.CallOption) (*DeviceList, error)
 	LogoutDevice(ctx context.Context, in *DeviceID, opts ...grpc.CallOption) (*StatusResponse, error)
 	DeleteDevice(ctx context.Context, in *DeviceID, opts ...grpc.CallOption) (*StatusResponse, error)
+	// Adjuntos por trozos: el primer FileChunk lleva `meta`, el resto solo `data`
+	SendFile(ctx context.Context, opts ...grpc.CallOption) (grpc.ClientStreamingClient[FileChunk, SendResponse], error)
+	// Descarga por trozos del adjunto de un MessageEvent (media_id)
+	DownloadMedia(ctx context.Context, in *MediaRequest, opts ...grpc.CallOption) (grpc.ServerStreamingClient[FileChunk], error)
 }
 
 type whatsAppServiceClient struct {
@@ -116,6 +122,38 @@ func (c *whatsAppServiceClient) DeleteDevice(ctx context.Context, in *DeviceID,
 	return out, nil
 }
 
+func (c *whatsAppServiceClient) SendFile(ctx context.Context, opts ...grpc.CallOption) (grpc.ClientStreamingClient[FileChunk, SendResponse], error) {
+	cOpts := append([]grpc.CallOption{grpc.StaticMethod()}, opts...)
+	stream, err := c.cc.NewStream(ctx, &WhatsAppService_ServiceDesc.Streams[1], WhatsAppService_SendFile_FullMethodName, cOpts...)
+	if err != nil {
+		return nil, err
+	}
+	x := &grpc.GenericClientStream[FileChunk, SendResponse]{ClientStream: stream}
+	return x, nil
+}
+
+// This type alias is provided for backwards compatibility with existing code that references the prior non-generic stream type by name.
+type WhatsAppService_SendFileClient = grpc.ClientStreamingClient[FileChunk, SendResponse]
+
+func (c *whatsAppServiceClient) DownloadMedia(ctx context.Context, in *MediaRequest, opts ...grpc.CallOption) (grpc.ServerStreamingClient[FileChunk], error) {
+	cOpts := append([]grpc.CallOption{grpc.StaticMethod()}, opts...)
+	stream, err := c.cc.NewStream(ctx, &WhatsAppService_ServiceDesc.Streams[2], WhatsAppService_DownloadMedia_FullMethodName, cOpts...)
+	if err != nil {
+		return nil, err
+	}
+	x := &grpc.GenericClientStream[MediaRequest, FileChunk]{ClientStream: stream}
+	if err := x.ClientStream.SendMsg(in); err != nil {
+		return nil, err
+	}
+	if err := x.ClientStream.CloseSend(); err != nil {
+		return nil, err
+	}
+	return x, nil
+}
+
+// This type alias is provided for backwards compatibility with existing code that references the prior non-generic stream type by name.
+type WhatsAppService_DownloadMediaClient = grpc.ServerStreamingClient[FileChunk]
+
 // WhatsAppServiceServer is the server API for WhatsAppService service.
 // All implementations must embed UnimplementedWhatsAppServiceServer
 // for forward compatibility.
@@ -126,6 +164,10 @@ type WhatsAppServiceServer interface {
 	ListDevices(context.Context, *Empty) (*DeviceList, error)
 	LogoutDevice(context.Context, *DeviceID) (*StatusResponse, error)
 	DeleteDevice(context.Context, *DeviceID) (*StatusResponse, error)
+	// Adjuntos por trozos: el primer FileChunk lleva `meta`, el resto solo `data`
+	SendFile(grpc.ClientStreamingServer[FileChunk, SendResponse]) error
+	// Descarga por trozos del adjunto de un MessageEvent (media_id)
+	DownloadMedia(*MediaRequest, grpc.ServerStreamingServer[FileChunk]) error
 	mustEmbedUnimplementedWhatsAppServiceServer()
 }
 
@@ -154,6 +196,12 @@ func (UnimplementedWhatsAppServiceServer) LogoutDevice(context.Context, *DeviceI
 func (UnimplementedWhatsAppServiceServer) DeleteDevice(context.Context, *DeviceID) (*StatusResponse, error) {
 	return nil, status.Errorf(codes.Unimplemented, "method DeleteDevice not implemented")
 }
+func (UnimplementedWhatsAppServiceServer) SendFile(grpc.ClientStreamingServer[FileChunk, SendResponse]) error {
+	return status.Errorf(codes.Unimplemented, "method SendFile not implemented")
+}
+func (UnimplementedWhatsAppServiceServer) DownloadMedia(*MediaRequest, grpc.ServerStreamingServer[FileChunk]) error {
+	return status.Errorf(codes.Unimplemented, "method DownloadMedia not implemented")
+}
 func (UnimplementedWhatsAppServiceServer) mustEmbedUnimplementedWhatsAppServiceServer() {}
 func (UnimplementedWhatsAppServiceServer) testEmbeddedByValue()                         {}
 
@@ -276,6 +324,24 @@ func _WhatsAppService_DeleteDevice_Handler(srv interface{}, ctx context.Context,
 	return interceptor(ctx, in, info, handler)
 }
 
+func _WhatsAppService_SendFile_Handler(srv interface{}, stream grpc.ServerStream) error {
+	return srv.(WhatsAppServiceServer).SendFile(&grpc.GenericServerStream[FileChunk, SendResponse]{ServerStream: stream})
+}
+
+// This type alias is provided for backwards compatibility with existing code that references the prior non-generic stream type by name.
+type WhatsAppService_SendFileServer = grpc.ClientStreamingServer[FileChunk, SendResponse]
+
+func _WhatsAppService_DownloadMedia_Handler(srv interface{}, stream grpc.ServerStream) error {
+	m := new(MediaRequest)
+	if err := stream.RecvMsg(m); err != nil {
+		return err
+	}
+	return srv.(WhatsAppServiceServer).DownloadMedia(m, &grpc.GenericServerStream[MediaRequest, FileChunk]{ServerStream: stream})
+}
+
+// This type alias is provided for backwards compatibility with existing code that references the prior non-generic stream type by name.
+type WhatsAppService_DownloadMediaServer = grpc.ServerStreamingServer[FileChunk]
+
 // WhatsAppService_ServiceDesc is the grpc.ServiceDesc for WhatsAppService service.
 // It's only intended for direct use with grpc.RegisterService,
 // and not to be introspected or modified (even as a copy)
@@ -310,6 +376,16 @@ var WhatsAppService_ServiceDesc = grpc.ServiceDesc{
 			Handler:       _WhatsAppService_StreamMessages_Handler,
 			ServerStreams: true,
 		},
+		{
+			StreamName:    "SendFile",
+			Handler:       _WhatsAppService_SendFile_Handler,
+			ClientStreams: true,
+		},
+		{
+			StreamName:    "DownloadMedia",
+			Handler:       _WhatsAppService_DownloadMedia_Handler,
+			ServerStreams: true,
+		},
 	},
 	Metadata: "proto/whatsapp.proto",
 }
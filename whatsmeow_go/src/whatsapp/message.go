@@ -2,16 +2,22 @@ package whatsapp
 
 import (
 	"context"
+	"fmt"
+	"io"
 	"mime"
+	"os"
 	"path/filepath"
 	"strings"
 	"time"
 
+	grpchandler "github.com/juliog922/whatsmeow_go/src/grpc_handler"
 	pb "github.com/juliog922/whatsmeow_go/src/proto"
 	"github.com/sirupsen/logrus"
 	"go.mau.fi/whatsmeow"
 	"go.mau.fi/whatsmeow/proto/waE2E"
 	"go.mau.fi/whatsmeow/types"
+	"google.golang.org/grpc/codes"
+	"google.golang.org/grpc/status"
 	"google.golang.org/protobuf/proto"
 )
 
@@ -53,28 +59,73 @@ func (s *WhatsAppServer) BroadcastMessage(msg *pb.MessageEvent) {
 	}
 }
 
-func (s *WhatsAppServer) SendMessage(ctx context.Context, req *pb.SendRequest) (*pb.SendResponse, error) {
+// selectClient returns the device matching fromJid (or the first one), or an error message.
+func (s *WhatsAppServer) selectClient(fromJid string) (*whatsmeow.Client, string) {
 	if len(*s.Clients) == 0 {
 		s.Logger.Warn("No connected devices available to send message")
-		return &pb.SendResponse{Success: false, Error: "No connected devices"}, nil
+		return nil, "No connected devices"
 	}
-
-	var selectedClient *whatsmeow.Client
-	if req.FromJid != "" {
-		for _, c := range *s.Clients {
-			fullJID := c.Store.GetJID().String()
-			phone := strings.SplitN(fullJID, ":", 2)[0]
-			if phone == req.FromJid {
-				selectedClient = c
-				break
-			}
+	if fromJid == "" {
+		return (*s.Clients)[0], ""
+	}
+	for _, c := range *s.Clients {
+		fullJID := c.Store.GetJID().String()
+		phone := strings.SplitN(fullJID, ":", 2)[0]
+		if phone == fromJid {
+			return c, ""
 		}
-		if selectedClient == nil {
-			s.Logger.WithField("from_jid", req.FromJid).Warn("Requested device not found")
-			return &pb.SendResponse{Success: false, Error: "Requested device not found"}, nil
+	}
+	s.Logger.WithField("from_jid", fromJid).Warn("Requested device not found")
+	return nil, "Requested device not found"
+}
+
+func mediaTypeFor(filename string) (whatsmeow.MediaType, string, bool) {
+	ext := strings.ToLower(filepath.Ext(filename))
+	isImage := ext == ".jpg" || ext == ".jpeg" || ext == ".png" || ext == ".webp"
+
+	mimetype := mime.TypeByExtension(ext)
+	if mimetype == "" {
+		mimetype = "application/octet-stream"
+	}
+	if isImage {
+		return whatsmeow.MediaImage, mimetype, true
+	}
+	return whatsmeow.MediaDocument, mimetype, false
+}
+
+func buildMediaMessage(uploaded whatsmeow.UploadResponse, filename, caption, mimetype string, size uint64, isImage bool) *waE2E.Message {
+	if isImage {
+		return &waE2E.Message{
+			ImageMessage: &waE2E.ImageMessage{
+				URL:           proto.String(uploaded.URL),
+				Mimetype:      proto.String(mimetype),
+				MediaKey:      uploaded.MediaKey,
+				FileSHA256:    uploaded.FileSHA256,
+				FileEncSHA256: uploaded.FileEncSHA256,
+				DirectPath:    proto.String(uploaded.DirectPath),
+				FileLength:    proto.Uint64(size),
+				Caption:       proto.String(caption),
+			},
 		}
-	} else {
-		selectedClient = (*s.Clients)[0]
+	}
+	return &waE2E.Message{
+		DocumentMessage: &waE2E.DocumentMessage{
+			URL:           proto.String(uploaded.URL),
+			Mimetype:      proto.String(mimetype),
+			FileName:      proto.String(filename),
+			FileSHA256:    uploaded.FileSHA256,
+			FileLength:    proto.Uint64(size),
+			MediaKey:      uploaded.MediaKey,
+			FileEncSHA256: uploaded.FileEncSHA256,
+			DirectPath:    proto.String(uploaded.DirectPath),
+		},
+	}
+}
+
+func (s *WhatsAppServer) SendMessage(ctx context.Context, req *pb.SendRequest) (*pb.SendResponse, error) {
+	selectedClient, errMsg := s.selectClient(req.FromJid)
+	if selectedClient == nil {
+		return &pb.SendResponse{Success: false, Error: errMsg}, nil
 	}
 
 	s.Logger.WithFields(logrus.Fields{
@@ -87,15 +138,7 @@ func (s *WhatsAppServer) SendMessage(ctx context.Context, req *pb.SendRequest) (
 	var msg *waE2E.Message
 
 	if len(req.Binary) > 0 && req.Filename != "" {
-		ext := strings.ToLower(filepath.Ext(req.Filename))
-		isImage := ext == ".jpg" || ext == ".jpeg" || ext == ".png" || ext == ".webp"
-
-		var mediaType whatsmeow.MediaType
-		if isImage {
-			mediaType = whatsmeow.MediaImage
-		} else {
-			mediaType = whatsmeow.MediaDocument
-		}
+		mediaType, mimetype, isImage := mediaTypeFor(req.Filename)
 
 		uploaded, err := selectedClient.Upload(ctx, req.Binary, mediaType)
 		if err != nil {
@@ -103,38 +146,7 @@ func (s *WhatsAppServer) SendMessage(ctx context.Context, req *pb.SendRequest) (
 			return &pb.SendResponse{Success: false, Error: "Media upload failed: " + err.Error()}, nil
 		}
 
-		mimetype := mime.TypeByExtension(ext)
-		if mimetype == "" {
-			mimetype = "application/octet-stream"
-		}
-
-		if isImage {
-			msg = &waE2E.Message{
-				ImageMessage: &waE2E.ImageMessage{
-					URL:           proto.String(uploaded.URL),
-					Mimetype:      proto.String(mimetype),
-					MediaKey:      uploaded.MediaKey,
-					FileSHA256:    uploaded.FileSHA256,
-					FileEncSHA256: uploaded.FileEncSHA256,
-					DirectPath:    proto.String(uploaded.DirectPath),
-					FileLength:    proto.Uint64(uint64(len(req.Binary))),
-					Caption:       proto.String(req.Text),
-				},
-			}
-		} else {
-			msg = &waE2E.Message{
-				DocumentMessage: &waE2E.DocumentMessage{
-					URL:           proto.String(uploaded.URL),
-					Mimetype:      proto.String(mimetype),
-					FileName:      proto.String(req.Filename),
-					FileSHA256:    uploaded.FileSHA256,
-					FileLength:    proto.Uint64(uint64(len(req.Binary))),
-					MediaKey:      uploaded.MediaKey,
-					FileEncSHA256: uploaded.FileEncSHA256,
-					DirectPath:    proto.String(uploaded.DirectPath),
-				},
-			}
-		}
+		msg = buildMediaMessage(uploaded, req.Filename, req.Text, mimetype, uint64(len(req.Binary)), isImage)
 	} else {
 		msg = &waE2E.Message{
 			Conversation: proto.String(req.Text),
@@ -166,3 +178,133 @@ func (s *WhatsAppServer) SendMessage(ctx context.Context, req *pb.SendRequest) (
 
 	return &pb.SendResponse{Success: true}, nil
 }
+
+// mediaChunkSize is the size of each FileChunk sent by DownloadMedia.
+const mediaChunkSize = 256 * 1024
+
+// SendFile receives a file in chunks (first chunk carries the metadata), spools it to
+// disk and uploads it from there, so the whole file is never held in memory.
+func (s *WhatsAppServer) SendFile(stream pb.WhatsAppService_SendFileServer) error {
+	first, err := stream.Recv()
+	if err != nil {
+		return err
+	}
+	meta := first.GetMeta()
+	if meta == nil || meta.Filename == "" || meta.To == "" {
+		return status.Error(codes.InvalidArgument, "first chunk must carry meta with to and filename")
+	}
+
+	_ = os.MkdirAll(grpchandler.MediaDir, 0755)
+	mediaID := fmt.Sprintf("out_%d_%s", time.Now().UnixNano(), filepath.Base(meta.Filename))
+	path := filepath.Join(grpchandler.MediaDir, mediaID)
+	f, err := os.Create(path)
+	if err != nil {
+		return status.Errorf(codes.Internal, "could not spool file: %v", err)
+	}
+	defer f.Close()
+
+	size, err := f.Write(first.GetData())
+	for err == nil {
+		var chunk *pb.FileChunk
+		chunk, err = stream.Recv()
+		if err == io.EOF {
+			err = nil
+			break
+		}
+		if err != nil {
+			break
+		}
+		var n int
+		n, err = f.Write(chunk.GetData())
+		size += n
+	}
+	if err != nil {
+		_ = os.Remove(path)
+		s.Logger.WithError(err).Error("Failed to receive file chunks")
+		return err
+	}
+
+	selectedClient, errMsg := s.selectClient(meta.FromJid)
+	if selectedClient == nil {
+		_ = os.Remove(path)
+		return stream.SendAndClose(&pb.SendResponse{Success: false, Error: errMsg})
+	}
+
+	s.Logger.WithFields(logrus.Fields{
+		"to":       meta.To,
+		"fromJid":  meta.FromJid,
+		"filename": meta.Filename,
+		"bytes":    size,
+	}).Info("Sending streamed file")
+
+	if _, err := f.Seek(0, io.SeekStart); err != nil {
+		return status.Errorf(codes.Internal, "could not rewind spooled file: %v", err)
+	}
+	ctx := stream.Context()
+	mediaType, mimetype, isImage := mediaTypeFor(meta.Filename)
+	uploaded, err := selectedClient.UploadReader(ctx, f, nil, mediaType)
+	if err != nil {
+		s.Logger.WithError(err).Error("Failed to upload media")
+		return stream.SendAndClose(&pb.SendResponse{Success: false, Error: "Media upload failed: " + err.Error()})
+	}
+
+	jid := types.NewJID(meta.To, types.DefaultUserServer)
+	msg := buildMediaMessage(uploaded, meta.Filename, meta.Text, mimetype, uint64(size), isImage)
+	if _, err := selectedClient.SendMessage(ctx, jid, msg); err != nil {
+		s.Logger.WithError(err).WithField("jid", jid.String()).Error("Failed to send message")
+		return stream.SendAndClose(&pb.SendResponse{Success: false, Error: err.Error()})
+	}
+
+	s.Logger.WithFields(logrus.Fields{
+		"to":      meta.To,
+		"from":    selectedClient.Store.ID.String(),
+		"success": true,
+	}).Info("Message sent successfully")
+
+	// Emit message to connected clients; they fetch the file with DownloadMedia
+	s.BroadcastMessage(&pb.MessageEvent{
+		From:      selectedClient.Store.ID.String(),
+		To:        meta.To,
+		Name:      selectedClient.Store.PushName,
+		Text:      meta.Text,
+		Timestamp: time.Now().Format("2006-01-02 15:04:05"),
+		Filename:  meta.Filename,
+		MediaId:   mediaID,
+		MediaSize: int64(size),
+	})
+
+	return stream.SendAndClose(&pb.SendResponse{Success: true})
+}
+
+// DownloadMedia streams a file from the media directory in fixed-size chunks.
+func (s *WhatsAppServer) DownloadMedia(req *pb.MediaRequest, stream pb.WhatsAppService_DownloadMediaServer) error {
+	name := req.GetMediaId()
+	if name == "" || filepath.Base(name) != name || name == "." || name == ".." {
+		return status.Error(codes.InvalidArgument, "invalid media_id")
+	}
+
+	f, err := os.Open(filepath.Join(grpchandler.MediaDir, name))
+	if os.IsNotExist(err) {
+		return status.Errorf(codes.NotFound, "media %s not found", name)
+	}
+	if err != nil {
+		return status.Errorf(codes.Internal, "could not open media: %v", err)
+	}
+	defer f.Close()
+
+	buf := make([]byte, mediaChunkSize)
+	for {
+		n, err := f.Read(buf)
+		if n > 0 {
+			if sendErr := stream.Send(&pb.FileChunk{Data: buf[:n]}); sendErr != nil {
+				return sendErr
+			}
+		}
+		if err == io.EOF {
+			return nil
+		}
+		if err != nil {
+			return status.Errorf(codes.Internal, "could not read media: %v", err)
+		}
+	}
+}
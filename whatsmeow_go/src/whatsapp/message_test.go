@@ -1,17 +1,23 @@
 package whatsapp_test
 
 import (
+	"bytes"
 	"context"
+	"os"
+	"path/filepath"
 	"sync"
 	"testing"
 	"time"
 
+	grpchandler "github.com/juliog922/whatsmeow_go/src/grpc_handler"
 	pb "github.com/juliog922/whatsmeow_go/src/proto"
 	"github.com/juliog922/whatsmeow_go/src/whatsapp"
 	"github.com/sirupsen/logrus"
 	"github.com/stretchr/testify/assert"
 	"github.com/stretchr/testify/mock"
+	"google.golang.org/grpc/codes"
 	"google.golang.org/grpc/metadata"
+	"google.golang.org/grpc/status"
 	// Reemplaza con el path real donde está tu struct WhatsAppServer
 )
 
@@ -94,3 +100,43 @@ func TestStreamMessages_AddsAndRemovesListener(t *testing.T) {
 	lock.Unlock()
 	assert.False(t, existsAfter, "stream should be removed to listeners")
 }
+
+type chunkStream struct {
+	mockStream
+	chunks [][]byte
+}
+
+func (c *chunkStream) Send(chunk *pb.FileChunk) error {
+	c.chunks = append(c.chunks, append([]byte(nil), chunk.Data...))
+	return nil
+}
+
+func TestDownloadMedia_StreamsFileInChunks(t *testing.T) {
+	dir := t.TempDir()
+	grpchandler.MediaDir = dir
+
+	// 2.5 trozos: dos completos y uno parcial
+	data := bytes.Repeat([]byte("a"), 256*1024*2+1000)
+	assert.NoError(t, os.WriteFile(filepath.Join(dir, "video.mp4"), data, 0644))
+
+	stream := &chunkStream{mockStream: mockStream{ctx: context.Background()}}
+	server := &whatsapp.WhatsAppServer{Logger: logrus.New()}
+
+	err := server.DownloadMedia(&pb.MediaRequest{MediaId: "video.mp4"}, stream)
+	assert.NoError(t, err)
+	assert.Len(t, stream.chunks, 3)
+	assert.Equal(t, data, bytes.Join(stream.chunks, nil))
+}
+
+func TestDownloadMedia_RejectsPathsAndMissingFiles(t *testing.T) {
+	grpchandler.MediaDir = t.TempDir()
+	server := &whatsapp.WhatsAppServer{Logger: logrus.New()}
+	stream := &chunkStream{mockStream: mockStream{ctx: context.Background()}}
+
+	err := server.DownloadMedia(&pb.MediaRequest{MediaId: "../etc/passwd"}, stream)
+	assert.Equal(t, codes.InvalidArgument, status.Code(err))
+
+	err = server.DownloadMedia(&pb.MediaRequest{MediaId: "missing.jpg"}, stream)
+	assert.Equal(t, codes.NotFound, status.Code(err))
+	assert.Empty(t, stream.chunks)
+}